@@ -0,0 +1,67 @@
+"""
+Benchmarks the forward pass of the eager model against the compiled (TorchScript) model.
+Run from the repository root: PYTHONPATH=src python benchmarks/compiled_inference.py
+"""
+
+import argparse
+import random
+import string
+import time
+import numpy as np
+import torch
+from inference.inference import build_model_config, compile_model, load_model, preprocess_names, run_model
+from inference.model import ConvLSTM
+from utils import load_json
+
+
+def generate_names(amount: int) -> list[str]:
+    def generate_word() -> str:
+        return "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 12)))
+
+    return [" ".join(generate_word() for _ in range(random.randint(1, 3))) for _ in range(amount)]
+
+
+def benchmark(model: torch.nn.Module, input_batch: list, repetitions: int) -> float:
+    run_model(model, input_batch)
+
+    durations = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        run_model(model, input_batch)
+        durations.append(time.perf_counter() - start_time)
+
+    return float(np.median(durations))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-config", default="./tests/mock/model_config.json")
+    parser.add_argument("--classes", type=int, default=49)
+    parser.add_argument("--names", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repetitions", type=int, default=10)
+    args = parser.parse_args()
+
+    random.seed(0)
+    torch.manual_seed(0)
+
+    model_config = build_model_config(load_json(args.model_config), [str(idx) for idx in range(args.classes)])
+    checkpoint = ConvLSTM(
+        class_amount=model_config["amount-classes"],
+        embedding_size=model_config["embedding-size"],
+        hidden_size=model_config["hidden-size"],
+        layers=model_config["rnn-layers"],
+        kernel_size=model_config["kernel-size"],
+        cnn_out_dim=model_config["cnn-out-dim"]
+    ).state_dict()
+
+    eager_model = load_model(checkpoint, model_config)
+    compiled_model = compile_model(eager_model)
+    input_batch = preprocess_names(generate_names(args.names), batch_size=args.batch_size, batching_strategy="bucketed")
+
+    eager_duration = benchmark(eager_model, input_batch, args.repetitions)
+    compiled_duration = benchmark(compiled_model, input_batch, args.repetitions)
+
+    print(f"Forward pass over {args.names} names (median of {args.repetitions} runs):")
+    print(f"  eager:    {1000 * eager_duration:.1f} ms")
+    print(f"  compiled: {1000 * compiled_duration:.1f} ms ({eager_duration / compiled_duration:.2f}x)")
@@ -0,0 +1,71 @@
+"""
+Benchmarks serializing a classification response the previous way (pydantic revalidation + jsonify with sorted keys)
+against the serialization layer of the inference routes (orjson, no revalidation).
+Run from the repository root: PYTHONPATH=src python benchmarks/response_serialization.py
+"""
+
+import argparse
+import random
+import string
+import time
+import numpy as np
+import torch
+from flask import Flask, jsonify
+from inference.inference import get_ethnicity_distributions, get_ethnicity_predictions
+from schemas.inference_schema import InferenceDistributionResponseSchema, InferenceResponseSchema
+from utils import json_response
+
+
+def generate_names(amount: int) -> list[str]:
+    def generate_word() -> str:
+        return "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 12)))
+
+    return [" ".join(generate_word() for _ in range(random.randint(1, 3))) for _ in range(amount)]
+
+
+def benchmark(serialize: callable, repetitions: int) -> float:
+    serialize()
+
+    durations = []
+    for _ in range(repetitions):
+        start_time = time.perf_counter()
+        serialize()
+        durations.append(time.perf_counter() - start_time)
+
+    return float(np.median(durations))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--classes", type=int, default=49)
+    parser.add_argument("--names", type=int, default=10000)
+    parser.add_argument("--repetitions", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    classes = [f"nationality_{idx}" for idx in range(args.classes)]
+    names = generate_names(args.names)
+    predictions = torch.log_softmax(torch.randn(args.names, args.classes), dim=1).numpy()
+
+    app = Flask(__name__)
+    with app.app_context():
+        for label, schema, results in [
+            ("classify", InferenceResponseSchema, get_ethnicity_predictions(predictions, classes)),
+            ("classify-distribution", InferenceDistributionResponseSchema, get_ethnicity_distributions(predictions, classes)),
+        ]:
+            response_data = dict(zip(names, results))
+
+            def serialize_previous():
+                schema(**response_data)
+                return jsonify(response_data).get_data()
+
+            def serialize_fast():
+                return json_response(response_data).get_data()
+
+            previous_duration = benchmark(serialize_previous, args.repetitions)
+            fast_duration = benchmark(serialize_fast, args.repetitions)
+
+            print(f"/{label} ({args.names} names, {args.classes} classes):")
+            print(f"  validation + jsonify: {1000 * previous_duration:.1f} ms, {len(serialize_previous()) / 1024:.0f} KiB")
+            print(f"  orjson:               {1000 * fast_duration:.1f} ms, {len(serialize_fast()) / 1024:.0f} KiB")
+            print(f"  speedup:              {previous_duration / fast_duration:.1f}x")
@@ -49,4 +49,25 @@ CREATE TABLE user_quota (
 );
 
 
+CREATE TYPE job_status AS ENUM ('queued', 'running', 'paused', 'completed', 'failed');
+
+CREATE TABLE classification_job (
+    id                  VARCHAR(32)                    NOT NULL CONSTRAINT classification_job_pk PRIMARY KEY,
+    user_id             INTEGER                        NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+    model_id            VARCHAR(40)                    NOT NULL REFERENCES "model"(id) ON DELETE CASCADE,
+    get_distribution    BOOLEAN DEFAULT false          NOT NULL,
+    status              job_status DEFAULT 'queued'    NOT NULL,
+    name_amount         INTEGER                        NOT NULL,
+    chunk_amount        INTEGER                        NOT NULL,
+    completed_chunks    INTEGER DEFAULT 0              NOT NULL,
+    processed_names     INTEGER DEFAULT 0              NOT NULL,
+    error               VARCHAR(500),
+    lease_token         VARCHAR(32),
+    creation_time       TIMESTAMP                      NOT NULL,
+    updated_time        TIMESTAMP                      NOT NULL
+);
+
+CREATE INDEX classification_job_status_idx ON classification_job (status, creation_time);
+
+
 ALTER TABLE model OWNER TO postgres;
@@ -7,7 +7,7 @@ done
 
 echo "Connected to MinIO!"
 
-BUCKETS="models base-data"
+BUCKETS="models base-data jobs"
 
 for BUCKET in $BUCKETS; do
   if ! mc ls minio_instance/$BUCKET > /dev/null 2>&1; then
@@ -0,0 +1,4 @@
+def post_fork(server, worker):
+    # Thread settings of the master don't reliably carry over into forked workers (eg. when preloading models)
+    from inference.inference_utils import configure_torch_threads
+    configure_torch_threads()
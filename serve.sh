@@ -1 +1,16 @@
-gunicorn -w 8 -b 0.0.0.0:8080 src.app:app
\ No newline at end of file
+PRELOAD_FLAG=""
+if [ "$(echo "$PRELOAD_MODELS" | tr '[:upper:]' '[:lower:]')" = "true" ]; then
+    PRELOAD_FLAG="--preload"
+fi
+
+if [ -n "$INFERENCE_SERVER_SOCKET" ]; then
+    # the models are served by a separate pool of inference processes, the web workers only forward the encoded names
+    python -m inference.inference_server --socket "$INFERENCE_SERVER_SOCKET" &
+    INFERENCE_SERVER_PID=$!
+    while [ ! -S "$INFERENCE_SERVER_SOCKET" ]; do
+        kill -0 "$INFERENCE_SERVER_PID" || exit 1
+        sleep 0.5
+    done
+fi
+
+gunicorn -c gunicorn.conf.py -w "${GUNICORN_WORKERS:-8}" --threads "${GUNICORN_THREADS:-1}" $PRELOAD_FLAG -b 0.0.0.0:8080 src.app:app
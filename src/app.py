@@ -15,6 +15,10 @@ from routes.model_routes import model_routes
 from routes.user_routes import user_routes
 from routes.util_routes import util_routes
 from routes.inference_routes import inference_routes
+from routes.job_routes import job_routes
+from services.inference_services import preload_public_models
+from inference.inference_utils import configure_torch_threads, inference_config
+from compression import init_compression
 from globals import VERSION
 
 load_dotenv()
@@ -39,6 +43,19 @@ app.config["USER_VERIFICATION_ACTIVE"] = os.environ.get("USER_VERIFICATION_ACTIV
 app.config["MAX_NAMES"] = os.environ.get("MAX_NAMES", default=10e4)
 app.config["BATCH_SIZE"] = os.environ.get("BATCH_SIZE", default=64)
 app.config["DAILY_QUOTA"] = os.environ.get("DAILY_QUOTA", default=10e4)
+app.config["PRELOAD_MODELS"] = os.environ.get("PRELOAD_MODELS", default="False").lower() == "true"
+app.config["VALIDATE_RESPONSES"] = os.environ.get("VALIDATE_RESPONSES", default="False").lower() == "true"
+app.config["RESPONSE_COMPRESSION"] = os.environ.get("RESPONSE_COMPRESSION", default="True").lower() == "true"
+app.config["COMPRESSION_MIN_BYTES"] = os.environ.get("COMPRESSION_MIN_BYTES", default=1024)
+app.config["GZIP_LEVEL"] = os.environ.get("GZIP_LEVEL", default=6)
+app.config["BROTLI_QUALITY"] = os.environ.get("BROTLI_QUALITY", default=5)
+app.config["DECOMPRESSED_REQUEST_PATHS"] = os.environ.get("DECOMPRESSED_REQUEST_PATHS", default="/classify,/jobs").split(",")
+app.config["MAX_DECOMPRESSED_REQUEST_BYTES"] = os.environ.get("MAX_DECOMPRESSED_REQUEST_BYTES", default=64 * 1024 ** 2)
+app.config["MAX_JOB_NAMES"] = os.environ.get("MAX_JOB_NAMES", default=5e6)
+app.config["JOB_CHUNK_SIZE"] = os.environ.get("JOB_CHUNK_SIZE", default=10e3)
+app.config["JOB_LEASE_SECONDS"] = os.environ.get("JOB_LEASE_SECONDS", default=600)
+app.config["JOB_RETENTION_HOURS"] = os.environ.get("JOB_RETENTION_HOURS", default=168)
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.environ.get("MAX_REQUEST_MB", default=256)) * 1024 ** 2)
 
 
 with open("./api-config.json", "r") as f:
@@ -48,6 +65,7 @@ openapi_generator = og.OpenAPIGenerator(app, openapi_base_config)
 CORS(app)
 JWTManager(app)
 db.init_app(app)
+init_compression(app)
 
 metrics = PrometheusMetrics(app)
 metrics.info("app_info", "N2E Application Info", version=VERSION)
@@ -64,9 +82,17 @@ app.logger.setLevel(logging.INFO)
 app.register_blueprint(user_routes)
 app.register_blueprint(model_routes)
 app.register_blueprint(inference_routes)
+app.register_blueprint(job_routes)
 app.register_blueprint(util_routes)
 
 openapi_generator.generate()
 
+configure_torch_threads()
+
+# with an inference server the models are preloaded there instead of in the web workers
+if app.config["PRELOAD_MODELS"] and not inference_config.inference_server_socket:
+    with app.app_context():
+        preload_public_models()
+
 if __name__ == "__main__":
     app.run()
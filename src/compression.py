@@ -0,0 +1,170 @@
+import gzip
+import io
+import json
+import zlib
+from typing import Iterable, Iterator
+import brotli
+from flask import Flask, Response, current_app, request
+from werkzeug.wsgi import get_input_stream
+
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json", "application/x-ndjson", "application/yaml", "text/csv", "text/html", "text/plain", "text/yaml"
+}
+
+
+def init_compression(app: Flask):
+    """
+    Enables the response compression (negotiated via 'Accept-Encoding') and the decompression of gzip-compressed
+    request bodies on the paths configured in 'DECOMPRESSED_REQUEST_PATHS'.
+    :param app: The Flask app
+    """
+
+    if app.config["RESPONSE_COMPRESSION"]:
+        app.after_request(compress_response)
+
+    app.wsgi_app = RequestDecompressionMiddleware(
+        app.wsgi_app,
+        path_prefixes=tuple(app.config["DECOMPRESSED_REQUEST_PATHS"]),
+        max_bytes=int(app.config["MAX_DECOMPRESSED_REQUEST_BYTES"])
+    )
+
+
+def get_response_encoding() -> str | None:
+    """
+    Picks the response encoding preferred by the client.
+    :return: "br", "gzip" or None for no compression
+    """
+
+    return request.accept_encodings.best_match(["br", "gzip"])
+
+
+def compress_response(response: Response) -> Response:
+    """
+    Compresses responses with a compressible mimetype. Buffered responses are only compressed above 'COMPRESSION_MIN_BYTES',
+    streamed responses are compressed chunk by chunk, flushing after every chunk so clients still receive them immediately.
+    :param response: The response to compress
+    :return: The (compressed) response
+    """
+
+    if (
+        response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = get_response_encoding()
+    if encoding is None:
+        return response
+
+    level = int(current_app.config["BROTLI_QUALITY"] if encoding == "br" else current_app.config["GZIP_LEVEL"])
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < int(current_app.config["COMPRESSION_MIN_BYTES"]):
+            return response
+        response.set_data(compress(data, encoding, level))
+
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """
+    Compresses data at once.
+    :param data: The data to compress
+    :param encoding: "br" or "gzip"
+    :param level: Brotli quality or gzip compression level
+    :return: The compressed data
+    """
+
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level)
+
+
+def compress_stream(chunks: Iterable[bytes | str], encoding: str, level: int) -> Iterator[bytes]:
+    """
+    Compresses a streamed response body chunk by chunk.
+    :param chunks: The chunks of the response body
+    :param encoding: "br" or "gzip"
+    :param level: Brotli quality or gzip compression level
+    :return: Iterator over the compressed chunks
+    """
+
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        compress_chunk, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        # wbits=31 writes the gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        compress_chunk, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    for chunk in chunks:
+        yield compress_chunk(chunk.encode() if isinstance(chunk, str) else chunk) + flush()
+    yield finish()
+
+
+class RequestDecompressionMiddleware:
+    """
+    WSGI middleware which transparently decompresses gzip-compressed request bodies ('Content-Encoding: gzip'),
+    so that 'request.json' and 'request.files' work as usual. The decompressed size is limited to guard against
+    decompression bombs.
+    """
+
+    def __init__(self, wsgi_app, path_prefixes: tuple[str, ...], max_bytes: int):
+        self.wsgi_app = wsgi_app
+        self.path_prefixes = path_prefixes
+        self.max_bytes = max_bytes
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding in ("", "identity") or not environ.get("PATH_INFO", "").startswith(self.path_prefixes):
+            return self.wsgi_app(environ, start_response)
+
+        if encoding != "gzip":
+            return self.error(environ, start_response, "UNSUPPORTED_CONTENT_ENCODING", f"Content encoding '{encoding}' is not supported.", 415)
+
+        try:
+            data = self.decompress(get_input_stream(environ))
+        except zlib.error:
+            return self.error(environ, start_response, "INVALID_CONTENT_ENCODING", "Request body is not valid gzip.", 400)
+        if data is None:
+            return self.error(environ, start_response, "REQUEST_TOO_LARGE", f"Decompressed request body exceeds {self.max_bytes} bytes.", 413)
+
+        environ["wsgi.input"] = io.BytesIO(data)
+        environ["CONTENT_LENGTH"] = str(len(data))
+        environ.pop("HTTP_CONTENT_ENCODING")
+        return self.wsgi_app(environ, start_response)
+
+    def decompress(self, stream) -> bytearray | None:
+        """
+        Decompresses a gzip stream piece by piece.
+        :param stream: The compressed request body
+        :return: The decompressed data or None if it exceeds 'max_bytes'
+        """
+
+        decompressor = zlib.decompressobj(31)
+        data = bytearray()
+
+        while piece := stream.read(64 * 1024):
+            data += decompressor.decompress(piece, self.max_bytes + 1 - len(data))
+            if len(data) > self.max_bytes or decompressor.unconsumed_tail:
+                return None
+
+        data += decompressor.flush()
+        if len(data) > self.max_bytes:
+            return None
+        if not decompressor.eof:
+            raise zlib.error("Incomplete gzip stream.")
+
+        return data
+
+    @staticmethod
+    def error(environ, start_response, error_code: str, message: str, status_code: int):
+        response = Response(json.dumps({"errorCode": error_code, "message": message}), status=status_code, mimetype="application/json")
+        return response(environ, start_response)
+
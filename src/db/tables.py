@@ -110,3 +110,45 @@ class UserQuota(db.Model):
             "last_updated": self.last_updated,
             "name_count": self.name_count
         }
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    PAUSED = "paused"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class ClassificationJob(db.Model):
+    __tablename__ = "classification_job"
+
+    id = db.Column(db.String(32), primary_key=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    model_id = db.Column(db.String(40), db.ForeignKey("model.id", ondelete="CASCADE"), nullable=False)
+    get_distribution = db.Column(db.Boolean, default=False, nullable=False)
+    status = db.Column(ENUM(*[s.value for s in JobStatus], name="job_status"), default=JobStatus.QUEUED.value, nullable=False)
+    name_amount = db.Column(db.Integer, nullable=False)
+    chunk_amount = db.Column(db.Integer, nullable=False)
+    completed_chunks = db.Column(db.Integer, default=0, nullable=False)
+    processed_names = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.String(500), nullable=True)
+    lease_token = db.Column(db.String(32), nullable=True)
+    creation_time = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    updated_time = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "model_id": self.model_id,
+            "get_distribution": self.get_distribution,
+            "status": self.status,
+            "name_amount": self.name_amount,
+            "chunk_amount": self.chunk_amount,
+            "completed_chunks": self.completed_chunks,
+            "processed_names": self.processed_names,
+            "error": self.error,
+            "creation_time": self.creation_time,
+            "updated_time": self.updated_time
+        }
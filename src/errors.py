@@ -3,6 +3,7 @@ import traceback
 from flask import current_app
 from pydantic import ValidationError
 from sqlalchemy.exc import SQLAlchemyError 
+from werkzeug.exceptions import RequestEntityTooLarge
 from utils import error_response
 
 class GeneralError(Exception):
@@ -23,6 +24,9 @@ def error_handler(func: callable):
         except GeneralError as e:
             current_app.logger.error(f"Custom error: {e.message}")
             return error_response(e.error_code, e.message, e.status_code)
+        except RequestEntityTooLarge as e:
+            current_app.logger.error(f"Request too large: {e}")
+            return error_response("REQUEST_TOO_LARGE", f"Request body exceeds {current_app.config['MAX_CONTENT_LENGTH']} bytes.", 413)
         except SQLAlchemyError as e:
             current_app.logger.error(f"Database error: {e}")
             return error_response("UNEXPECTED_ERROR", "An unexpected error occurred.", 500)
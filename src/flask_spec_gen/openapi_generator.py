@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 import json
 import os
+import re
 import yaml
 from flask import Flask, jsonify, render_template_string, send_from_directory
 from pydantic import BaseModel
@@ -103,6 +104,14 @@ class OpenAPIGenerator:
             ]
         }
 
+        # Flask path variables (eg. '/jobs/<job_id>') become OpenAPI path parameters (eg. '/jobs/{job_id}')
+        path_parameters = re.findall(r"<(?:[^<>:]+:)?([^<>]+)>", rule)
+        if path_parameters:
+            route_spec["parameters"] = [
+                {"name": parameter, "in": "path", "required": True, "schema": {"type": "string"}} for parameter in path_parameters
+            ]
+            rule = re.sub(r"<(?:[^<>:]+:)?([^<>]+)>", r"{\1}", rule)
+
         if view_func._request_models:
             route_spec["requestBody"] = {
                 "content": {}
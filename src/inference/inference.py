@@ -1,14 +1,25 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
 import torch
-from torch.nn.utils.rnn import pad_sequence
+import torch.nn as nn
 import numpy as np
 import string
 import unicodedata
 import re
 from dotenv import load_dotenv
 from inference.model import ConvLSTM as Model
-from inference.inference_utils import device, get_model_checkpoint, load_model_config
+from inference.inference_utils import (
+    device, evict_files, get_compiled_model_path, get_model_checkpoint, get_model_etag, inference_config, inference_client,
+    load_model_config, micro_batcher, model_cache, prediction_cache, touch_file
+)
+from monitoring import deduplicated_names_counter, model_preload_errors_counter, padding_waste_histogram, requested_names_counter
+from utils import atomic_write, load_json
 
 
+logger = logging.getLogger(__name__)
+
 
 def replace_special_chars(name: str) -> str:
     """
@@ -24,50 +35,106 @@ def replace_special_chars(name: str) -> str:
     return name
 
 
-def preprocess_names(names: list=[str], batch_size: int=128) -> torch.tensor:
+# Lookup table from ASCII codes to the model alphabet, ie. "a"/"A" -> 1, ..., "z"/"Z" -> 26, " " -> 27, "-" -> 28
+ALPHABET = string.ascii_lowercase + " -"
+CHAR_TO_INDEX = np.zeros(128, dtype=np.int64)
+CHAR_TO_INDEX[np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)] = np.arange(1, len(ALPHABET) + 1)
+CHAR_TO_INDEX[np.frombuffer(string.ascii_uppercase.encode("ascii"), dtype=np.uint8)] = np.arange(1, len(string.ascii_uppercase) + 1)
+
+
+def normalize_names(names: list[str]) -> list[str]:
     """
-    Creates a pytorch-usable input-batch from a list of string-names
-    :param list names: list of names (strings)
-    :param int batch_size: batch-size for the forward pass
-    :return torch.tensor: preprocessed names (to tensors, padded, encoded)
+    Normalizes names to the lower case latin characters, spaces and hyphens the model alphabet consists of
+    :param names: list of names (strings)
+    :return: list of normalized names
+    """
+
+    return [replace_special_chars(name).lower() for name in names]
+
+
+def deduplicate_names(names: list[str]) -> tuple[list[str], np.ndarray]:
+    """
+    Removes duplicate names while keeping track of where each name occurred, ie: ["a", "b", "a"] -> (["a", "b"], [0, 1, 0])
+    :param names: list of names (strings)
+    :return: Tuple of (unique names in order of their first occurrence, index of the unique name for every name)
+    """
+
+    unique_positions = {}
+    inverse = np.fromiter((unique_positions.setdefault(name, len(unique_positions)) for name in names), dtype=np.int64, count=len(names))
+
+    return list(unique_positions), inverse
+
+
+def encode_names(names: list[str]) -> tuple[np.ndarray, np.ndarray]:
     """
+    Encodes a list of normalized names into one zero-padded index matrix, ie: ["joe", "al"] -> [[10, 15, 5], [1, 12, 0]]
+    :param names: list of normalized names (strings)
+    :return: Tuple of (padded index matrix of shape [names, longest name], length of each name)
+    """
+
+    lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+    char_indices = CHAR_TO_INDEX[np.frombuffer("".join(names).encode("ascii"), dtype=np.uint8)]
 
-    sample_batch = []
-    for name in names:
-        # normalize name to only latin characters
-        name = replace_special_chars(name)
+    # Fill the characters of all names row by row into the padded matrix at once
+    encoded_names = np.zeros((len(names), lengths.max(initial=0)), dtype=np.int64)
+    encoded_names[np.arange(encoded_names.shape[1]) < lengths[:, None]] = char_indices
 
-        # create index-representation from string name, ie: "joe" -> [10, 15, 5], indices go from 1 ("a") to 28 ("-")
-        alphabet = list(string.ascii_lowercase.strip()) + [" ", "-"]
-        int_name = []
-        for char in name:
-            int_name.append(alphabet.index(char.lower()) + 1)
-        
-        name = torch.tensor(int_name)
-        sample_batch.append(name)
+    return encoded_names, lengths
 
-    padded_batch = pad_sequence(sample_batch, batch_first=True)
 
-    padded_to = list(padded_batch.size())[1]
-    padded_batch = padded_batch.reshape(len(sample_batch), padded_to, 1).to(device=device)
+def create_batches(encoded_names: np.ndarray, lengths: np.ndarray, batch_size: int=128, batching_strategy: str="padded") -> list[tuple[torch.tensor, torch.tensor, np.ndarray]]:
+    """
+    Splits encoded names into pytorch-usable input-batches
+    :param encoded_names: padded index matrix of the names
+    :param lengths: length of each name
+    :param int batch_size: batch-size for the forward pass
+    :param batching_strategy: "padded" to pad all names to the longest name of the request,
+        "bucketed" to batch names of similar length and pad every batch only to its own longest name
+    :return: List of (preprocessed batch (encoded, padded), name lengths, positions of the names in the request) tuples
+    """
 
-    if padded_batch.shape[0] == 1 or batch_size == padded_batch.shape[0]:
-        padded_batch = padded_batch.unsqueeze(0)
+    if batching_strategy == "bucketed":
+        order = np.argsort(lengths, kind="stable")
+    elif batching_strategy == "padded":
+        order = np.arange(len(lengths))
     else:
-        padded_batch = torch.split(padded_batch, batch_size)
+        raise ValueError(f"Unknown batching strategy '{batching_strategy}'.")
+
+    input_batch = []
+    padded_cells = 0
+    for indices in np.split(order, range(batch_size, len(lengths), batch_size)):
+        padded_to = lengths[indices].max(initial=0) if batching_strategy == "bucketed" else encoded_names.shape[1]
+        batch = torch.from_numpy(encoded_names[indices, :padded_to]).unsqueeze(2).to(device=device)
 
-    return padded_batch
+        input_batch.append((batch, torch.from_numpy(lengths[indices]), indices))
+        padded_cells += len(indices) * padded_to
 
+    if padded_cells > 0:
+        padding_waste_histogram.labels(batching_strategy).observe(1 - lengths.sum() / padded_cells)
 
-def classify_names(model_checkpoint: dict, input_batch: torch.tensor, model_config: dict, classes: dict, get_distribution: bool=False) -> str:
-    """ Load model and predict preprocessed name
+    return input_batch
 
+
+def preprocess_names(names: list=[str], batch_size: int=128, batching_strategy: str="padded") -> list[tuple[torch.tensor, torch.tensor, np.ndarray]]:
+    """
+    Creates pytorch-usable input-batches from a list of string-names
+    :param list names: list of names (strings)
+    :param int batch_size: batch-size for the forward pass
+    :param batching_strategy: "padded" or "bucketed", see 'create_batches'
+    :return: List of (preprocessed batch (encoded, padded), name lengths, positions of the names in the request) tuples
+    """
+
+    encoded_names, lengths = encode_names(normalize_names(names))
+    return create_batches(encoded_names, lengths, batch_size, batching_strategy)
+
+
+def load_model(model_checkpoint: dict, model_config: dict, quantize: bool=False) -> Model:
+    """
+    Builds a model from its checkpoint, ready to run inference
     :param model_checkpoint: Trained model checkpoint
-    :param torch.tensor input_batch: input-batch
-    :param str model_path: path to saved model-paramters
-    :param dict classes: a dictionary containing all countries with their class-number
-    :param get_distribution: Wether to return the entire distribution of the predicted nationalities
-    :return str: predicted ethnicities
+    :param model_config: Model hyperparameters (incl. amount of classes)
+    :param quantize: Wether to serve a dynamically int8-quantized copy of the model (see 'quantize_model')
+    :return: Model in evaluation mode
     """
 
     model = Model(
@@ -79,23 +146,176 @@ def classify_names(model_checkpoint: dict, input_batch: torch.tensor, model_conf
         cnn_out_dim=model_config["cnn-out-dim"]
     ).to(device=device)
 
-    model.load_state_dict(model_checkpoint)
+    # assigning keeps the (memory-mapped) checkpoint tensors as parameters instead of copying them
+    model.load_state_dict(model_checkpoint, assign=device.type == "cpu")
     model = model.eval()
 
-    total_predicted_ethncitities = []
-    for batch in input_batch:
-        predictions = model(batch.float()).cpu().detach().numpy()
+    if quantize:
+        return quantize_model(model)
+    return model
 
-        # get entire ethnicity confidence distribution for each name
-        if get_distribution:
-            prediction_result = get_ethnicity_distributions(predictions, classes=classes)
-        # get the ethnicity with the highest confidence for each name
-        else:
-            prediction_result = get_ethnicity_predictions(predictions, classes=classes)
 
-        total_predicted_ethncitities.extend(prediction_result)
+def quantize_model(model: Model) -> Model:
+    """
+    Creates a copy of a model with dynamically int8-quantized LSTM and linear layers. The copy is only used if it agrees
+    with the original model on a set of sample names, otherwise the original (fp32) model is returned.
+    :param model: Model in evaluation mode
+    :return: Quantized model, or the original model if the quantized one is not accurate enough or can't run on the device
+    """
+
+    if device.type != "cpu":
+        return model
+
+    quantized_model = torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+    agreement, max_probability_delta = compare_models(model, quantized_model, load_json("./src/static/sample-names.json"))
+    if agreement < inference_config.quantization_min_agreement or max_probability_delta > inference_config.quantization_max_probability_delta:
+        logger.warning(
+            f"Refusing to serve quantized model (top-1 agreement: {agreement:.3f}, max. probability delta: {max_probability_delta:.3f}), "
+            "falling back to the fp32 model."
+        )
+        return model
+
+    return quantized_model
+
+
+def compare_models(reference_model: Model, model: Model, names: list[str]) -> tuple[float, float]:
+    """
+    Compares the predictions of a model to the ones of a reference model.
+    :param reference_model: The model to compare against
+    :param model: The model to compare
+    :param names: Sample names to classify with both models
+    :return: Tuple of (share of names with the same top-1 prediction, maximum absolute difference of any class probability)
+    """
+
+    input_batch = preprocess_names(names, batch_size=len(names))
+    reference_predictions = np.exp(run_model(reference_model, input_batch))
+    predictions = np.exp(run_model(model, input_batch))
+
+    agreement = np.mean(reference_predictions.argmax(axis=1) == predictions.argmax(axis=1))
+    max_probability_delta = np.abs(reference_predictions - predictions).max()
+
+    return float(agreement), float(max_probability_delta)
+
+
+def compile_model(model: Model, artifact_path: str = None) -> torch.jit.ScriptModule:
+    """
+    Compiles a model into a frozen TorchScript module, which runs the forward pass without the Python interpreter
+    :param model: Model in evaluation mode
+    :param artifact_path: Where to save the compiled module for later processes, not saved if None
+    :return: Compiled model
+    """
+
+    compiled_model = torch.jit.freeze(torch.jit.script(model))
+
+    if artifact_path:
+        os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+        with atomic_write(artifact_path) as file:
+            torch.jit.save(compiled_model, file)
+        evict_files(os.path.dirname(artifact_path), int(inference_config.compiled_model_max_mb * 1024 ** 2), keep_path=artifact_path)
+
+    return compiled_model
+
+
+def get_model(model_id: str, model_config: dict) -> Model:
+    """
+    Returns the inference-ready model from the process-wide model cache, loading it from S3 if necessary
+    :param model_id: The ID of the model
+    :param model_config: Model hyperparameters (incl. amount of classes)
+    :return: Model in evaluation mode
+    """
+
+    quantize = inference_config.quantized_inference or model_id in inference_config.quantized_model_ids
+
+    def load(etag: str | None) -> Model:
+        if not inference_config.torchscript_inference:
+            return load_model(get_model_checkpoint(model_id, etag), model_config, quantize=quantize)
+
+        # compiled models are cached on disk by the checkpoints ETag, so restarted workers don't need to fetch and compile again
+        artifact_path = get_compiled_model_path(model_id, etag, model_config, quantize) if etag else None
+        if artifact_path and touch_file(artifact_path):
+            return torch.jit.load(artifact_path, map_location=device)
+
+        return compile_model(load_model(get_model_checkpoint(model_id, etag), model_config, quantize=quantize), artifact_path)
+
+    return model_cache.get(model_id, load_model=load, get_etag=lambda: get_model_etag(model_id))
+
+
+def run_model(model: Model, input_batch: list[tuple[torch.tensor, torch.tensor, np.ndarray]], length_aware: bool=True) -> np.ndarray:
+    """
+    Runs the forward pass over all input-batches
+    :param model: Inference-ready model
+    :param input_batch: input-batches along with the lengths and the positions of their names in the request
+    :param length_aware: Wether to read the output of every name at its last character instead of the last padded step
+    :return: Output log-probabilities of shape [names, classes] in the order of the request
+    """
+
+    with torch.inference_mode():
+        outputs = np.concatenate([
+            model(batch, lengths if length_aware else None).cpu().numpy()
+            for batch, lengths, _ in input_batch
+        ])
+
+    # scatter the predictions back into the order of the request
+    predictions = np.empty_like(outputs)
+    predictions[np.concatenate([indices for _, _, indices in input_batch])] = outputs
+
+    return predictions
+
+
+def classify_names(model: Model, input_batch: list[tuple[torch.tensor, torch.tensor, np.ndarray]], classes: dict, get_distribution: bool=False, length_aware: bool=True) -> str:
+    """ Predict preprocessed names
+
+    :param model: Inference-ready model
+    :param input_batch: input-batches along with the lengths and the positions of their names in the request
+    :param dict classes: a dictionary containing all countries with their class-number
+    :param get_distribution: Wether to return the entire distribution of the predicted nationalities
+    :param length_aware: Wether to read the output of every name at its last character instead of the last padded step
+    :return str: predicted ethnicities
+    """
+
+    predictions = run_model(model, input_batch, length_aware)
+    return get_ethnicity_results(predictions, classes, get_distribution)
+
+
+def get_ethnicity_results(predictions: np.array, classes: list, get_distribution: bool=False, top_k: int=None, min_confidence: float=None, columnar: bool=False) -> list | dict:
+    """
+    Turns the output predictions of the model into the ethnicity results of each name.
+    :param predictions: The output predictions of the model
+    :param classes: A list containing all the classes which a model can classify
+    :param get_distribution: Wether to return the entire distribution of the predicted nationalities
+    :param top_k: Only return the 'top_k' most likely ethnicities of the distribution
+    :param min_confidence: Only return the ethnicities of the distribution with at least this confidence
+    :param columnar: Wether to return the results as columns (see 'get_columnar_results') instead of one result per name
+    :return: A list containing the result for each name
+    """
+
+    if columnar:
+        return get_columnar_results(predictions, classes=classes, get_distribution=get_distribution, top_k=top_k, min_confidence=min_confidence)
+    # get entire ethnicity confidence distribution for each name
+    if get_distribution:
+        return get_ethnicity_distributions(predictions, classes=classes, top_k=top_k, min_confidence=min_confidence)
+    # get the ethnicity with the highest confidence for each name
+    return get_ethnicity_predictions(predictions, classes=classes)
+
+
+def to_confidences(predictions: np.array) -> np.ndarray:
+    """
+    Converts output log-probabilities into percentages rounded to three decimals, ie. log(0.912345) -> 91.235
+    :param predictions: The output predictions of the model
+    :return: The confidences as float64 array of the same shape
+    """
+
+    confidences = 100 * np.exp(predictions).astype(np.float64)
+    rounded_confidences = np.round(confidences, 3)
+
+    # numpy rounds the scaled value, which can end up on the other side of a tie than python's 'round' (which rounds
+    # the exact value), so the few values close to a tie are rounded by python to keep the results identical
+    scaled_confidences = confidences * 1000
+    close_to_tie = np.abs(scaled_confidences - np.floor(scaled_confidences) - 0.5) < 1e-6
+    rounded_confidences[close_to_tie] = [round(confidence, 3) for confidence in confidences[close_to_tie].tolist()]
 
-    return total_predicted_ethncitities
+    return rounded_confidences
 
 
 def get_ethnicity_predictions(predictions: np.array, classes: list) -> list[str]:
@@ -109,40 +329,229 @@ def get_ethnicity_predictions(predictions: np.array, classes: list) -> list[str]
     :return: A list containing the predicted ethnicity and confidence score for each name
     """
 
-    predicted_ethnicites = []
-    for prediction in predictions:
-        prediction_idx = list(prediction).index(max(prediction))
-        ethnicity = classes[prediction_idx]
-        predicted_ethnicites.append((ethnicity, round(100 * float(np.exp(max(prediction))), 3)))
+    prediction_indices, confidences = select_top_class(predictions)
 
-    return predicted_ethnicites
+    return [(classes[idx], confidence) for idx, confidence in zip(prediction_indices.tolist(), confidences.tolist())]
 
 
-def get_ethnicity_distributions(predictions: np.array, classes: list) -> list[dict]:
+def get_ethnicity_distributions(predictions: np.array, classes: list, top_k: int=None, min_confidence: float=None) -> list[dict]:
     """
     Collects the entire output distribution for every predictions in a batch
     For example if the model classified a batch of two names into eithher "german" or "greek":
     > [{german: 0.9, greek: 0.1}, {german: 0.2, greek: 0.8}]
 
+    When 'top_k' or 'min_confidence' is given, only the selected ethnicities are returned, ordered by confidence:
+    > top_k=1: [{german: 0.9}, {greek: 0.8}]
+
     :param predictions: The output predictions of the model
     :param classes: A list containing all the classes which a model can classify
+    :param top_k: Only return the 'top_k' most likely ethnicities of each name
+    :param min_confidence: Only return the ethnicities with at least this confidence (in percent)
     :return: A list containing an output distribution for each name
     """
 
-    predicted_ethnicites = []
+    if top_k is None and min_confidence is None:
+        return [dict(zip(classes, confidences)) for confidences in to_confidences(predictions).tolist()]
+
+    class_indices, confidences, kept_amounts = select_classes(predictions, top_k=top_k, min_confidence=min_confidence)
+
+    class_names = np.asarray(classes, dtype=object)[class_indices].tolist()
+    return [
+        dict(zip(names[:kept_amount], name_confidences[:kept_amount]))
+        for names, name_confidences, kept_amount in zip(class_names, confidences.tolist(), kept_amounts)
+    ]
+
+
+def get_columnar_results(predictions: np.array, classes: list, get_distribution: bool=False, top_k: int=None, min_confidence: float=None) -> dict:
+    """
+    Collects the results of all names as columns, so that the classes are only listed once, ie. for the names "a" and "b":
+    > {classes: [german, greek], predictions: [0, 1], confidences: [0.9, 0.8]}
+    > get_distribution: {classes: [german, greek], confidences: [[0.9, 0.1], [0.2, 0.8]]}
+    > top_k=1: {classes: [german, greek], classIndices: [[0], [1]], confidences: [[0.9], [0.8]]}
+
+    :param predictions: The output predictions of the model
+    :param classes: A list containing all the classes which a model can classify
+    :param get_distribution: Wether to return the entire distribution of the predicted nationalities
+    :param top_k: Only return the 'top_k' most likely ethnicities of the distribution
+    :param min_confidence: Only return the ethnicities of the distribution with at least this confidence
+    :return: Dictionary of the classes and the result columns, the rows are in the order of the predictions
+    """
+
+    if not get_distribution:
+        prediction_indices, confidences = select_top_class(predictions)
+        return {"classes": classes, "predictions": prediction_indices.tolist(), "confidences": confidences.tolist()}
+
+    if top_k is None and min_confidence is None:
+        return {"classes": classes, "confidences": to_confidences(predictions).tolist()}
+
+    class_indices, confidences, kept_amounts = select_classes(predictions, top_k=top_k, min_confidence=min_confidence)
+    return {
+        "classes": classes,
+        "classIndices": [indices[:kept_amount] for indices, kept_amount in zip(class_indices.tolist(), kept_amounts)],
+        "confidences": [name_confidences[:kept_amount] for name_confidences, kept_amount in zip(confidences.tolist(), kept_amounts)]
+    }
+
+
+def select_top_class(predictions: np.array) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Selects the most likely class of every prediction.
+    :param predictions: The output predictions of the model
+    :return: Tuple of (class index of each prediction, its confidence)
+    """
+
+    prediction_indices = np.argmax(predictions, axis=1)
+    confidences = to_confidences(np.take_along_axis(predictions, prediction_indices[:, None], axis=1)[:, 0])
+
+    return prediction_indices, confidences
+
+
+def select_classes(predictions: np.array, top_k: int=None, min_confidence: float=None) -> tuple[np.ndarray, np.ndarray, list[int]]:
+    """
+    Selects the 'top_k' most likely classes of every prediction, ordered by confidence.
+    :param predictions: The output predictions of the model
+    :param top_k: Amount of classes to select, all classes if not given
+    :param min_confidence: Minimum confidence (in percent) of the selected classes
+    :return: Tuple of (selected class indices, their confidences, amount of selected classes above 'min_confidence' for each prediction)
+    """
+
+    # select the top-k classes of every name without sorting the entire distribution, then order only those
+    class_amount = predictions.shape[1]
+    top_k = class_amount if top_k is None else min(top_k, class_amount)
+    if top_k < class_amount:
+        class_indices = np.argpartition(-predictions, top_k - 1, axis=1)[:, :top_k]
+    else:
+        class_indices = np.broadcast_to(np.arange(class_amount), predictions.shape)
+
+    selected_predictions = np.take_along_axis(predictions, class_indices, axis=1)
+    order = np.argsort(-selected_predictions, axis=1, kind="stable")
+    class_indices = np.take_along_axis(class_indices, order, axis=1)
+    confidences = to_confidences(np.take_along_axis(selected_predictions, order, axis=1))
+
+    # the confidences are sorted, so the classes above the threshold are a prefix of every row
+    if min_confidence is None:
+        kept_amounts = [top_k] * len(predictions)
+    else:
+        kept_amounts = (confidences >= min_confidence).sum(axis=1).tolist()
+
+    return class_indices, confidences, kept_amounts
+
+
+def build_model_config(base_model_config: dict, classes: list[str]) -> dict:
+    """
+    Creates the hyperparameters of a model from the base model configuration and the classes it was trained on.
+    :param base_model_config: The base model configuration
+    :param classes: List of all classes the model can classify
+    :return: Model configuration
+    """
+
+    return {
+        "amount-classes": len(classes),
+        "embedding-size": base_model_config["embedding-size"],
+        "hidden-size": base_model_config["hidden-size"],
+        "rnn-layers": base_model_config["rnn-layers"],
+        "kernel-size": base_model_config["kernel-size"],
+        "cnn-out-dim": base_model_config["cnn-out-dim"]
+    }
+
+
+def preload_models(models: list[tuple[str, list[str]]]) -> int:
+    """
+    Loads models and the base model configuration into memory ahead of the first request. Models which fail to load
+    (eg. a missing or corrupt checkpoint) are logged and skipped, they are loaded again on their first request.
+    :param models: List of (model ID, classes) tuples
+    :return: Amount of models which were loaded into the cache
+    """
+
+    try:
+        base_model_config = load_model_config()
+    except Exception as e:
+        logger.error(f"Could not preload the base model configuration: {e}")
+        base_model_config = None
+    if base_model_config is None:
+        model_preload_errors_counter.inc(len(models))
+        return 0
 
-    for prediction in predictions:
-        ethnicity_distribution = {}
-        for idx, ethnicity in enumerate(classes):
-            confidence = round(100 * float(np.exp(prediction[idx])), 3)
-            ethnicity_distribution[ethnicity] = confidence
+    for model_id, classes in models:
+        try:
+            get_model(model_id, build_model_config(base_model_config, classes))
+        except Exception as e:
+            model_preload_errors_counter.inc()
+            logger.error(f"Could not preload model '{model_id}': {e}")
 
-        predicted_ethnicites.append(ethnicity_distribution)
+    return sum(model_id in model_cache for model_id, _ in models)
 
-    return predicted_ethnicites
+
+def run_encoded_names(model_id: str, model_config: dict, encoded_names: np.ndarray, lengths: np.ndarray, batch_size: int) -> np.ndarray:
+    """
+    Runs the model on already encoded names in this process, loading the model into the model cache if necessary.
+    :param model_id: The ID of the model to use
+    :param model_config: Model configuration including the classes
+    :param encoded_names: Padded index-encoded names
+    :param lengths: Lengths of the names
+    :param batch_size: Batch size
+    :return: Log-probability matrix of shape (names, classes)
+    """
+
+    model = get_model(model_id, model_config)
+    input_batch = create_batches(encoded_names, lengths, batch_size=batch_size, batching_strategy=inference_config.batching_strategy)
+    return run_model(model, input_batch, length_aware=inference_config.length_aware)
 
 
-def predict(model_id: str, names: list[str], classes: list[str], batch_size: int, get_distribution: bool=False) -> list[str]:
+def predict_unique_names(model_id: str, model_config: dict, names: list[str], batch_size: int, encoded_names: tuple[np.ndarray, np.ndarray]=None) -> np.ndarray:
+    """
+    Predicts already normalized and deduplicated names, reusing the prediction cache for names the model classified recently.
+    If an inference server is configured, the names are only encoded here and the forward pass runs in the server.
+    :param model_id: The ID of the model to use
+    :param model_config: Model configuration including the classes
+    :param names: A list of distinct, normalized names
+    :param batch_size: Batch size
+    :param encoded_names: Optional output of 'encode_names(names)' to share the encoding between several models
+    :return: Log-probability matrix of shape (names, classes)
+    """
+
+    remote = bool(inference_config.inference_server_socket)
+    if remote:
+        # the model lives in the inference server, so only its ETag is checked to drop cached predictions of a retrained model
+        prediction_cache.revalidate(model_id, lambda: get_model_etag(model_id), inference_config.model_cache_revalidate_seconds)
+    else:
+        # revalidates the cached model, which also drops cached predictions of a retrained model
+        get_model(model_id, model_config)
+
+    # names classified recently by the same model skip preprocessing and the forward pass entirely
+    cached_predictions = prediction_cache.get_many(model_id, names)
+    cached = [idx for idx, prediction in enumerate(cached_predictions) if prediction is not None]
+    missing = [idx for idx, prediction in enumerate(cached_predictions) if prediction is None]
+
+    predictions = np.empty((len(names), model_config["amount-classes"]), dtype=np.float32)
+    if cached:
+        predictions[cached] = [cached_predictions[idx] for idx in cached]
+
+    if missing:
+        missing_names = [names[idx] for idx in missing]
+        if inference_config.micro_batching and not remote:
+            predictions[missing] = micro_batcher.submit(
+                model_id, missing_names, lambda names: run_encoded_names(model_id, model_config, *encode_names(names), batch_size)
+            )
+        else:
+            if encoded_names is not None:
+                # reuse the encoding shared between models, cut down to the longest name which actually needs a forward pass
+                encoded, lengths = encoded_names[0][missing], encoded_names[1][missing]
+                encoded = encoded[:, :lengths.max(initial=0)]
+            else:
+                encoded, lengths = encode_names(missing_names)
+
+            if remote:
+                predictions[missing], etag = inference_client.predict(model_id, model_config, encoded, lengths, batch_size)
+                # drops the cached predictions of the model if the server loaded a retrained checkpoint
+                prediction_cache.set_etag(model_id, etag)
+            else:
+                predictions[missing] = run_encoded_names(model_id, model_config, encoded, lengths, batch_size)
+        prediction_cache.put_many(model_id, missing_names, predictions[missing])
+
+    return predictions
+
+
+def predict(model_id: str, names: list[str], classes: list[str], batch_size: int, get_distribution: bool=False, top_k: int=None, min_confidence: float=None, columnar: bool=False) -> list | dict:
     """
     Preprocesses and predicts the names.
     :param model_id: The ID of the model to use
@@ -150,23 +559,86 @@ def predict(model_id: str, names: list[str], classes: list[str], batch_size: int
     :param classes: List of all classes the model can classify
     :param batch_size: Batch size
     :param get_distribution: Wether to return the entire distribution of the predicted nationalities
+    :param top_k: Only return the 'top_k' most likely ethnicities of the distribution
+    :param min_confidence: Only return the ethnicities of the distribution with at least this confidence
+    :param columnar: Wether to return the results as columns in the order of 'names' (see 'get_columnar_results')
     :return: List of the predicted nationalities (and optionally the entire output distr.)
     """
 
     load_dotenv()
 
-    model_config = load_model_config()    
-    model_checkpoint = get_model_checkpoint(model_id)
-    input_batch = preprocess_names(names=names, batch_size=batch_size)
+    model_config = build_model_config(load_model_config(), classes)
 
-    model_config = {
-        "amount-classes": len(classes),
-        "embedding-size": model_config["embedding-size"],
-        "hidden-size": model_config["hidden-size"],
-        "rnn-layers": model_config["rnn-layers"],
-        "kernel-size": model_config["kernel-size"],
-        "cnn-out-dim": model_config["cnn-out-dim"]
-    }
+    # only run the model once for every distinct (normalized) name and fan the results back out afterwards
+    unique_names, inverse = deduplicate_names(normalize_names(names))
+    requested_names_counter.inc(len(names))
+    deduplicated_names_counter.inc(len(names) - len(unique_names))
+
+    predictions = predict_unique_names(model_id, model_config, unique_names, batch_size)
+    return get_ethnicity_results(predictions[inverse], classes, get_distribution, top_k=top_k, min_confidence=min_confidence, columnar=columnar)
+
+
+def predict_chunks(model_id: str, name_chunks: Iterable[list[str]], classes: list[str], batch_size: int, get_distribution: bool=False, top_k: int=None, min_confidence: float=None) -> Iterator[list]:
+    """
+    Predicts the names chunk by chunk, so that results can be streamed while later chunks are still being read or classified.
+    The model is loaded before returning, so that loading errors are raised before the first chunk is streamed
+    (unless it runs in the inference server).
+    :param model_id: The ID of the model to use
+    :param name_chunks: Iterable over the chunks of names which are to classify, consumed lazily
+    :param classes: List of all classes the model can classify
+    :param batch_size: Batch size
+    :param get_distribution: Wether to return the entire distribution of the predicted nationalities
+    :param top_k: Only return the 'top_k' most likely ethnicities of the distribution
+    :param min_confidence: Only return the ethnicities of the distribution with at least this confidence
+    :return: Iterator over the lists of predicted nationalities (and optionally the entire output distr.) of each chunk
+    """
+
+    load_dotenv()
+
+    model_config = build_model_config(load_model_config(), classes)
+    if not inference_config.inference_server_socket:
+        get_model(model_id, model_config)
+
+    def chunks() -> Iterator[list]:
+        for names in name_chunks:
+            unique_names, inverse = deduplicate_names(normalize_names(names))
+            requested_names_counter.inc(len(inverse))
+            deduplicated_names_counter.inc(len(inverse) - len(unique_names))
+
+            predictions = predict_unique_names(model_id, model_config, unique_names, batch_size)
+            yield get_ethnicity_results(predictions[inverse], classes, get_distribution, top_k=top_k, min_confidence=min_confidence)
+
+    return chunks()
+
+
+def predict_multi(models: list[tuple[str, list[str]]], names: list[str], batch_size: int, get_distribution: bool=False) -> list[list]:
+    """
+    Preprocesses the names once and predicts them with several models in parallel.
+    :param models: List of (model ID, classes) tuples
+    :param names: A list of all names which are to classify
+    :param batch_size: Batch size
+    :param get_distribution: Wether to return the entire distribution of the predicted nationalities
+    :return: One list of predicted nationalities (and optionally the entire output distr.) per model, in the order of 'models'
+    """
+
+    load_dotenv()
+
+    base_model_config = load_model_config()
+
+    unique_names, inverse = deduplicate_names(normalize_names(names))
+    requested_names_counter.inc(len(names) * len(models))
+    deduplicated_names_counter.inc((len(names) - len(unique_names)) * len(models))
+    encoded_names = encode_names(unique_names)
+
+    def predict_model(model: tuple[str, list[str]]) -> np.ndarray:
+        model_id, classes = model
+        return predict_unique_names(model_id, build_model_config(base_model_config, classes), unique_names, batch_size, encoded_names)
 
-    return classify_names(model_checkpoint, input_batch, model_config, classes, get_distribution)
+    # torch releases the GIL inside its kernels, so the models run concurrently on the intra-op threads
+    with ThreadPoolExecutor(max_workers=max(len(models), 1)) as executor:
+        predictions = list(executor.map(predict_model, models))
 
+    return [
+        get_ethnicity_results(model_predictions[inverse], classes, get_distribution)
+        for model_predictions, (_, classes) in zip(predictions, models)
+    ]
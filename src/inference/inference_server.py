@@ -0,0 +1,145 @@
+"""
+Inference server owning the models, separated from the web workers. A small pool of processes accepts encoded names
+from the web workers over a Unix socket (see 'InferenceClient'), runs the forward pass and sends back the predictions.
+This way every model is only held in memory by the inference processes and the web workers stay lightweight.
+The parent process supervises the server processes and restarts every process which died (eg. killed by the OOM killer).
+
+Usage: PYTHONPATH=src python -m inference.inference_server [--socket PATH] [--processes N]
+"""
+
+import argparse
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge, wait
+import os
+import socket
+import time
+import traceback
+from typing import Callable
+from dotenv import load_dotenv
+from errors import GeneralError
+from inference.inference import run_encoded_names
+from inference.inference_utils import configure_torch_threads, inference_config, model_cache, set_socket_timeouts
+
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def handle_connection(connection: Connection, timeout_seconds: float=None):
+    """
+    Answers a single prediction request with ("ok", predictions, etag) or ("error", error_code, message, status_code).
+    :param connection: Accepted connection of a web worker
+    :param timeout_seconds: How long to wait for the request, defaults to 'INFERENCE_SERVER_TIMEOUT_SECONDS'
+    """
+
+    # a web worker which stalls must not pin the server process
+    if not connection.poll(timeout_seconds or inference_config.inference_server_timeout_seconds):
+        raise TimeoutError("No request received in time.")
+    model_id, model_config, encoded_names, lengths, batch_size = connection.recv()
+
+    try:
+        predictions = run_encoded_names(model_id, model_config, encoded_names, lengths, batch_size)
+        response = ("ok", predictions, model_cache.get_etag(model_id))
+    except GeneralError as e:
+        response = ("error", e.error_code, e.message, e.status_code)
+    except Exception as e:
+        logger.error(f"Unexpected inference error: {e}. Traceback:\n{traceback.format_exc()}")
+        response = ("error", "UNEXPECTED_ERROR", "An unexpected error occurred.", 500)
+
+    connection.send(response)
+
+
+def serve(listener: Listener, process_amount: int, authkey: bytes, timeout_seconds: float):
+    """
+    Accepts and answers connections until the process is stopped.
+    :param listener: Listener bound to the socket, shared by all server processes
+    :param process_amount: Amount of server processes sharing the CPU
+    :param authkey: Key the web workers have to authenticate with
+    :param timeout_seconds: Timeout of every blocking send and receive, incl. the authentication
+    """
+
+    configure_torch_threads(process_amount)
+    logger.info(f"Inference server process started. [pid: {os.getpid()}]")
+
+    while True:
+        try:
+            with listener.accept() as connection:
+                # authenticated here instead of by the listener, so that the handshake is bounded by the timeout too
+                connection_socket = socket.socket(fileno=connection.fileno())
+                set_socket_timeouts(connection_socket, timeout_seconds)
+                connection_socket.detach()
+
+                deliver_challenge(connection, authkey)
+                answer_challenge(connection, authkey)
+                handle_connection(connection, timeout_seconds)
+        except Exception as e:
+            # eg. a failed authentication or a web worker which stalled or disconnected after running into its timeout
+            logger.error(f"Inference server error: {e}")
+
+
+def restart_dead_processes(processes: list[multiprocessing.Process], start_process: Callable[[], multiprocessing.Process]) -> int:
+    """
+    Replaces every server process which died by a new one.
+    :param processes: The server processes, dead ones are replaced in place
+    :param start_process: Callback which starts a new server process
+    :return: Amount of restarted processes
+    """
+
+    restarted_amount = 0
+    for idx, process in enumerate(processes):
+        if process.is_alive():
+            continue
+
+        logger.error(f"Inference server process died, restarting it. [pid: {process.pid}, exit-code: {process.exitcode}]")
+        processes[idx] = start_process()
+        restarted_amount += 1
+
+    return restarted_amount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the inference server processes.")
+    parser.add_argument("--socket", default=inference_config.inference_server_socket, help="Path of the Unix socket")
+    parser.add_argument("--processes", type=int, default=inference_config.inference_server_processes, help="Amount of server processes")
+    args = parser.parse_args()
+
+    if not args.socket:
+        parser.error("No socket configured, set 'INFERENCE_SERVER_SOCKET' or pass '--socket'.")
+    if not inference_config.inference_server_authkey:
+        parser.error("No authentication key configured, set 'INFERENCE_SERVER_AUTHKEY'.")
+
+    logging.basicConfig(level=logging.INFO)
+
+    if os.getenv("PRELOAD_MODELS", "False").lower() == "true":
+        # loaded once before forking, so that the server processes share the model weights copy-on-write
+        from app import app
+        from services.inference_services import preload_public_models
+        with app.app_context():
+            preload_public_models()
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    listener = Listener(args.socket, family="AF_UNIX", backlog=128)
+    os.chmod(args.socket, 0o600)
+
+    def start_process() -> multiprocessing.Process:
+        process = multiprocessing.Process(
+            target=serve,
+            args=(listener, args.processes, inference_config.inference_server_authkey.encode(), inference_config.inference_server_timeout_seconds),
+            daemon=True
+        )
+        process.start()
+        return process
+
+    processes = [start_process() for _ in range(args.processes)]
+    while True:
+        wait([process.sentinel for process in processes])
+        # a process which keeps crashing right after its start must not make the supervisor spin
+        time.sleep(1)
+        restart_dead_processes(processes, start_process)
+
+
+if __name__ == "__main__":
+    main()
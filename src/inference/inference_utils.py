@@ -1,20 +1,726 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import fcntl
+import hashlib
 from io import BytesIO
+import json
+from multiprocessing.connection import Connection, answer_challenge, deliver_challenge
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Callable
+from dotenv import load_dotenv
+import numpy as np
 import torch
+from errors import GeneralError
+from monitoring import (
+    coalesced_model_loads_counter, inter_op_threads_gauge, intra_op_threads_gauge, micro_batch_queue_depth_gauge, micro_batch_size_histogram,
+    prediction_cache_evictions_counter, prediction_cache_hits_counter, prediction_cache_misses_counter
+)
 from s3 import S3Handler, bucket_config
+from utils import atomic_write
 
 
 
+load_dotenv()
+
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
 
-def get_model_checkpoint(model_id: str):
-    model_checkpoint_path = f"{model_id}/model.pt"
-    model_file = S3Handler.get(bucket_config.model_bucket, model_checkpoint_path)
-    
+@dataclass
+class InferenceConfig:
+    model_cache_max_mb: float = float(os.getenv("MODEL_CACHE_MAX_MB", 512))
+    model_cache_revalidate_seconds: float = float(os.getenv("MODEL_CACHE_REVALIDATE_SECONDS", 60))
+    batching_strategy: str = os.getenv("BATCHING_STRATEGY", "padded")
+    length_aware: bool = os.getenv("LENGTH_AWARE_INFERENCE", "True").lower() == "true"
+    prediction_cache_max_entries: int = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 100000))
+    prediction_cache_ttl_seconds: float = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", 3600))
+    web_workers: int = int(os.getenv("GUNICORN_WORKERS", 8))
+    intra_op_threads: int = int(os.getenv("TORCH_INTRA_OP_THREADS", 0))
+    inter_op_threads: int = int(os.getenv("TORCH_INTER_OP_THREADS", 1))
+    quantized_inference: bool = os.getenv("QUANTIZED_INFERENCE", "False").lower() == "true"
+    quantized_model_ids: tuple[str, ...] = tuple(filter(None, os.getenv("QUANTIZED_MODEL_IDS", "").split(",")))
+    quantization_min_agreement: float = float(os.getenv("QUANTIZATION_MIN_AGREEMENT", 0.98))
+    quantization_max_probability_delta: float = float(os.getenv("QUANTIZATION_MAX_PROBABILITY_DELTA", 0.05))
+    torchscript_inference: bool = os.getenv("TORCHSCRIPT_INFERENCE", "False").lower() == "true"
+    compiled_model_dir: str = os.getenv("COMPILED_MODEL_DIR", "/tmp/n2e-compiled-models")
+    compiled_model_max_mb: float = float(os.getenv("COMPILED_MODEL_MAX_MB", 1024))
+    mmap_models: bool = os.getenv("MMAP_MODELS", "True").lower() == "true"
+    model_store_dir: str = os.getenv("MODEL_STORE_DIR", "/tmp/n2e-model-store")
+    model_store_max_mb: float = float(os.getenv("MODEL_STORE_MAX_MB", 2048))
+    micro_batching: bool = os.getenv("MICRO_BATCHING", "False").lower() == "true"
+    micro_batch_window_ms: float = float(os.getenv("MICRO_BATCH_WINDOW_MS", 2))
+    micro_batch_max_names: int = int(os.getenv("MICRO_BATCH_MAX_NAMES", 256))
+    micro_batch_timeout_ms: float = float(os.getenv("MICRO_BATCH_TIMEOUT_MS", 1000))
+    inference_server_socket: str = os.getenv("INFERENCE_SERVER_SOCKET", "")
+    inference_server_authkey: str = os.getenv("INFERENCE_SERVER_AUTHKEY", "")
+    inference_server_processes: int = int(os.getenv("INFERENCE_SERVER_PROCESSES", 2))
+    inference_server_timeout_seconds: float = float(os.getenv("INFERENCE_SERVER_TIMEOUT_SECONDS", 30))
+
+
+inference_config = InferenceConfig()
+
+
+def configure_torch_threads(worker_amount: int=None):
+    """
+    Limits the threads torch uses for a forward pass, so the workers running in parallel don't oversubscribe the CPU.
+    By default the available cores are split evenly across the workers. Meant to be called once per worker at startup.
+    :param worker_amount: Amount of workers running in parallel, defaults to the amount of web workers
+    """
+
+    available_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    intra_op_threads = inference_config.intra_op_threads or max(1, available_cores // (worker_amount or inference_config.web_workers))
+
+    torch.set_num_threads(intra_op_threads)
+    try:
+        torch.set_num_interop_threads(inference_config.inter_op_threads)
+    except RuntimeError:
+        # can only be set once per process, forked workers inherit it from the master
+        pass
+
+    intra_op_threads_gauge.set(torch.get_num_threads())
+    inter_op_threads_gauge.set(torch.get_num_interop_threads())
+
+
+def get_model_checkpoint(model_id: str, etag: str=None):
     device_map_location = {"cuda:0": "cpu"} if device.type == "cpu" else None
+
+    if inference_config.mmap_models and etag:
+        # mapped from the local model store, so all processes of the host share one copy of the weights in the page cache
+        return torch.load(store_model_checkpoint(model_id, etag), map_location=device_map_location, mmap=True)
+
+    model_checkpoint_path = f"{model_id}/model.pt"
+    if etag:
+        model_file = fetch_model_checkpoint(model_id, etag)
+    else:
+        model_file = S3Handler.get(bucket_config.model_bucket, model_checkpoint_path)
     return torch.load(BytesIO(model_file), map_location=device_map_location)
 
 
+def fetch_model_checkpoint(model_id: str, etag: str) -> bytes:
+    """
+    Fetches the checkpoint of a model with the given ETag, so that the weights always match the ETag they are cached
+    (and compiled or stored) under, even if the model is retrained in between.
+    :param model_id: The ID of the model
+    :param etag: ETag of the checkpoint in S3
+    :return: The raw checkpoint
+    """
+
+    model_file = S3Handler.get_version(bucket_config.model_bucket, f"{model_id}/model.pt", etag)
+    if model_file is None:
+        raise GeneralError(
+            error_code="MODEL_CHANGED",
+            message="The model changed while it was loaded, please try again.",
+            status_code=503
+        )
+    return model_file
+
+
+def store_model_checkpoint(model_id: str, etag: str) -> str:
+    """
+    Downloads the checkpoint of a model into the local model store, once per host and ETag. Concurrent downloads
+    (eg. by several workers loading the same model) are serialized with a file lock, so only the first one fetches it.
+    Checkpoints of older ETags are removed, processes which still map them keep reading them until they reload.
+    The store is bounded by 'MODEL_STORE_MAX_MB', the least recently used checkpoints of other models are removed first.
+    :param model_id: The ID of the model
+    :param etag: ETag of the checkpoint in S3
+    :return: Path to the stored checkpoint
+    """
+
+    model_dir = os.path.join(inference_config.model_store_dir, model_id)
+    checkpoint_path = os.path.join(model_dir, f"{hashlib.sha256(etag.encode()).hexdigest()}.pt")
+    if touch_file(checkpoint_path):
+        return checkpoint_path
+
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, ".lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            coalesced_model_loads_counter.labels("host").inc()
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(checkpoint_path):
+            return checkpoint_path
+
+        model_file = fetch_model_checkpoint(model_id, etag)
+        with atomic_write(checkpoint_path) as file:
+            file.write(model_file)
+
+        for file_name in os.listdir(model_dir):
+            if file_name.endswith(".pt") and os.path.join(model_dir, file_name) != checkpoint_path:
+                os.remove(os.path.join(model_dir, file_name))
+
+    evict_files(inference_config.model_store_dir, int(inference_config.model_store_max_mb * 1024 ** 2), keep_path=checkpoint_path)
+    return checkpoint_path
+
+
+def touch_file(path: str) -> bool:
+    """
+    Marks a file of a local cache (model store or compiled models) as recently used.
+    :param path: Path to the file
+    :return: Whether the file exists
+    """
+
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def evict_files(directory: str, max_bytes: int, keep_path: str = None):
+    """
+    Removes the least recently used '.pt' files of a local cache directory (incl. its subdirectories) until it fits into
+    its budget. Processes which still map a removed file keep reading it until they reload.
+    :param directory: Directory of the cache
+    :param max_bytes: Budget of the directory
+    :param keep_path: File which was just stored and must not be removed
+    """
+
+    stored_files = []
+    for dir_path, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            if not file_name.endswith(".pt") or path == keep_path:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stored_files.append((stat.st_mtime, stat.st_size, path))
+
+    size = sum(file_size for _, file_size, _ in stored_files)
+    if keep_path and os.path.exists(keep_path):
+        size += os.path.getsize(keep_path)
+
+    for _, file_size, path in sorted(stored_files):
+        if size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= file_size
+
+
+def get_model_etag(model_id: str) -> str | None:
+    model_checkpoint_path = f"{model_id}/model.pt"
+    return S3Handler.get_etag(bucket_config.model_bucket, model_checkpoint_path)
+
+
 def load_model_config() -> dict:
+    """
+    Returns the configuration of the base model from the read-through cache of 'S3Handler.get', ie. it is kept in memory
+    (also across forks when preloading models) and revalidated after 'BASE_DATA_S3_CACHE_TTL_SECONDS'.
+    :return: The base model configuration, shared between callers and must not be modified
+    """
+
     model_config_path = f"model-configs/{bucket_config.base_model}.json"
-    return S3Handler.get(bucket_config.base_data_bucket, model_config_path)
\ No newline at end of file
+    return S3Handler.get(bucket_config.base_data_bucket, model_config_path)
+
+
+def get_compiled_model_path(model_id: str, etag: str, model_config: dict, quantized: bool) -> str:
+    """
+    Creates the path of the compiled (TorchScript) artifact of a model in the local artifact cache.
+    The file name is derived from everything the compiled module depends on, ie. a retrained checkpoint gets a new file.
+    :param model_id: The ID of the model
+    :param etag: ETag of the checkpoint the model is compiled from
+    :param model_config: Model hyperparameters (incl. amount of classes)
+    :param quantized: Wether the model is quantized
+    :return: Path to the artifact
+    """
+
+    artifact_key = json.dumps([model_id, etag, model_config, quantized, torch.__version__], sort_keys=True)
+    artifact_name = hashlib.sha256(artifact_key.encode()).hexdigest()
+    return os.path.join(inference_config.compiled_model_dir, f"{artifact_name}.pt")
+
+
+def get_model_size(model: torch.nn.Module) -> int:
+    """
+    Computes the amount of memory the weights of a model occupy, by the size of its serialized state.
+    Unlike counting its parameters this includes packed weights of quantized layers and constants of frozen modules.
+    :param model: The model to measure
+    :return: Size in bytes
+    """
+
+    buffer = BytesIO()
+    if isinstance(model, torch.jit.ScriptModule):
+        torch.jit.save(model, buffer)
+    else:
+        torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+@dataclass
+class CachedModel:
+    model: torch.nn.Module
+    etag: str | None
+    size: int
+    validated_at: float
+
+
+class ModelCache:
+    """
+    Process-wide LRU cache of inference-ready models, bounded by the memory their weights occupy.
+    Entries are revalidated against the ETag of the checkpoint in S3 so retrained weights get picked up.
+    Loads are single-flight per model: concurrent lookups of a model which is being loaded wait for that load
+    instead of fetching the checkpoint again. Across the processes of the host, checkpoints are only fetched once by
+    'store_model_checkpoint' (with 'MMAP_MODELS'), otherwise every process fetches its own copy.
+    """
+
+    def __init__(self, max_bytes: int, revalidate_seconds: float, on_load: Callable[[str, str | None], None] = None):
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.on_load = on_load
+        self._entries: OrderedDict[str, CachedModel] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+
+    def get(self, model_id: str, load_model: Callable[[str | None], torch.nn.Module], get_etag: Callable[[], str | None]) -> torch.nn.Module:
+        """
+        Returns the cached model for a model ID and (re-)loads it if it is missing or its checkpoint changed.
+        :param model_id: The ID of the model
+        :param load_model: Callback which builds the eval-mode model from the checkpoint with the given ETag
+        :param get_etag: Callback which fetches the current ETag of the models checkpoint
+        :return: The inference-ready model
+        """
+
+        entry = self._get_validated_entry(model_id)
+        if entry:
+            return entry.model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        if not load_lock.acquire(blocking=False):
+            coalesced_model_loads_counter.labels("process").inc()
+            load_lock.acquire()
+
+        try:
+            # the load (or revalidation) this lookup waited for may already have refreshed the entry
+            entry = self._get_validated_entry(model_id)
+            if entry:
+                return entry.model
+
+            with self._lock:
+                entry = self._entries.get(model_id)
+
+            # Fetch the ETag before loading, so weights that change during the load get caught by the next revalidation
+            etag = get_etag()
+            if entry and etag == entry.etag:
+                entry.validated_at = time.monotonic()
+                return entry.model
+
+            model = load_model(etag)
+            self.put(model_id, model, etag)
+        finally:
+            load_lock.release()
+
+        if self.on_load:
+            self.on_load(model_id, etag)
+
+        return model
+
+    def _get_validated_entry(self, model_id: str) -> CachedModel | None:
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry:
+                self._entries.move_to_end(model_id)
+
+        if entry and time.monotonic() - entry.validated_at < self.revalidate_seconds:
+            return entry
+        return None
+
+    def put(self, model_id: str, model: torch.nn.Module, etag: str | None):
+        """
+        Adds a model to the cache and evicts the least recently used models until it fits the memory budget.
+        :param model_id: The ID of the model
+        :param model: The inference-ready model
+        :param etag: ETag of the checkpoint the model was loaded from
+        """
+
+        size = get_model_size(model)
+
+        with self._lock:
+            self._remove(model_id)
+            if size > self.max_bytes:
+                return
+
+            while self._size + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+            self._entries[model_id] = CachedModel(model, etag, size, time.monotonic())
+            self._size += size
+
+    def invalidate(self, model_id: str):
+        with self._lock:
+            self._remove(model_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, model_id: str):
+        entry = self._entries.pop(model_id, None)
+        if entry:
+            self._size -= entry.size
+
+    def get_etag(self, model_id: str) -> str | None:
+        """
+        Returns the ETag of the checkpoint a cached model was loaded from, without revalidating it.
+        :param model_id: The ID of the model
+        :return: The ETag or None if the model is not cached
+        """
+
+        with self._lock:
+            entry = self._entries.get(model_id)
+            return entry.etag if entry else None
+
+    def __contains__(self, model_id: str) -> bool:
+        return model_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PredictionCache:
+    """
+    Process-wide LRU cache of the output log-probabilities of single names, with a time to live for every entry.
+    Entries of a model are dropped as soon as it gets loaded with a different checkpoint ETag.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple[str, str], tuple[float, np.ndarray]] = OrderedDict()
+        self._etags: dict[str, str | None] = {}
+        self._validated_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def revalidate(self, model_id: str, get_etag: Callable[[], str | None], revalidate_seconds: float):
+        """
+        Checks the ETag of a models checkpoint at most every 'revalidate_seconds', for processes which cache predictions
+        without loading the model themselves (ie. web workers using the inference server).
+        :param model_id: The ID of the model
+        :param get_etag: Callback which fetches the current ETag of the models checkpoint
+        :param revalidate_seconds: Minimum interval between two checks
+        """
+
+        with self._lock:
+            validated_at = self._validated_at.get(model_id)
+            if validated_at is not None and time.monotonic() - validated_at < revalidate_seconds:
+                return
+            self._validated_at[model_id] = time.monotonic()
+
+        self.set_etag(model_id, get_etag())
+
+    def get_many(self, model_id: str, names: list[str]) -> list[np.ndarray | None]:
+        """
+        Looks up the cached predictions of a model for a list of normalized names.
+        :param model_id: The ID of the model
+        :param names: list of normalized names
+        :return: The cached prediction of every name or None if it is not cached (anymore)
+        """
+
+        now = time.monotonic()
+        predictions = []
+
+        with self._lock:
+            for name in names:
+                entry = self._entries.get((model_id, name))
+                if entry and entry[0] < now:
+                    del self._entries[(model_id, name)]
+                    prediction_cache_evictions_counter.inc()
+                    entry = None
+
+                if entry:
+                    self._entries.move_to_end((model_id, name))
+                predictions.append(entry[1] if entry else None)
+
+        hits = sum(prediction is not None for prediction in predictions)
+        prediction_cache_hits_counter.inc(hits)
+        prediction_cache_misses_counter.inc(len(names) - hits)
+
+        return predictions
+
+    def put_many(self, model_id: str, names: list[str], predictions: np.ndarray):
+        """
+        Caches the predictions of a model for a list of normalized names.
+        :param model_id: The ID of the model
+        :param names: list of normalized names
+        :param predictions: Output log-probabilities of shape [names, classes]
+        """
+
+        if self.max_entries <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            for name, prediction in zip(names, predictions):
+                # copy the row so the cache doesn't keep the entire prediction matrix alive
+                self._entries[(model_id, name)] = (expires_at, prediction.copy())
+                self._entries.move_to_end((model_id, name))
+
+            evictions = max(len(self._entries) - self.max_entries, 0)
+            for _ in range(evictions):
+                self._entries.popitem(last=False)
+
+        prediction_cache_evictions_counter.inc(evictions)
+
+    def set_etag(self, model_id: str, etag: str | None):
+        """
+        Drops all predictions of a model if it was loaded from a different checkpoint than they were made with.
+        :param model_id: The ID of the model
+        :param etag: ETag of the checkpoint the model was loaded from
+        """
+
+        with self._lock:
+            if model_id in self._etags and self._etags[model_id] != etag:
+                stale_keys = [key for key in self._entries if key[0] == model_id]
+                for key in stale_keys:
+                    del self._entries[key]
+                prediction_cache_evictions_counter.inc(len(stale_keys))
+
+            self._etags[model_id] = etag
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._etags.clear()
+            self._validated_at.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass
+class PendingPrediction:
+    names: list[str]
+    done: threading.Event
+    predictions: np.ndarray = None
+    error: Exception = None
+
+
+class MicroBatcher:
+    """
+    Merges the names of concurrent small requests for the same model into one forward pass. The first request of a batch
+    waits for up to 'window_seconds' (or until 'max_names' names are queued), runs the forward pass for all queued
+    requests and hands every request its slice of the predictions. A batch never holds more than 'max_names' names,
+    a request which doesn't fit anymore starts the next batch.
+    'timeout_seconds' bounds how long a request waits for the batch it joined. The forward pass itself is not interrupted,
+    its duration is bounded by the size of the batch instead.
+    """
+
+    def __init__(self, window_seconds: float, max_names: int, timeout_seconds: float):
+        self.window_seconds = window_seconds
+        self.max_names = max_names
+        self.timeout_seconds = timeout_seconds
+        self._queues: dict[str, list[PendingPrediction]] = {}
+        self._condition = threading.Condition()
+
+    def submit(self, key: str, names: list[str], run: Callable[[list[str]], np.ndarray]) -> np.ndarray:
+        """
+        Predicts names together with the names of concurrent requests for the same key (ie. model).
+        :param key: Requests with the same key get batched together
+        :param names: list of normalized names
+        :param run: Callback which runs the forward pass over a list of names and returns their predictions
+        :return: The predictions of the names
+        """
+
+        # large requests don't benefit from batching, they would only delay the small ones
+        if len(names) >= self.max_names:
+            return run(names)
+
+        pending = PendingPrediction(names, threading.Event())
+
+        with self._condition:
+            queue = self._queues.get(key)
+            if queue is None or sum(len(queued.names) for queued in queue) + len(names) > self.max_names:
+                # replacing the queue closes the current batch, its leader runs it right away
+                queue = self._queues[key] = []
+                self._condition.notify_all()
+            queue.append(pending)
+            micro_batch_queue_depth_gauge.inc()
+            is_leader = len(queue) == 1
+
+            if not is_leader:
+                self._condition.notify_all()
+
+        if not is_leader:
+            if not pending.done.wait(self.timeout_seconds):
+                raise GeneralError(
+                    error_code="INFERENCE_TIMEOUT",
+                    message="Classification took too long, please try again.",
+                    status_code=503
+                )
+            if pending.error:
+                raise pending.error
+            return pending.predictions
+
+        with self._condition:
+            deadline = time.monotonic() + self.window_seconds
+            while (
+                self._queues.get(key) is queue and sum(len(queued.names) for queued in queue) < self.max_names
+                and (remaining := deadline - time.monotonic()) > 0
+            ):
+                self._condition.wait(remaining)
+
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+            micro_batch_queue_depth_gauge.dec(len(queue))
+
+        batch_names = [name for queued in queue for name in queued.names]
+        micro_batch_size_histogram.observe(len(batch_names))
+
+        try:
+            predictions = run(batch_names)
+            offset = 0
+            for queued in queue:
+                queued.predictions = predictions[offset:offset + len(queued.names)]
+                offset += len(queued.names)
+        except Exception as e:
+            for queued in queue:
+                queued.error = e
+            raise
+        finally:
+            for queued in queue:
+                queued.done.set()
+
+        return pending.predictions
+
+
+def set_socket_timeouts(connection_socket: socket.socket, timeout_seconds: float):
+    """
+    Bounds every blocking send and receive on a socket, also when it is used through a 'Connection' afterwards.
+    A send or receive which runs into the timeout raises a 'BlockingIOError'.
+    :param connection_socket: The connected socket
+    :param timeout_seconds: Timeout of a single send or receive
+    """
+
+    timeout = struct.pack("ll", int(timeout_seconds), int(timeout_seconds % 1 * 1e6))
+    connection_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeout)
+    connection_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeout)
+
+
+class InferenceClient:
+    """
+    Submits encoded names to the inference server (see 'inference.inference_server') over a Unix socket, so the models
+    only live in the memory of the few inference processes instead of in every web worker. Every request opens its own
+    connection, because a server process serves one connection at a time and must not stay pinned to a single web worker.
+    """
+
+    def __init__(self, address: str, authkey: str, timeout_seconds: float):
+        if address and not authkey:
+            raise ValueError("'INFERENCE_SERVER_AUTHKEY' must be set when using the inference server.")
+
+        self.address = address
+        self.authkey = authkey.encode()
+        self.timeout_seconds = timeout_seconds
+
+    def predict(self, model_id: str, model_config: dict, encoded_names: np.ndarray, lengths: np.ndarray, batch_size: int) -> tuple[np.ndarray, str | None]:
+        """
+        Runs the model on already encoded names in the inference server. The whole round trip, including waiting for
+        a free server process, is bounded by 'timeout_seconds'.
+        :param model_id: The ID of the model to use
+        :param model_config: Model hyperparameters (incl. amount of classes)
+        :param encoded_names: Padded index-encoded names
+        :param lengths: Lengths of the names
+        :param batch_size: Batch size
+        :return: Log-probability matrix of shape (names, classes) and the ETag of the checkpoint the model was loaded from
+        """
+
+        deadline = time.monotonic() + self.timeout_seconds
+
+        try:
+            with self.connect(deadline) as connection:
+                connection.send((model_id, model_config, encoded_names, lengths, batch_size))
+                if not connection.poll(self.get_remaining_seconds(deadline)):
+                    raise self.timeout_error()
+                response = connection.recv()
+        except (TimeoutError, BlockingIOError) as e:
+            raise self.timeout_error() from e
+        except (OSError, EOFError) as e:
+            raise GeneralError(
+                error_code="INFERENCE_UNAVAILABLE",
+                message="Classification is currently unavailable, please try again.",
+                status_code=503
+            ) from e
+
+        if response[0] == "error":
+            _, error_code, message, status_code = response
+            raise GeneralError(error_code=error_code, message=message, status_code=status_code)
+
+        _, predictions, etag = response
+        return predictions, etag
+
+    def connect(self, deadline: float) -> Connection:
+        """
+        Connects and authenticates to the inference server. Unlike 'multiprocessing.connection.Client' this doesn't block
+        indefinitely while all server processes are busy, ie. while the connection waits in the backlog of the socket.
+        :param deadline: Monotonic time until which the connection has to be established
+        :return: The authenticated connection
+        """
+
+        with socket.socket(socket.AF_UNIX) as client_socket:
+            client_socket.settimeout(self.get_remaining_seconds(deadline))
+            client_socket.connect(self.address)
+            client_socket.setblocking(True)
+
+            # bounds every blocking send and receive on the connection as a backstop
+            set_socket_timeouts(client_socket, self.timeout_seconds)
+            connection = Connection(client_socket.detach())
+
+        try:
+            # the server starts the handshake as soon as one of its processes accepted the connection
+            if not connection.poll(self.get_remaining_seconds(deadline)):
+                raise self.timeout_error()
+            answer_challenge(connection, self.authkey)
+            deliver_challenge(connection, self.authkey)
+        except BaseException:
+            connection.close()
+            raise
+
+        return connection
+
+    def get_remaining_seconds(self, deadline: float) -> float:
+        remaining_seconds = deadline - time.monotonic()
+        if remaining_seconds <= 0:
+            raise self.timeout_error()
+        return remaining_seconds
+
+    @staticmethod
+    def timeout_error() -> GeneralError:
+        return GeneralError(
+            error_code="INFERENCE_TIMEOUT",
+            message="Classification took too long, please try again.",
+            status_code=503
+        )
+
+
+micro_batcher = MicroBatcher(
+    window_seconds=inference_config.micro_batch_window_ms / 1000,
+    max_names=inference_config.micro_batch_max_names,
+    timeout_seconds=inference_config.micro_batch_timeout_ms / 1000
+)
+
+prediction_cache = PredictionCache(
+    max_entries=inference_config.prediction_cache_max_entries,
+    ttl_seconds=inference_config.prediction_cache_ttl_seconds
+)
+
+model_cache = ModelCache(
+    max_bytes=int(inference_config.model_cache_max_mb * 1024 ** 2),
+    revalidate_seconds=inference_config.model_cache_revalidate_seconds,
+    on_load=prediction_cache.set_etag
+)
+
+inference_client = InferenceClient(
+    address=inference_config.inference_server_socket,
+    authkey=inference_config.inference_server_authkey,
+    timeout_seconds=inference_config.inference_server_timeout_seconds
+)
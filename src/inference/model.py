@@ -1,6 +1,7 @@
+from typing import Optional
 import torch
 import torch.nn as nn
-from inference.inference_utils import device
+from torch.nn.utils.rnn import pack_padded_sequence
 
 
 
@@ -27,9 +28,13 @@ class ConvLSTM(nn.Module):
         self.linear1 = nn.Linear(self.hidden_size, class_amount)
         self.logSoftmax = nn.LogSoftmax(dim=1)
 
-    def forward(self, x: torch.tensor):
+    def forward(self, x: torch.Tensor, lengths: Optional[torch.Tensor] = None) -> torch.Tensor:
+        # The convolution needs at least 'kernel_size' steps, so batches of only very short names get padded further
+        if x.shape[1] < self.kernel_size:
+            x = nn.functional.pad(x, [0, 0, 0, self.kernel_size - x.shape[1]])
+
         # Embedding
-        x = self.embedder(x.type(torch.LongTensor).to(device=device))
+        x = self.embedder(x.long())
         x = x.squeeze(2).transpose(1, 2)
         
         # 1-dimensional CNN
@@ -37,8 +42,14 @@ class ConvLSTM(nn.Module):
         x = x.transpose(1, 2)
 
         # LSTM
-        x, _ = self.lstm(x)
-        x = x[:, -1]
+        if lengths is None:
+            x = self.lstm(x)[0][:, -1]
+        else:
+            # Only run over the convolved characters of every name and take the output at its actual last step,
+            # so the result doesn't depend on how much padding the other names in the batch add
+            lengths = torch.clamp(lengths - self.kernel_size + 1, min=1, max=x.shape[1])
+            packed_x = pack_padded_sequence(x, lengths.cpu(), batch_first=True, enforce_sorted=False)
+            x = self.lstm(packed_x)[1][0][-1]
 
         # Feed-Forward Layer
         x = self.dropout(x)
@@ -46,5 +57,3 @@ class ConvLSTM(nn.Module):
         x = self.logSoftmax(x)
 
         return x
-
-
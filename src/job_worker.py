@@ -0,0 +1,73 @@
+"""
+Worker pool processing the bulk classification jobs submitted to '/jobs'.
+Every worker process polls the database for claimable jobs and classifies them chunk by chunk.
+When idle, the workers delete finished jobs and their chunks once 'JOB_RETENTION_HOURS' passed.
+
+Usage: PYTHONPATH=src python src/job_worker.py [--workers N] [--poll-seconds S]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from dotenv import load_dotenv
+from app import app
+from db.database import db
+from inference.inference_utils import configure_torch_threads
+from services.job_services import claim_job, delete_expired_jobs, process_job
+
+
+load_dotenv()
+
+
+def run_worker(worker_amount: int, poll_seconds: float):
+    """
+    Claims and processes jobs until the process is stopped.
+    :param worker_amount: Amount of worker processes sharing the CPU
+    :param poll_seconds: Seconds to wait before polling again when there is no job
+    """
+
+    configure_torch_threads(worker_amount)
+
+    with app.app_context():
+        # connections of the parent process must not be shared with the forked workers
+        db.engine.dispose(close=False)
+        app.logger.info(f"Job worker started. [pid: {os.getpid()}]")
+
+        while True:
+            try:
+                job_id = claim_job()
+                if job_id is None:
+                    # idle workers clean up the jobs whose retention period is over
+                    if deleted_amount := delete_expired_jobs():
+                        app.logger.info(f"Deleted {deleted_amount} expired jobs.")
+                    time.sleep(poll_seconds)
+                    continue
+
+                app.logger.info(f"Claimed job. [job-id: {job_id}, pid: {os.getpid()}]")
+                process_job(job_id)
+            except Exception as e:
+                # eg. the database is unreachable, a claimed job is picked up again once its lease expired
+                app.logger.error(f"Job worker error: {e}")
+                db.session.rollback()
+                time.sleep(poll_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the worker pool for bulk classification jobs.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOB_WORKERS", 2)), help="Amount of worker processes")
+    parser.add_argument("--poll-seconds", type=float, default=float(os.getenv("JOB_POLL_SECONDS", 5)), help="Polling interval when idle")
+    args = parser.parse_args()
+
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(args.workers, args.poll_seconds), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Metrics are registered in the default registry which is exported by the PrometheusMetrics instance of the app
+
+preloaded_models_gauge = Gauge("n2e_preloaded_models", "Amount of models preloaded before forking the workers")
+model_preload_duration_gauge = Gauge("n2e_model_preload_duration_seconds", "Time it took to preload the models")
+model_preload_errors_counter = Counter("n2e_model_preload_errors", "Amount of models which failed to load while preloading")
+padding_waste_histogram = Histogram(
+    "n2e_inference_padding_waste_ratio",
+    "Share of padding in the input batches of a classification request",
+    ["strategy"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+)
+requested_names_counter = Counter("n2e_inference_requested_names", "Amount of names requested for classification")
+deduplicated_names_counter = Counter(
+    "n2e_inference_deduplicated_names",
+    "Amount of forward-pass rows saved by classifying duplicate names within a request only once"
+)
+
+prediction_cache_hits_counter = Counter("n2e_prediction_cache_hits", "Amount of names whose prediction was served from the prediction cache")
+prediction_cache_misses_counter = Counter("n2e_prediction_cache_misses", "Amount of names whose prediction was not cached")
+prediction_cache_evictions_counter = Counter("n2e_prediction_cache_evictions", "Amount of predictions evicted from the prediction cache")
+
+coalesced_model_loads_counter = Counter(
+    "n2e_coalesced_model_loads",
+    "Amount of model cache lookups which waited for a load of the same model already in flight instead of loading it again",
+    ["scope"]
+)
+
+intra_op_threads_gauge = Gauge("n2e_torch_intra_op_threads", "Amount of threads torch uses within an operation")
+inter_op_threads_gauge = Gauge("n2e_torch_inter_op_threads", "Amount of threads torch uses to run operations in parallel")
+
+micro_batch_queue_depth_gauge = Gauge("n2e_micro_batch_queue_depth", "Amount of requests waiting to be merged into a micro-batch")
+micro_batch_size_histogram = Histogram(
+    "n2e_micro_batch_size",
+    "Amount of names in a merged micro-batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+
+s3_cache_hits_counter = Counter("n2e_s3_cache_hits", "Amount of S3 objects served from the read-through cache", ["tier"])
+s3_cache_misses_counter = Counter("n2e_s3_cache_misses", "Amount of S3 objects fetched because they were not cached")
+s3_cache_revalidations_counter = Counter(
+    "n2e_s3_cache_revalidations",
+    "Amount of expired cached S3 objects revalidated with a conditional GET",
+    ["result"]
+)
+s3_cache_bytes_counter = Counter("n2e_s3_cache_bytes", "Amount of bytes of cached S3 objects served per source", ["source"])
@@ -1,26 +1,70 @@
-from errors import error_handler
+import itertools
+from errors import GeneralError, error_handler
 from flask import Blueprint, current_app, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_spec_gen import openapi_generator as og
 from services.user_services import check_user_existence, check_user_restriction
-from utils import success_response
-from schemas.inference_schema import InferenceSchema, InferenceResponseSchema, InferenceDistributionResponseSchema
+from utils import csv_response, iter_chunks, json_response, ndjson_response, validate_response
+from werkzeug.utils import secure_filename
+from schemas.inference_schema import (
+    ColumnarInferenceDistributionResponseSchema, ColumnarInferenceResponseSchema, CsvInferenceSchema, InferenceSchema, InferenceResponseSchema,
+    InferenceDistributionResponseSchema, MultiInferenceSchema, MultiInferenceResponseSchema
+)
 from inference import inference
 from services.model_services import get_inference_model_info
-from services.inference_services import check_name_amount_and_quota, increment_request_counter, update_name_quota
+from services.inference_services import (
+    charge_multi_classification, check_name_amount_and_quota, increment_request_counter, inspect_csv, read_csv_rows, update_name_quota
+)
 
 
 inference_routes = Blueprint("inference", __name__)
 
 
+def wants_ndjson() -> bool:
+    """ Checks if the client asked for a streamed NDJSON response via the 'Accept' header """
+    return request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+
+def stream_classification(user_id: str, model_id: str, classes: list[str], request_data: InferenceSchema, get_distribution: bool):
+    """
+    Streams the classification results as NDJSON, one '{name: result}' line per name in input order.
+    The quota and request counters are only updated once the entire stream was produced.
+    """
+
+    batch_size = int(current_app.config["BATCH_SIZE"])
+    prediction_chunks = inference.predict_chunks(
+        model_id=model_id,
+        classes=classes,
+        name_chunks=iter_chunks(request_data.names, batch_size),
+        batch_size=batch_size,
+        get_distribution=get_distribution,
+        top_k=request_data.topK,
+        min_confidence=request_data.minConfidence
+    )
+
+    def generate_lines():
+        name_offset = 0
+        for prediction_chunk in prediction_chunks:
+            chunk_names = request_data.names[name_offset:name_offset + len(prediction_chunk)]
+            name_offset += len(prediction_chunk)
+            yield [{name: prediction} for name, prediction in zip(chunk_names, prediction_chunk)]
+
+        update_name_quota(user_id, len(request_data.names))
+        increment_request_counter(user_id=user_id, model_id=model_id, name_amount=len(request_data.names))
+        current_app.logger.info(f"Successfully streamed classified names. [user-id: {user_id}, model-id: {model_id}]")
+
+    return ndjson_response(generate_lines())
+
+
 @inference_routes.route("/classify", methods=["POST"])
 @og.register_route(
     summary="Classify names.",
-    description="Classifying names using this endpoint will return the predicted confidence for the most likely ethnicity.",
+    description="Classifying names using this endpoint will return the predicted confidence for the most likely ethnicity. Set 'format' to 'columnar' to receive the classes once and the names, predicted class indices and confidences as arrays in input order. Send 'Accept: application/x-ndjson' to stream one '{name: result}' line per name instead. 'topK' and 'minConfidence' are only supported by '/classify-distribution'.",
     tags=["Classification"],
     requests=[og.OAIRequest("Request body for classification", InferenceSchema)],
     responses=[
         og.OAIResponse(200, "Successful classification", InferenceResponseSchema),
+        og.OAIResponse(400, "Unsupported parameters"),
         og.OAIResponse(401, "Authentication failed"),
         og.OAIResponse(404, "Model not found"),
         og.OAIResponse(422, "Too many names"),
@@ -39,31 +83,47 @@ def classification_route():
     check_user_restriction(user_id)
 
     request_data = InferenceSchema(**request.json)
+    if request_data.topK is not None or request_data.minConfidence is not None:
+        # only the most likely ethnicity is returned, so there is nothing to select
+        raise GeneralError(
+            error_code="UNSUPPORTED_PARAMETERS",
+            message="'topK' and 'minConfidence' are only supported by '/classify-distribution'.",
+            status_code=400
+        )
+
     model_id, classes = get_inference_model_info(user_id, request_data.modelName)
     check_name_amount_and_quota(user_id, len(request_data.names))
 
+    if wants_ndjson():
+        return stream_classification(user_id, model_id, classes, request_data, get_distribution=False)
+
     prediction = inference.predict(
         model_id=model_id,
         classes=classes,
         names=request_data.names,
         batch_size=int(current_app.config["BATCH_SIZE"]),
-        get_distribution=False
+        get_distribution=False,
+        columnar=request_data.format == "columnar"
     )
 
-    response_data = dict(zip(request_data.names, prediction))
-    InferenceResponseSchema(**response_data)
+    if request_data.format == "columnar":
+        response_data = {"names": request_data.names, **prediction}
+        validate_response(ColumnarInferenceResponseSchema, response_data)
+    else:
+        response_data = dict(zip(request_data.names, prediction))
+        validate_response(InferenceResponseSchema, response_data)
 
     update_name_quota(user_id, len(request_data.names))
     increment_request_counter(user_id=user_id, model_id=model_id, name_amount=len(request_data.names))
 
     current_app.logger.info(f"Successfully classified names. [user-id: {user_id}, model-id: {model_id}]")
-    return success_response(data=response_data)
+    return json_response(response_data)
   
 
 @inference_routes.route("/classify-distribution", methods=["POST"])
 @og.register_route(
     summary="Classify names, predicting entire distribution.",
-    description="Classifying names using this endpoint will return the predicted confidence for each ethnicity.",
+    description="Classifying names using this endpoint will return the predicted confidence for each ethnicity. Use 'topK' and/or 'minConfidence' to only return the most likely ethnicities of each name. Set 'format' to 'columnar' to receive the classes once and the names and confidence matrix (and the selected class indices) as arrays in input order. Send 'Accept: application/x-ndjson' to stream one '{name: result}' line per name instead.",
     tags=["Classification"],
     requests=[og.OAIRequest("Request body for classification", InferenceSchema)],
     responses=[
@@ -89,19 +149,153 @@ def classification_distribution_route():
     model_id, classes = get_inference_model_info(user_id, request_data.modelName)
     check_name_amount_and_quota(user_id, len(request_data.names))
 
+    if wants_ndjson():
+        return stream_classification(user_id, model_id, classes, request_data, get_distribution=True)
+
     prediction = inference.predict(
         model_id=model_id,
         classes=classes,
         names=request_data.names,
         batch_size=int(current_app.config["BATCH_SIZE"]),
-        get_distribution=True
+        get_distribution=True,
+        top_k=request_data.topK,
+        min_confidence=request_data.minConfidence,
+        columnar=request_data.format == "columnar"
     )
 
-    response_data = dict(zip(request_data.names, prediction))
-    InferenceDistributionResponseSchema(**response_data)
+    if request_data.format == "columnar":
+        response_data = {"names": request_data.names, **prediction}
+        validate_response(ColumnarInferenceDistributionResponseSchema, response_data)
+    else:
+        response_data = dict(zip(request_data.names, prediction))
+        validate_response(InferenceDistributionResponseSchema, response_data)
  
     update_name_quota(user_id, len(request_data.names))
     increment_request_counter(user_id=user_id, model_id=model_id, name_amount=len(request_data.names))
 
     current_app.logger.info(f"Successfully classified (distribution) names. [user-id: {user_id}, model-id: {model_id}]")
-    return success_response(data=response_data)
\ No newline at end of file
+    return json_response(response_data)
+
+
+@inference_routes.route("/classify-multi", methods=["POST"])
+@og.register_route(
+    summary="Classify names with multiple models.",
+    description="Classifying names using this endpoint will run every given model on the names and return the results keyed by model name. Up to 5 models can be used at once. Each name is charged once per model and counts once per model towards the maximum amount of names per request.",
+    tags=["Classification"],
+    requests=[og.OAIRequest("Request body for multi-model classification", MultiInferenceSchema)],
+    responses=[
+        og.OAIResponse(200, "Successful classification", MultiInferenceResponseSchema),
+        og.OAIResponse(401, "Authentication failed"),
+        og.OAIResponse(404, "Model not found"),
+        og.OAIResponse(422, "Too many names"),
+        og.OAIResponse(500, "Internal server error"),
+    ]
+)
+@jwt_required()
+@error_handler
+def multi_classification_route():
+    """ Route for classiying names into ethnicities using multiple models at once """
+
+    current_app.logger.info(f"Received multi-model classification request.")
+
+    user_id = get_jwt_identity()
+    check_user_existence(user_id)
+    check_user_restriction(user_id)
+
+    request_data = MultiInferenceSchema(**request.json)
+    model_names = list(dict.fromkeys(request_data.modelNames))
+    models = [get_inference_model_info(user_id, model_name) for model_name in model_names]
+    check_name_amount_and_quota(user_id, len(request_data.names), model_amount=len(models))
+
+    predictions = inference.predict_multi(
+        models=models,
+        names=request_data.names,
+        batch_size=int(current_app.config["BATCH_SIZE"]),
+        get_distribution=request_data.getDistribution
+    )
+
+    response_data = {
+        model_name: dict(zip(request_data.names, prediction))
+        for model_name, prediction in zip(model_names, predictions)
+    }
+    validate_response(MultiInferenceResponseSchema, response_data)
+
+    model_ids = [model_id for model_id, _ in models]
+    charge_multi_classification(user_id=user_id, model_ids=model_ids, name_amount=len(request_data.names))
+
+    current_app.logger.info(f"Successfully classified names with multiple models. [user-id: {user_id}, model-ids: {model_ids}]")
+    return json_response(response_data)
+
+
+@inference_routes.route("/classify-csv", methods=["POST"])
+@og.register_route(
+    summary="Classify the names of a CSV file.",
+    description="Upload a UTF-8 CSV file with a header row as multipart form data ('file') along with the form fields 'modelName', 'column' (header of the name column), 'getDistribution' (optional) and 'delimiter' (optional, default ','). The file is classified in chunks and returned as streamed CSV with appended prediction columns ('ethnicity' and 'confidence', or one column per class when getting the distribution). If classification fails mid-stream, the file ends with a row starting with '#ERROR'.",
+    tags=["Classification"],
+    responses=[
+        og.OAIResponse(200, "Successful classification (CSV)"),
+        og.OAIResponse(401, "Authentication failed"),
+        og.OAIResponse(404, "Model not found"),
+        og.OAIResponse(405, "Too many names"),
+        og.OAIResponse(422, "Invalid CSV file"),
+        og.OAIResponse(500, "Internal server error"),
+    ]
+)
+@jwt_required()
+@error_handler
+def csv_classification_route():
+    """ Route for classiying the names of an uploaded CSV file """
+
+    current_app.logger.info(f"Received CSV classification request.")
+
+    user_id = get_jwt_identity()
+    check_user_existence(user_id)
+    check_user_restriction(user_id)
+
+    file = request.files.get("file")
+    if not file:
+        raise GeneralError(
+            error_code="CSV_MISSING",
+            message="No CSV file uploaded (form field 'file').",
+            status_code=422
+        )
+
+    request_data = CsvInferenceSchema(**request.form.to_dict())
+    model_id, classes = get_inference_model_info(user_id, request_data.modelName)
+
+    # first pass over the spooled upload only counts the names, so the quota is checked before classifying anything
+    header, column_idx, name_amount = inspect_csv(file, request_data.column, request_data.delimiter)
+    check_name_amount_and_quota(user_id, name_amount)
+
+    batch_size = int(current_app.config["BATCH_SIZE"])
+    rows = read_csv_rows(file, request_data.delimiter)
+    next(rows)
+
+    # the rows are read once, 'tee' only buffers the chunk which is currently classified
+    row_chunks, name_source_chunks = itertools.tee(iter_chunks(rows, batch_size))
+    prediction_chunks = inference.predict_chunks(
+        model_id=model_id,
+        classes=classes,
+        name_chunks=([row[column_idx] if column_idx < len(row) else "" for row in chunk] for chunk in name_source_chunks),
+        batch_size=batch_size,
+        get_distribution=request_data.getDistribution
+    )
+
+    def generate_rows():
+        prediction_header = classes if request_data.getDistribution else ["ethnicity", "confidence"]
+        yield [header + prediction_header]
+
+        for row_chunk, prediction_chunk in zip(row_chunks, prediction_chunks):
+            # pad short rows, so the prediction columns stay aligned with the header
+            row_chunk = [row + [""] * (len(header) - len(row)) for row in row_chunk]
+            if request_data.getDistribution:
+                yield [row + [distribution[ethnicity] for ethnicity in classes] for row, distribution in zip(row_chunk, prediction_chunk)]
+            else:
+                yield [row + list(prediction) for row, prediction in zip(row_chunk, prediction_chunk)]
+
+        update_name_quota(user_id, name_amount)
+        increment_request_counter(user_id=user_id, model_id=model_id, name_amount=name_amount)
+        current_app.logger.info(f"Successfully classified CSV names. [user-id: {user_id}, model-id: {model_id}]")
+
+    filename = (secure_filename(file.filename or "").rsplit(".", 1)[0] or "names") + "-classified.csv"
+    return csv_response(generate_rows(), filename)
@@ -0,0 +1,121 @@
+from errors import GeneralError, error_handler
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_spec_gen import openapi_generator as og
+from schemas.job_schema import AddJobFileSchema, AddJobSchema, JobResponseSchema
+from services.inference_services import inspect_csv, read_csv_rows
+from services.job_services import add_job, get_job, get_job_result_chunks, job_to_dict
+from services.user_services import check_user_existence, check_user_restriction
+from utils import ndjson_response, success_response
+
+
+job_routes = Blueprint("jobs", __name__)
+
+
+@job_routes.route("/jobs", methods=["POST"])
+@og.register_route(
+    summary="Submit a bulk classification job.",
+    description="Submits a large amount of names for classification in the background, either as JSON or, for large jobs, as a UTF-8 CSV file with a header row uploaded as multipart form data ('file') along with the form fields 'modelName', 'column' (header of the name column), 'getDistribution' (optional) and 'delimiter' (optional, default ','). The names are classified in chunks and every completed chunk is charged to the daily quota. When the quota is exhausted, the job pauses and continues the next day. Poll the job status and download the results once it is completed. Finished jobs and their results are deleted after a retention period.",
+    tags=["Bulk Classification"],
+    requests=[og.OAIRequest("Request body for a bulk classification job", AddJobSchema)],
+    responses=[
+        og.OAIResponse(202, "Successfully submitted job", JobResponseSchema),
+        og.OAIResponse(401, "Authentication failed"),
+        og.OAIResponse(404, "Model not found"),
+        og.OAIResponse(405, "Too many names"),
+        og.OAIResponse(413, "Request too large"),
+        og.OAIResponse(422, "Invalid CSV file"),
+        og.OAIResponse(500, "Internal server error"),
+    ]
+)
+@jwt_required()
+@error_handler
+def add_job_route():
+    """ Route for submitting bulk classification jobs """
+
+    current_app.logger.info(f"Received job submission request.")
+
+    user_id = get_jwt_identity()
+    check_user_existence(user_id)
+    check_user_restriction(user_id)
+
+    if request.mimetype == "multipart/form-data":
+        file = request.files.get("file")
+        if not file:
+            raise GeneralError(
+                error_code="CSV_MISSING",
+                message="No CSV file uploaded (form field 'file').",
+                status_code=422
+            )
+
+        request_data = AddJobFileSchema(**request.form.to_dict())
+
+        # the whole file is parsed once before uploading any chunk, the names are then read lazily from the spooled upload
+        _, column_idx, _ = inspect_csv(file, request_data.column, request_data.delimiter)
+        rows = read_csv_rows(file, request_data.delimiter)
+        next(rows)
+        names = (row[column_idx] if column_idx < len(row) else "" for row in rows)
+    else:
+        request_data = AddJobSchema(**request.json)
+        names = request_data.names
+
+    job_data = add_job(user_id, request_data.modelName, names, request_data.getDistribution)
+    JobResponseSchema(**job_data)
+
+    current_app.logger.info(f"Successfully submitted job. [user-id: {user_id}, job-id: {job_data['jobId']}]")
+    return success_response(data=job_data, status_code=202)
+
+
+@job_routes.route("/jobs/<job_id>", methods=["GET"])
+@og.register_route(
+    summary="Get the status of a bulk classification job.",
+    description="Using this endpoint you can poll the status and progress of a bulk classification job.",
+    tags=["Bulk Classification"],
+    responses=[
+        og.OAIResponse(200, "Successfully retrieved job", JobResponseSchema),
+        og.OAIResponse(401, "Authentication failed"),
+        og.OAIResponse(404, "Job not found"),
+        og.OAIResponse(500, "Internal server error"),
+    ]
+)
+@jwt_required()
+@error_handler
+def get_job_route(job_id: str):
+    """ Route for requesting the status of a bulk classification job """
+
+    user_id = get_jwt_identity()
+    check_user_existence(user_id)
+
+    job_data = job_to_dict(get_job(user_id, job_id))
+    JobResponseSchema(**job_data)
+
+    return success_response(data=job_data)
+
+
+@job_routes.route("/jobs/<job_id>/results", methods=["GET"])
+@og.register_route(
+    summary="Download the results of a bulk classification job.",
+    description="Streams the results of a completed bulk classification job as newline-delimited JSON, one '{name: result}' line per name in input order.",
+    tags=["Bulk Classification"],
+    responses=[
+        og.OAIResponse(200, "Successfully streamed job results"),
+        og.OAIResponse(401, "Authentication failed"),
+        og.OAIResponse(404, "Job not found"),
+        og.OAIResponse(409, "Job not completed yet"),
+        og.OAIResponse(500, "Internal server error"),
+    ]
+)
+@jwt_required()
+@error_handler
+def get_job_results_route(job_id: str):
+    """ Route for downloading the results of a bulk classification job """
+
+    current_app.logger.info(f"Received job result request.")
+
+    user_id = get_jwt_identity()
+    check_user_existence(user_id)
+
+    result_chunks = get_job_result_chunks(user_id, job_id)
+
+    current_app.logger.info(f"Streaming job results. [user-id: {user_id}, job-id: {job_id}]")
+    return ndjson_response(result_chunks)
@@ -1,15 +1,29 @@
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
+import hashlib
+import logging
 import os
+import stat
+import shutil
+import threading
+import time
+from typing import Iterable
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 import json
 import pickle
+from monitoring import s3_cache_bytes_counter, s3_cache_hits_counter, s3_cache_misses_counter, s3_cache_revalidations_counter
+from utils import atomic_write
 
 
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class S3Config:
     minio_user: str = os.getenv("MINIO_USER")
@@ -18,12 +32,199 @@ class S3Config:
     minio_port: str = os.getenv("MINIO_PORT")
     model_bucket: str = os.getenv("MODEL_S3_BUCKET")
     base_data_bucket: str = os.getenv("BASE_DATA_S3_BUCKET")
+    job_bucket: str = os.getenv("JOB_S3_BUCKET", "jobs")
     base_model: str = os.getenv("BASE_MODEL")
+    max_pool_connections: int = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+    connect_timeout_seconds: float = float(os.getenv("S3_CONNECT_TIMEOUT_SECONDS", 2))
+    read_timeout_seconds: float = float(os.getenv("S3_READ_TIMEOUT_SECONDS", 10))
+    max_attempts: int = int(os.getenv("S3_MAX_ATTEMPTS", 5))
+    retry_mode: str = os.getenv("S3_RETRY_MODE", "adaptive")
+    fetch_threads: int = int(os.getenv("S3_FETCH_THREADS", 8))
+    base_data_cache_ttl_seconds: float = float(os.getenv("BASE_DATA_S3_CACHE_TTL_SECONDS", 300))
+    model_cache_ttl_seconds: float = float(os.getenv("MODEL_S3_CACHE_TTL_SECONDS", 0))
+    job_cache_ttl_seconds: float = float(os.getenv("JOB_S3_CACHE_TTL_SECONDS", 0))
+    memory_cache_max_entries: int = int(os.getenv("S3_MEMORY_CACHE_MAX_ENTRIES", 128))
+    disk_cache_dir: str = os.getenv("S3_DISK_CACHE_DIR", "/tmp/n2e-s3-cache")
+    disk_cache_max_mb: float = float(os.getenv("S3_DISK_CACHE_MAX_MB", 256))
+
+    def get_cache_ttl(self, bucket_name: str) -> float:
+        """
+        Returns how long objects of a bucket are served from the read-through cache before being revalidated.
+        :param bucket_name: Name of the bucket
+        :return: TTL in seconds, 0 if objects of the bucket are not cached
+        """
+
+        return {
+            self.base_data_bucket: self.base_data_cache_ttl_seconds,
+            self.model_bucket: self.model_cache_ttl_seconds,
+            self.job_bucket: self.job_cache_ttl_seconds,
+        }.get(bucket_name, 0)
 
 
 bucket_config = S3Config()
 
 
+@dataclass
+class CachedObject:
+    value: object
+    etag: str | None
+    size: int
+    expires_at: float
+
+
+@dataclass
+class StoredObject:
+    body: bytes
+    etag: str | None
+    age: float
+
+
+class S3ObjectCache:
+    """
+    Storage of the read-through cache of 'S3Handler.get' with two tiers: a small in-memory LRU cache of decoded objects
+    per process and a bounded disk cache of the raw objects, which is shared by all processes of the host.
+    The disk tier is best-effort: it is skipped when it fails or when its directory is not private to the current user,
+    as '.pickle' objects read from it are unpickled.
+    """
+
+    def __init__(self, max_entries: int, disk_dir: str, disk_max_bytes: int):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[tuple[str, str], CachedObject] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_memory(self, bucket_name: str, object_key: str) -> CachedObject | None:
+        with self._lock:
+            entry = self._entries.get((bucket_name, object_key))
+            if entry:
+                self._entries.move_to_end((bucket_name, object_key))
+            return entry
+
+    def put_memory(self, bucket_name: str, object_key: str, entry: CachedObject):
+        with self._lock:
+            self._entries[(bucket_name, object_key)] = entry
+            self._entries.move_to_end((bucket_name, object_key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_disk(self, bucket_name: str, object_key: str) -> StoredObject | None:
+        """
+        Reads an object from the disk tier.
+        :param bucket_name: Name of the bucket
+        :param object_key: Key of the object
+        :return: The raw object, its ETag and the seconds since it was fetched or revalidated, None if not stored
+        """
+
+        if not self._check_disk_dir(create=False):
+            return None
+
+        path = self._get_disk_path(bucket_name, object_key)
+        try:
+            with open(path, "rb") as file:
+                age = time.time() - os.fstat(file.fileno()).st_mtime
+                etag = file.readline().rstrip(b"\n").decode() or None
+                return StoredObject(file.read(), etag, age)
+        except FileNotFoundError:
+            return None
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning(f"Could not read '{bucket_name}/{object_key}' from the S3 disk cache: {e}")
+            return None
+
+    def put_disk(self, bucket_name: str, object_key: str, body: bytes, etag: str | None):
+        if len(body) > self.disk_max_bytes or not self._check_disk_dir(create=True):
+            return
+
+        path = self._get_disk_path(bucket_name, object_key)
+        try:
+            with atomic_write(path) as file:
+                file.write(f"{etag or ''}\n".encode())
+                file.write(body)
+
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Could not write '{bucket_name}/{object_key}' to the S3 disk cache: {e}")
+
+    def touch_disk(self, bucket_name: str, object_key: str):
+        """ Marks an object of the disk tier as revalidated """
+
+        try:
+            os.utime(self._get_disk_path(bucket_name, object_key))
+        except OSError:
+            pass
+
+    def invalidate(self, bucket_name: str, object_key: str):
+        with self._lock:
+            self._entries.pop((bucket_name, object_key), None)
+        try:
+            os.remove(self._get_disk_path(bucket_name, object_key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove '{bucket_name}/{object_key}' from the S3 disk cache: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        shutil.rmtree(self.disk_dir, ignore_errors=True)
+
+    def _check_disk_dir(self, create: bool) -> bool:
+        """
+        Checks that the directory of the disk tier is a directory owned by the current user which nobody else can write
+        to, eg. not created by another user of the host in a shared location like '/tmp'.
+        :param create: Whether to create the directory (with mode 0700) if it does not exist
+        :return: Whether the disk tier can be used
+        """
+
+        try:
+            if create:
+                os.makedirs(self.disk_dir, mode=0o700, exist_ok=True)
+            dir_stat = os.lstat(self.disk_dir)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"S3 disk cache directory '{self.disk_dir}' is not usable: {e}")
+            return False
+
+        if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.getuid() or dir_stat.st_mode & 0o077:
+            logger.warning(f"S3 disk cache directory '{self.disk_dir}' is not private to the current user, skipping the disk tier.")
+            return False
+        return True
+
+    def _get_disk_path(self, bucket_name: str, object_key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(f"{bucket_name}/{object_key}".encode()).hexdigest())
+
+    def _evict_disk(self):
+        """ Removes the least recently revalidated objects from the disk tier until it fits into its budget """
+
+        stored_files = []
+        for file_name in os.listdir(self.disk_dir):
+            if file_name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, file_name))
+            except FileNotFoundError:
+                continue
+            stored_files.append((stat.st_mtime, stat.st_size, file_name))
+
+        size = sum(file_size for _, file_size, _ in stored_files)
+        for _, file_size, file_name in sorted(stored_files):
+            if size <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, file_name))
+            except FileNotFoundError:
+                pass
+            size -= file_size
+
+
+s3_cache = S3ObjectCache(
+    max_entries=bucket_config.memory_cache_max_entries,
+    disk_dir=bucket_config.disk_cache_dir,
+    disk_max_bytes=int(bucket_config.disk_cache_max_mb * 1024 ** 2)
+)
+
+
 class S3Handler:
     _instance = None
 
@@ -38,13 +239,23 @@ class S3Handler:
             "s3",
             aws_access_key_id=bucket_config.minio_user,
             aws_secret_access_key=bucket_config.minio_password,
-            endpoint_url=f"{bucket_config.minio_host}:{bucket_config.minio_port}"
+            endpoint_url=f"{bucket_config.minio_host}:{bucket_config.minio_port}",
+            config=Config(
+                max_pool_connections=bucket_config.max_pool_connections,
+                connect_timeout=bucket_config.connect_timeout_seconds,
+                read_timeout=bucket_config.read_timeout_seconds,
+                retries={"max_attempts": bucket_config.max_attempts, "mode": bucket_config.retry_mode}
+            )
         )
 
     @classmethod
     def instance(cls):
         return cls()
 
+    @classmethod
+    def reset(cls):
+        cls._instance = None
+
     @classmethod
     def upload(cls, bucket_name: str, body: str, object_key: str):
         cls.instance()._client.put_object(
@@ -52,23 +263,177 @@ class S3Handler:
             Bucket=bucket_name,
             Key=object_key,
         )
+        s3_cache.invalidate(bucket_name, object_key)
+
+    @classmethod
+    def upload_many(cls, bucket_name: str, objects: Iterable[tuple[str, str]]) -> int:
+        """
+        Uploads several objects concurrently (see 'upload'), using up to 'S3_FETCH_THREADS' connections of the pool.
+        The objects are consumed lazily, so only a few of them are held in memory at once.
+        :param bucket_name: Name of the bucket
+        :param objects: (object key, body) tuples
+        :return: Amount of uploaded objects
+        """
+
+        uploaded_amount = 0
+        with ThreadPoolExecutor(max_workers=bucket_config.fetch_threads) as executor:
+            pending = set()
+            for object_key, body in objects:
+                if len(pending) >= 2 * bucket_config.fetch_threads:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(cls.upload, bucket_name, body, object_key))
+                uploaded_amount += 1
+
+            for future in pending:
+                future.result()
+
+        return uploaded_amount
+
+    @classmethod
+    def delete_prefix(cls, bucket_name: str, prefix: str):
+        """
+        Deletes all objects whose key starts with a prefix.
+        :param bucket_name: Name of the bucket
+        :param prefix: Prefix of the object keys
+        """
+
+        client = cls.instance()._client
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket_name, Prefix=prefix):
+            object_keys = [obj["Key"] for obj in page.get("Contents", [])]
+            if not object_keys:
+                continue
+
+            client.delete_objects(Bucket=bucket_name, Delete={"Objects": [{"Key": object_key} for object_key in object_keys], "Quiet": True})
+            for object_key in object_keys:
+                s3_cache.invalidate(bucket_name, object_key)
 
     @classmethod
-    def get(cls, bucket_name: str, object_key: str):    
+    def get(cls, bucket_name: str, object_key: str):
+        """
+        Fetches an object and decodes '.json' and '.pickle' files. Objects of buckets with a cache TTL are served
+        from the read-through cache, ie. they are shared between callers and must not be modified.
+        :param bucket_name: Name of the bucket
+        :param object_key: Key of the object
+        :return: The (decoded) object or None if it does not exist
+        """
+
+        ttl = bucket_config.get_cache_ttl(bucket_name)
+        if ttl > 0:
+            return cls._get_cached(bucket_name, object_key, ttl)
+
         try:
             response = cls.instance()._client.get_object(Bucket=bucket_name, Key=object_key)
-            body = response["Body"].read()
-            
-            if object_key.endswith(".json"):
-                return json.loads(body)
-            elif object_key.endswith(".pickle"):
-                return pickle.loads(body)
-            return body
+            return cls._decode(object_key, response["Body"].read())
         except ClientError as e:
             if e.response["Error"]["Code"] == "NoSuchKey":
                 return None
             raise
 
+    @classmethod
+    def get_version(cls, bucket_name: str, object_key: str, etag: str) -> bytes | None:
+        """
+        Fetches the raw object, but only if it still has the given ETag (conditional GET, not cached).
+        :param bucket_name: Name of the bucket
+        :param object_key: Key of the object
+        :param etag: Expected ETag of the object
+        :return: The raw object or None if it changed or does not exist
+        """
+
+        try:
+            response = cls.instance()._client.get_object(Bucket=bucket_name, Key=object_key, IfMatch=etag)
+            return response["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "412", "PreconditionFailed"):
+                return None
+            raise
+
+    @classmethod
+    def get_many(cls, bucket_name: str, object_keys: list[str]) -> list:
+        """
+        Fetches several objects concurrently (see 'get'), using up to 'S3_FETCH_THREADS' connections of the pool.
+        :param bucket_name: Name of the bucket
+        :param object_keys: Keys of the objects
+        :return: The (decoded) objects in the order of 'object_keys', None for objects which do not exist
+        """
+
+        if len(object_keys) <= 1:
+            return [cls.get(bucket_name, object_key) for object_key in object_keys]
+
+        with ThreadPoolExecutor(max_workers=min(bucket_config.fetch_threads, len(object_keys))) as executor:
+            return list(executor.map(lambda object_key: cls.get(bucket_name, object_key), object_keys))
+
+    @classmethod
+    def _get_cached(cls, bucket_name: str, object_key: str, ttl: float):
+        """
+        Serves an object from the memory tier, then from the disk tier, as long as it is younger than 'ttl'.
+        Expired objects are revalidated with a conditional GET, so unchanged objects are not transferred again.
+        """
+
+        entry = s3_cache.get_memory(bucket_name, object_key)
+        if entry and entry.expires_at > time.monotonic():
+            s3_cache_hits_counter.labels("memory").inc()
+            s3_cache_bytes_counter.labels("memory").inc(entry.size)
+            return entry.value
+
+        stored = s3_cache.get_disk(bucket_name, object_key)
+        if stored and stored.age < ttl:
+            value = entry.value if entry and entry.etag == stored.etag else cls._decode(object_key, stored.body)
+            s3_cache.put_memory(bucket_name, object_key, CachedObject(value, stored.etag, len(stored.body), time.monotonic() + ttl - stored.age))
+            s3_cache_hits_counter.labels("disk").inc()
+            s3_cache_bytes_counter.labels("disk").inc(len(stored.body))
+            return value
+
+        etag = stored.etag if stored else entry.etag if entry else None
+        try:
+            conditions = {"IfNoneMatch": etag} if etag else {}
+            response = cls.instance()._client.get_object(Bucket=bucket_name, Key=object_key, **conditions)
+        except ClientError as e:
+            error_code = e.response["Error"]["Code"]
+            if error_code == "NoSuchKey":
+                s3_cache.invalidate(bucket_name, object_key)
+                return None
+            if error_code not in ("304", "NotModified"):
+                raise
+
+            value = entry.value if entry and entry.etag == etag else cls._decode(object_key, stored.body)
+            size = len(stored.body) if stored else entry.size
+            s3_cache.touch_disk(bucket_name, object_key)
+            s3_cache.put_memory(bucket_name, object_key, CachedObject(value, etag, size, time.monotonic() + ttl))
+            s3_cache_revalidations_counter.labels("unchanged").inc()
+            return value
+
+        body = response["Body"].read()
+        value = cls._decode(object_key, body)
+        s3_cache.put_disk(bucket_name, object_key, body, response.get("ETag"))
+        s3_cache.put_memory(bucket_name, object_key, CachedObject(value, response.get("ETag"), len(body), time.monotonic() + ttl))
+
+        if etag:
+            s3_cache_revalidations_counter.labels("modified").inc()
+        else:
+            s3_cache_misses_counter.inc()
+        s3_cache_bytes_counter.labels("s3").inc(len(body))
+        return value
+
+    @staticmethod
+    def _decode(object_key: str, body: bytes):
+        if object_key.endswith(".json"):
+            return json.loads(body)
+        elif object_key.endswith(".pickle"):
+            return pickle.loads(body)
+        return body
+
+    @classmethod
+    def get_etag(cls, bucket_name: str, object_key: str) -> str | None:
+        try:
+            response = cls.instance()._client.head_object(Bucket=bucket_name, Key=object_key)
+            return response["ETag"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+
     @classmethod
     def check_file_existence(cls, bucket_name: str, object_key: str) -> bool:
         try:
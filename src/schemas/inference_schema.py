@@ -1,10 +1,14 @@
-from pydantic import BaseModel, RootModel
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, RootModel
 
 
 class InferenceSchema(BaseModel):
     """ Schema to validate name classification request data """
     modelName: str
     names: list[str]
+    topK: Optional[int] = Field(default=None, ge=1)
+    minConfidence: Optional[float] = Field(default=None, ge=0, le=100)
+    format: Literal["default", "columnar"] = "default"
 
     class Config:
         json_schema_extra = {
@@ -39,4 +43,93 @@ class InferenceDistributionResponseSchema(RootModel):
                 "werner heisenberg": {"chinese": 0.06, "german": 0.87, "french": 0.07},
                 "Jules Verne": {"chinese": 0.2, "german": 0.13, "french": 0.75},
             }
-        }
\ No newline at end of file
+        }
+
+class CsvInferenceSchema(BaseModel):
+    """ Schema to validate the form data of a CSV classification request """
+    modelName: str
+    column: str
+    getDistribution: bool = False
+    delimiter: str = Field(default=",", min_length=1, max_length=1)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "modelName": "chinese_german_french",
+                "column": "name",
+                "getDistribution": False,
+                "delimiter": ","
+            }
+        }
+
+
+class ColumnarInferenceResponseSchema(BaseModel):
+    """ Schema to validate the /classify POST response data in the columnar format """
+    classes: list[str]
+    names: list[str]
+    predictions: list[int]
+    confidences: list[float]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "classes": ["chinese", "french", "german"],
+                "names": ["Cixin Liu", "werner heisenberg", "Jules Verne"],
+                "predictions": [0, 2, 1],
+                "confidences": [0.91, 0.87, 0.75]
+            }
+        }
+
+
+class ColumnarInferenceDistributionResponseSchema(BaseModel):
+    """ Schema to validate the /classify-distribution POST response data in the columnar format """
+    classes: list[str]
+    names: list[str]
+    classIndices: Optional[list[list[int]]] = None
+    confidences: list[list[float]]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "classes": ["chinese", "french", "german"],
+                "names": ["Cixin Liu", "werner heisenberg", "Jules Verne"],
+                "confidences": [[0.91, 0.04, 0.05], [0.06, 0.07, 0.87], [0.2, 0.75, 0.13]]
+            }
+        }
+
+
+class MultiInferenceSchema(BaseModel):
+    """ Schema to validate multi-model name classification request data """
+    modelNames: list[str] = Field(min_length=1, max_length=5)
+    names: list[str]
+    getDistribution: bool = False
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "modelNames": ["chinese_german_french", "8_nationality_groups"],
+                "names": ["Cixin Liu", "werner heisenberg", "Jules Verne"],
+                "getDistribution": False
+            }
+        }
+
+
+class MultiInferenceResponseSchema(RootModel):
+    """ Schema to validate the /classify-multi POST response data """
+    root: dict[str, dict[str, tuple[str, float]] | dict[str, dict[str, float]]]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "chinese_german_french": {
+                    "Cixin Liu": ["chinese", 0.91],
+                    "werner heisenberg": ["german", 0.87],
+                    "Jules Verne": ["french", 0.75]
+                },
+                "8_nationality_groups": {
+                    "Cixin Liu": ["eastAsian", 0.95],
+                    "werner heisenberg": ["european", 0.93],
+                    "Jules Verne": ["european", 0.89]
+                }
+            }
+        }
@@ -0,0 +1,66 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class AddJobSchema(BaseModel):
+    """ Schema to validate the /jobs POST request data """
+    modelName: str
+    names: list[str]
+    getDistribution: bool = False
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "modelName": "chinese_german_french",
+                "names": ["Cixin Liu", "werner heisenberg", "Jules Verne"],
+                "getDistribution": False
+            }
+        }
+
+
+class AddJobFileSchema(BaseModel):
+    """ Schema to validate the form data of a /jobs POST request with an uploaded CSV file """
+    modelName: str
+    column: str
+    getDistribution: bool = False
+    delimiter: str = Field(default=",", min_length=1, max_length=1)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "modelName": "chinese_german_french",
+                "column": "name",
+                "getDistribution": False,
+                "delimiter": ","
+            }
+        }
+
+
+class JobResponseSchema(BaseModel):
+    """ Schema to validate the /jobs POST and /jobs/<job_id> GET response data """
+    jobId: str
+    status: str
+    nameAmount: int
+    processedNames: int
+    chunkAmount: int
+    completedChunks: int
+    progress: float
+    error: Optional[str] = None
+    creationTime: str
+    updatedTime: str
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "jobId": "4f1c2a9e8b7d4c3a9e1f2b3c4d5e6f70",
+                "status": "running",
+                "nameAmount": 1000000,
+                "processedNames": 250000,
+                "chunkAmount": 100,
+                "completedChunks": 25,
+                "progress": 25.0,
+                "error": None,
+                "creationTime": "2025-01-01T07:21:00",
+                "updatedTime": "2025-01-01T07:24:13"
+            }
+        }
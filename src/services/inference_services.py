@@ -1,8 +1,17 @@
+import codecs
+import csv
+import gc
+import time
+from typing import Iterator
 from flask import current_app
+from werkzeug.datastructures import FileStorage
 from datetime import date
 from db.tables import  Model, User, UserQuota, UserToModel
 from db.database import db
 from errors import GeneralError
+from inference import inference
+from monitoring import model_preload_duration_gauge, preloaded_models_gauge
+from s3 import S3Handler
 
 
 def increment_request_counter(user_id: str, model_id: str, name_amount: int):
@@ -29,25 +38,39 @@ def increment_request_counter(user_id: str, model_id: str, name_amount: int):
         db.session.commit()
     
 
-def check_name_amount_and_quota(user_id: str, name_amount: int):
+def check_name_amount_and_quota(user_id: str, name_amount: int, model_amount: int=1):
     """
     Checks if a user's classification request contains too many names or exceeds the daily quota limit.
     If its the first check of the day, reset the counter to 0,
     
     :param user_id: The user making the request.
     :param name_amount: The number of names to classify in the current request.
+    :param model_amount: The number of models classifying each name, every name is charged once per model.
     """
 
     max_names = int(current_app.config["MAX_NAMES"])
-    daily_limit = int(current_app.config["DAILY_QUOTA"])
 
-    if name_amount > max_names:
+    if name_amount * model_amount > max_names:
         raise GeneralError(
             error_code="TOO_MANY_NAMES",
-            message=f"Too many names (maximum {max_names}).",
+            message=f"Too many names (maximum {max_names}, counted once per model).",
             status_code=405
         )
 
+    check_quota(user_id, name_amount * model_amount)
+
+
+def check_quota(user_id: str, name_amount: int):
+    """
+    Checks if classifying names exceeds a user's daily quota limit, without limiting the names per request
+    (eg. for the chunks of bulk classification jobs). If its the first check of the day, reset the counter to 0.
+
+    :param user_id: The user making the request.
+    :param name_amount: The number of names which are charged.
+    """
+
+    daily_limit = int(current_app.config["DAILY_QUOTA"])
+
     today = date.today()
     user_quota = UserQuota.query.filter_by(user_id=user_id).first()
 
@@ -81,3 +104,105 @@ def update_name_quota(user_id: str, name_amount: int):
     db.session.add(user_quota)
     db.session.commit()
 
+
+def charge_multi_classification(user_id: str, model_ids: list[str], name_amount: int):
+    """
+    Charges a multi-model classification request: updates the user's name quota once per name per model
+    and increments the request counters of the user and of every model, all in a single transaction.
+
+    :param user_id: The user making the request.
+    :param model_ids: The models which classified the names.
+    :param name_amount: The number of names classified by each model.
+    """
+
+    charged_name_amount = name_amount * len(model_ids)
+
+    user_quota = UserQuota.query.filter_by(user_id=user_id).first()
+    user_quota.name_count += charged_name_amount
+
+    user = User.query.filter_by(id=user_id).first()
+    user.request_count += 1
+    user.names_classified += charged_name_amount
+
+    for model in Model.query.filter(Model.id.in_(model_ids)).all():
+        model.request_count += 1
+
+    for model_id in set(model_ids):
+        user_to_model = UserToModel.query.filter_by(user_id=user_id, model_id=model_id).first()
+        if user_to_model:
+            user_to_model.request_count += 1
+
+    db.session.commit()
+
+
+def read_csv_rows(file: FileStorage, delimiter: str=",") -> Iterator[list[str]]:
+    """
+    Parses an uploaded CSV file row by row, straight from the (spooled) upload instead of loading it into memory.
+    Every call starts reading from the beginning of the file again.
+
+    :param file: The uploaded CSV file (UTF-8)
+    :param delimiter: The column delimiter
+    :return: Iterator over the rows, including the header
+    """
+
+    file.stream.seek(0)
+    return csv.reader(codecs.iterdecode(file.stream, "utf-8-sig"), delimiter=delimiter)
+
+
+def inspect_csv(file: FileStorage, column: str, delimiter: str=",") -> tuple[list[str], int, int]:
+    """
+    Reads the header of an uploaded CSV file, finds the name column and counts the rows to classify.
+
+    :param file: The uploaded CSV file (UTF-8) with a header row
+    :param column: The header of the column which contains the names
+    :param delimiter: The column delimiter
+    :return: Tuple of (header, index of the name column, amount of rows without the header)
+    """
+
+    try:
+        rows = read_csv_rows(file, delimiter)
+        header = next(rows, None)
+        row_amount = sum(1 for _ in rows)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise GeneralError(
+            error_code="CSV_INVALID",
+            message=f"CSV file could not be parsed ({e}).",
+            status_code=422
+        )
+
+    if not header or column not in header:
+        raise GeneralError(
+            error_code="COLUMN_NOT_FOUND",
+            message=f"Column '{column}' does not exist in the CSV header.",
+            status_code=422
+        )
+
+    return header, header.index(column), row_amount
+
+
+def preload_public_models():
+    """
+    Loads all public and trained models into the model cache. Meant to run in the gunicorn master
+    before forking, so that the workers share the model weights copy-on-write and serve the first request warm.
+    """
+
+    start_time = time.perf_counter()
+
+    public_models = Model.query.filter_by(is_public=True, is_trained=True).all()
+    preloaded_amount = inference.preload_models([(model.id, model.nationalities) for model in public_models])
+
+    duration = time.perf_counter() - start_time
+    preloaded_models_gauge.set(preloaded_amount)
+    model_preload_duration_gauge.set(duration)
+
+    # Connections must not be shared with the forked workers, they create their own ones lazily
+    db.session.remove()
+    db.engine.dispose()
+    S3Handler.reset()
+
+    # Keep the preloaded objects out of the garbage collector so the workers don't touch (and copy) their pages
+    gc.freeze()
+
+    current_app.logger.info(f"Preloaded {preloaded_amount}/{len(public_models)} public models in {duration:.2f} seconds.")
+    if preloaded_amount < len(public_models):
+        current_app.logger.warning(f"{len(public_models) - preloaded_amount} public models failed to preload, they are loaded on their first request.")
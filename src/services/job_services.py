@@ -0,0 +1,347 @@
+import datetime
+import json
+import uuid
+from typing import Iterable, Iterator
+from flask import current_app
+from sqlalchemy import and_, or_, update
+from db.tables import ClassificationJob, JobStatus, Model, User, UserQuota, UserToModel
+from db.database import db
+from errors import GeneralError
+from inference import inference
+from s3 import S3Handler, bucket_config
+from services.inference_services import check_quota
+from services.model_services import get_inference_model_info
+from utils import iter_chunks
+
+
+def get_chunk_key(job_id: str, kind: str, chunk_idx: int) -> str:
+    """
+    Creates the S3 object key of an input or output chunk of a job.
+    :param job_id: The job ID
+    :param kind: Either "input" or "output"
+    :param chunk_idx: Index of the chunk
+    :return: Object key inside the job bucket
+    """
+
+    return f"{job_id}/{kind}/{chunk_idx:06d}.json"
+
+
+def job_to_dict(job: ClassificationJob) -> dict:
+    """
+    Turns a job into its API representation.
+    :param job: The job
+    :return: Job data
+    """
+
+    return {
+        "jobId": job.id,
+        "status": job.status,
+        "nameAmount": job.name_amount,
+        "processedNames": job.processed_names,
+        "chunkAmount": job.chunk_amount,
+        "completedChunks": job.completed_chunks,
+        "progress": round(100 * job.processed_names / job.name_amount, 2) if job.name_amount else 100.0,
+        "error": job.error,
+        "creationTime": job.creation_time.isoformat(),
+        "updatedTime": job.updated_time.isoformat()
+    }
+
+
+def add_job(user_id: str, model_name: str, names: Iterable[str], get_distribution: bool=False) -> dict:
+    """
+    Stores the names of a bulk classification job in chunks and queues the job for the job workers.
+    The names are read lazily and every chunk is uploaded concurrently as soon as it is complete,
+    so large uploads are never held in memory at once.
+    :param user_id: The user submitting the job
+    :param model_name: Name of the model classifying the names
+    :param names: The names to classify, eg. read from an uploaded file
+    :param get_distribution: Wether to classify the names with their whole ethnicity distribution
+    :return: Job data
+    """
+
+    model_id, _ = get_inference_model_info(user_id, model_name)
+
+    job_id = uuid.uuid4().hex
+    max_job_names = int(current_app.config["MAX_JOB_NAMES"])
+    name_amount = 0
+
+    def input_chunks() -> Iterator[tuple[str, str]]:
+        nonlocal name_amount
+        for chunk_idx, chunk in enumerate(iter_chunks(names, int(current_app.config["JOB_CHUNK_SIZE"]))):
+            name_amount += len(chunk)
+            if name_amount > max_job_names:
+                raise GeneralError(
+                    error_code="TOO_MANY_NAMES",
+                    message=f"Too many names (maximum {max_job_names}).",
+                    status_code=405
+                )
+            yield get_chunk_key(job_id, "input", chunk_idx), json.dumps(chunk)
+
+    try:
+        chunk_amount = S3Handler.upload_many(bucket_config.job_bucket, input_chunks())
+    except Exception:
+        delete_job_chunks(job_id)
+        raise
+
+    job = ClassificationJob(
+        id=job_id,
+        user_id=user_id,
+        model_id=model_id,
+        get_distribution=get_distribution,
+        status=JobStatus.QUEUED.value if chunk_amount else JobStatus.COMPLETED.value,
+        name_amount=name_amount,
+        chunk_amount=chunk_amount,
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    return job_to_dict(job)
+
+
+def delete_job_chunks(job_id: str, kind: str=None):
+    """
+    Deletes the stored chunks of a job. Failures are only logged, as they must not affect the job itself.
+    :param job_id: The job ID
+    :param kind: Either "input" or "output", both if None
+    """
+
+    try:
+        S3Handler.delete_prefix(bucket_config.job_bucket, f"{job_id}/{kind}/" if kind else f"{job_id}/")
+    except Exception as e:
+        current_app.logger.error(f"Could not delete the chunks of a job: {e}. [job-id: {job_id}]")
+
+
+def delete_expired_jobs() -> int:
+    """
+    Deletes completed and failed jobs, including their results, 'JOB_RETENTION_HOURS' after they finished.
+    Concurrent workers skip rows locked by each other.
+    :return: Amount of deleted jobs
+    """
+
+    expiry = datetime.datetime.utcnow() - datetime.timedelta(hours=float(current_app.config["JOB_RETENTION_HOURS"]))
+    jobs = (
+        ClassificationJob.query
+        .filter(
+            ClassificationJob.status.in_([JobStatus.COMPLETED.value, JobStatus.FAILED.value]),
+            ClassificationJob.updated_time < expiry
+        )
+        .limit(100)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+    for job in jobs:
+        delete_job_chunks(job.id)
+        db.session.delete(job)
+    db.session.commit()
+
+    return len(jobs)
+
+
+def get_job(user_id: str, job_id: str) -> ClassificationJob:
+    """
+    Fetches a job of a user.
+    :param user_id: The user who submitted the job
+    :param job_id: The job ID
+    :return: The job
+    """
+
+    job = ClassificationJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if not job:
+        raise GeneralError(
+            error_code="JOB_DOES_NOT_EXIST",
+            message=f"Job with ID '{job_id}' does not exist.",
+            status_code=404
+        )
+
+    return job
+
+
+def get_job_result_chunks(user_id: str, job_id: str) -> Iterator[list[dict]]:
+    """
+    Fetches the results of a completed job chunk by chunk.
+    :param user_id: The user who submitted the job
+    :param job_id: The job ID
+    :return: Iterator over the '{name: result}' lines of every chunk, in input order
+    """
+
+    job = get_job(user_id, job_id)
+    if job.status != JobStatus.COMPLETED.value:
+        raise GeneralError(
+            error_code="JOB_NOT_COMPLETED",
+            message=f"Job with ID '{job_id}' is not completed yet (status: {job.status}).",
+            status_code=409
+        )
+
+    def chunks() -> Iterator[list[dict]]:
+        # fetched a few chunks at a time concurrently, without holding all results in memory
+        chunk_keys = [get_chunk_key(job.id, "output", chunk_idx) for chunk_idx in range(job.chunk_amount)]
+        for start in range(0, len(chunk_keys), bucket_config.fetch_threads):
+            yield from S3Handler.get_many(bucket_config.job_bucket, chunk_keys[start:start + bucket_config.fetch_threads])
+
+    return chunks()
+
+
+def claim_job() -> str | None:
+    """
+    Claims the oldest job which is ready to be processed: queued jobs, paused jobs whose quota was reset
+    (ie. paused before today) and running jobs whose worker stopped sending heartbeats (ie. crashed).
+    Concurrent workers skip rows locked by each other, so every job is claimed by a single worker.
+    :return: ID of the claimed job or None if there is nothing to do
+    """
+
+    now = datetime.datetime.utcnow()
+    lease_expiry = now - datetime.timedelta(seconds=int(current_app.config["JOB_LEASE_SECONDS"]))
+    start_of_today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+
+    job = (
+        ClassificationJob.query
+        .filter(or_(
+            ClassificationJob.status == JobStatus.QUEUED.value,
+            and_(ClassificationJob.status == JobStatus.PAUSED.value, ClassificationJob.updated_time < start_of_today),
+            and_(ClassificationJob.status == JobStatus.RUNNING.value, ClassificationJob.updated_time < lease_expiry),
+        ))
+        .order_by(ClassificationJob.creation_time)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+
+    if not job:
+        db.session.commit()
+        return None
+
+    job.status = JobStatus.RUNNING.value
+    job.error = None
+    job.lease_token = uuid.uuid4().hex
+    job.updated_time = now
+    db.session.commit()
+
+    return job.id
+
+
+def update_leased_job(job_id: str, lease_token: str, completed_chunks: int, values: dict) -> bool:
+    """
+    Updates a job only if the worker still holds its lease and no other worker completed further chunks meanwhile,
+    ie. a worker whose job was reclaimed after its lease expired can't modify it anymore. Doesn't commit.
+    :param job_id: The job ID
+    :param lease_token: Lease token the worker got when claiming the job
+    :param completed_chunks: Amount of completed chunks the worker expects
+    :param values: Column values to set
+    :return: Wether the job was updated
+    """
+
+    result = db.session.execute(
+        update(ClassificationJob)
+        .where(
+            ClassificationJob.id == job_id,
+            ClassificationJob.lease_token == lease_token,
+            ClassificationJob.completed_chunks == completed_chunks
+        )
+        .values(updated_time=datetime.datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def charge_job_chunk(job: ClassificationJob, lease_token: str, chunk_idx: int, name_amount: int) -> bool:
+    """
+    Marks a chunk of a job as completed and charges its names to the user's quota in a single transaction,
+    so a chunk is charged exactly once even if a worker crashes or loses its lease and the chunk is processed again.
+    Once the last chunk is completed the job is completed and the request counters are incremented.
+
+    :param job: The job
+    :param lease_token: Lease token the worker got when claiming the job
+    :param chunk_idx: Index of the completed chunk
+    :param name_amount: The number of names in the completed chunk
+    :return: Wether the chunk was charged, False if another worker took over the job
+    """
+
+    is_last_chunk = chunk_idx + 1 == job.chunk_amount
+    updated = update_leased_job(
+        job.id, lease_token, chunk_idx, {
+            "completed_chunks": ClassificationJob.completed_chunks + 1,
+            "processed_names": ClassificationJob.processed_names + name_amount,
+            "status": JobStatus.COMPLETED.value if is_last_chunk else JobStatus.RUNNING.value
+        }
+    )
+    if not updated:
+        db.session.rollback()
+        return False
+
+    # the job row stays locked until the commit, so concurrent charges of the same chunk wait and then fail the update above
+    user_quota = UserQuota.query.filter_by(user_id=job.user_id).first()
+    user_quota.name_count = UserQuota.name_count + name_amount
+
+    user = User.query.filter_by(id=job.user_id).first()
+    user.names_classified = User.names_classified + name_amount
+
+    if is_last_chunk:
+        user.request_count = User.request_count + 1
+
+        model = Model.query.filter_by(id=job.model_id).first()
+        model.request_count = Model.request_count + 1
+
+        user_to_model = UserToModel.query.filter_by(user_id=job.user_id, model_id=job.model_id).first()
+        if user_to_model:
+            user_to_model.request_count = UserToModel.request_count + 1
+
+    db.session.commit()
+    return True
+
+
+def process_job(job_id: str):
+    """
+    Classifies the remaining chunks of a claimed job, starting after its last completed chunk.
+    The job is paused when the user's daily quota is exhausted and resumed by a worker on the next day.
+    Processing stops as soon as another worker took over the job (see 'update_leased_job').
+    :param job_id: ID of a job claimed by 'claim_job'
+    """
+
+    job = ClassificationJob.query.get(job_id)
+    model = Model.query.get(job.model_id)
+    batch_size = int(current_app.config["BATCH_SIZE"])
+
+    # the job gets reloaded after every commit, so the lease and progress of this worker are kept separately
+    lease_token = job.lease_token
+    chunk_idx = job.completed_chunks
+
+    try:
+        for chunk_idx in range(chunk_idx, job.chunk_amount):
+            names = S3Handler.get(bucket_config.job_bucket, get_chunk_key(job.id, "input", chunk_idx))
+
+            try:
+                # chunks may be larger than 'MAX_NAMES', which only limits synchronous requests
+                check_quota(job.user_id, len(names))
+            except GeneralError as e:
+                if e.error_code != "QUOTA_EXCEEDED":
+                    raise
+                update_leased_job(job.id, lease_token, chunk_idx, {"status": JobStatus.PAUSED.value, "error": e.message})
+                db.session.commit()
+                current_app.logger.info(f"Paused job until the quota resets. [job-id: {job.id}, user-id: {job.user_id}]")
+                return
+
+            predictions = inference.predict(
+                model_id=model.id,
+                classes=model.nationalities,
+                names=names,
+                batch_size=batch_size,
+                get_distribution=job.get_distribution
+            )
+            lines = [{name: prediction} for name, prediction in zip(names, predictions)]
+            S3Handler.upload(bucket_config.job_bucket, json.dumps(lines), get_chunk_key(job.id, "output", chunk_idx))
+
+            if not charge_job_chunk(job, lease_token, chunk_idx, len(names)):
+                current_app.logger.warning(f"Lost the lease of the job to another worker. [job-id: {job.id}, user-id: {job.user_id}]")
+                return
+
+        delete_job_chunks(job.id, "input")
+        current_app.logger.info(f"Successfully completed job. [job-id: {job.id}, user-id: {job.user_id}]")
+
+    except Exception as e:
+        db.session.rollback()
+        error = e.message if isinstance(e, GeneralError) else "An unexpected error occurred."
+        failed = update_leased_job(job.id, lease_token, chunk_idx, {"status": JobStatus.FAILED.value, "error": error})
+        db.session.commit()
+        if failed:
+            delete_job_chunks(job.id)
+        current_app.logger.error(f"Job failed: {e}. [job-id: {job.id}, user-id: {job.user_id}]")
@@ -1,8 +1,17 @@
+from contextlib import contextmanager
+import csv
 import hashlib
+import io
+import itertools
+import os
 import re
+import threading
 from email_validator import validate_email, EmailNotValidError
-from flask import Response, jsonify
+from typing import BinaryIO, Iterable, Iterator
+from flask import Response, current_app, jsonify, stream_with_context
+from pydantic import BaseModel
 import json
+import orjson
 
 
 def error_response(error_code: str, message: str, status_code: int) -> Response:
@@ -50,6 +59,94 @@ def success_response(message: str = None, data: dict | list = None, status_code:
     return response
 
 
+def json_response(data: dict | list, status_code: int = 200) -> Response:
+    """
+    Creates a JSON serialized Flask response for large, server-generated data (eg. classification results).
+    Unlike 'success_response' the keys are not sorted and the data is encoded straight to bytes with orjson.
+    :param data: Response body
+    :param status_code: Success status Code
+    :return: Flask response
+    """
+
+    return Response(orjson.dumps(data), status=status_code, mimetype="application/json")
+
+
+def validate_response(schema: type[BaseModel], data: dict | list):
+    """
+    Validates server-generated response data against its schema. For large responses the validation costs more than
+    computing them, so it only runs in testing or debug mode, or when 'VALIDATE_RESPONSES' is enabled.
+    :param schema: Pydantic schema of the response
+    :param data: Response data
+    """
+
+    if current_app.testing or current_app.debug or current_app.config["VALIDATE_RESPONSES"]:
+        schema(**data)
+
+
+def ndjson_response(chunks: Iterable[list[dict | list]], status_code: int = 200) -> Response:
+    """
+    Creates a streamed newline-delimited JSON (NDJSON) Flask response, serializing one chunk of lines at a time.
+    If producing a chunk fails mid-stream, an error line is written instead and the stream ends.
+    :param chunks: Iterable over lists of JSON lines, consumed lazily inside the request context
+    :param status_code: Success status Code
+    :return: Flask response
+    """
+
+    def generate():
+        try:
+            for chunk in chunks:
+                yield b"".join(orjson.dumps(line) + b"\n" for line in chunk)
+        except Exception as e:
+            current_app.logger.error(f"Error while streaming response: {e}")
+            yield orjson.dumps({"errorCode": "UNEXPECTED_ERROR", "message": "An unexpected error occurred."}) + b"\n"
+
+    return Response(stream_with_context(generate()), status=status_code, mimetype="application/x-ndjson")
+
+
+def csv_response(chunks: Iterable[list[list]], filename: str, status_code: int = 200) -> Response:
+    """
+    Creates a streamed CSV Flask response (as attachment), serializing one chunk of rows at a time.
+    If producing a chunk fails mid-stream, an error row is written instead and the stream ends, so a truncated
+    file can't be mistaken for a complete one.
+    :param chunks: Iterable over lists of CSV rows, consumed lazily inside the request context
+    :param filename: File name of the attachment
+    :param status_code: Success status Code
+    :return: Flask response
+    """
+
+    def generate():
+        try:
+            for chunk in chunks:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(chunk)
+                yield buffer.getvalue()
+        except Exception as e:
+            current_app.logger.error(f"Error while streaming response: {e}")
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(["#ERROR", "UNEXPECTED_ERROR", "An unexpected error occurred."])
+            yield buffer.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        status=status_code,
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename=\"{filename}\""}
+    )
+
+
+def iter_chunks(iterable: Iterable, chunk_size: int) -> Iterator[list]:
+    """
+    Splits an iterable lazily into lists of 'chunk_size' items (the last one might be shorter).
+    :param iterable: Iterable to split
+    :param chunk_size: Amount of items per chunk
+    :return: Iterator over the chunks
+    """
+
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        yield chunk
+
+
 def to_snake_case(input_string: str) -> str:
     """
     Converts CamelCase strings into snake_case (created by ChatGPT)
@@ -145,3 +242,25 @@ def load_json(file_path: str) -> dict:
 
     with open(file_path, "r") as f:
         return json.load(f)
+
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[BinaryIO]:
+    """
+    Opens a file for writing, which only replaces 'path' once it is completely written. Concurrent readers
+    (eg. other processes of the host) therefore never see a partially written file.
+    :param path: Path of the file
+    :return: Binary file to write to, the temporary file is removed if writing fails
+    """
+
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary_path, "wb") as file:
+            yield file
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
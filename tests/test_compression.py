@@ -0,0 +1,105 @@
+import gzip
+import json
+import zlib
+import brotli
+import pytest
+from flask import Flask, Response, request
+from compression import compress_stream, init_compression
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config.update({
+        "TESTING": True,
+        "RESPONSE_COMPRESSION": True,
+        "COMPRESSION_MIN_BYTES": 1024,
+        "GZIP_LEVEL": 6,
+        "BROTLI_QUALITY": 5,
+        "DECOMPRESSED_REQUEST_PATHS": ["/classify"],
+        "MAX_DECOMPRESSED_REQUEST_BYTES": 1024 ** 2,
+    })
+
+    @app.route("/classify", methods=["POST"])
+    def classify():
+        return {"names": request.json["names"]}
+
+    @app.route("/stream")
+    def stream():
+        return Response((f"line {idx}\n" for idx in range(1000)), mimetype="application/x-ndjson")
+
+    init_compression(app)
+    return app.test_client()
+
+
+@pytest.mark.it("should gzip large responses when the client accepts gzip")
+def test_compress_large_response(client):
+    names = ["Cixin Liu"] * 1000
+    response = client.post("/classify", json={"names": names}, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data)) == {"names": names}
+
+
+@pytest.mark.it("should not compress responses below the size threshold or when the client does not accept compression")
+def test_skip_compression(client):
+    response = client.post("/classify", json={"names": ["Cixin Liu"]}, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+    response = client.post("/classify", json={"names": ["Cixin Liu"] * 1000})
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(response.data) == {"names": ["Cixin Liu"] * 1000}
+
+
+@pytest.mark.it("should compress streamed responses chunk by chunk")
+def test_compress_streamed_response(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data).decode().splitlines() == [f"line {idx}" for idx in range(1000)]
+
+
+@pytest.mark.it("should prefer brotli for buffered and streamed responses when the client accepts it")
+def test_compress_brotli(client):
+    names = ["Cixin Liu"] * 1000
+    response = client.post("/classify", json={"names": names}, headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.data)) == {"names": names}
+
+    response = client.get("/stream", headers={"Accept-Encoding": "br;q=1.0, gzip;q=0.5"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data).decode().splitlines() == [f"line {idx}" for idx in range(1000)]
+
+
+@pytest.mark.it("should flush every compressed chunk of a stream so it can be decompressed as soon as it arrives")
+@pytest.mark.parametrize("encoding, decompressor", [("br", brotli.Decompressor), ("gzip", lambda: zlib.decompressobj(31))])
+def test_compress_stream_flush(encoding, decompressor):
+    chunks = [f'{{"name": "Cixin Liu", "idx": {idx}}}\n' for idx in range(5)]
+    decompressor = decompressor()
+    process = decompressor.process if encoding == "br" else decompressor.decompress
+
+    compressed_chunks = compress_stream(iter(chunks), encoding, level=5)
+    for chunk in chunks:
+        assert process(next(compressed_chunks)).decode() == chunk
+
+    process(next(compressed_chunks))
+    assert decompressor.is_finished() if encoding == "br" else decompressor.eof
+
+
+@pytest.mark.it("should decompress gzip request bodies and reject invalid or too large ones")
+def test_decompress_request(client):
+    names = ["Cixin Liu"] * 10
+    body = gzip.compress(json.dumps({"names": names}).encode())
+    response = client.post("/classify", data=body, headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 200
+    assert json.loads(response.data) == {"names": names}
+
+    response = client.post("/classify", data=b"not gzip", headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 400
+    assert json.loads(response.data)["errorCode"] == "INVALID_CONTENT_ENCODING"
+
+    bomb = gzip.compress(b" " * (2 * 1024 ** 2))
+    response = client.post("/classify", data=bomb, headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 413
+    assert json.loads(response.data)["errorCode"] == "REQUEST_TOO_LARGE"
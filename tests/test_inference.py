@@ -0,0 +1,628 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import multiprocessing
+from multiprocessing.connection import Listener, Pipe
+import string
+import threading
+import time
+from unittest.mock import patch
+import numpy as np
+import pytest
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from inference.inference import (
+    classify_names, deduplicate_names, encode_names, get_columnar_results, get_ethnicity_distributions, get_ethnicity_predictions,
+    compile_model, get_model, load_model, normalize_names, predict, predict_chunks, predict_multi, preload_models, preprocess_names, quantize_model, replace_special_chars, run_model
+)
+from inference.inference_server import handle_connection, restart_dead_processes
+from inference.inference_utils import (
+    InferenceClient, MicroBatcher, ModelCache, PredictionCache, configure_torch_threads, get_model_checkpoint, get_model_size, inference_config,
+    load_model_config, model_cache, prediction_cache
+)
+from errors import GeneralError
+from inference.model import ConvLSTM
+from prometheus_client import REGISTRY
+
+
+MODEL_CONFIG = {
+    "amount-classes": 3,
+    "embedding-size": 32,
+    "hidden-size": 6,
+    "rnn-layers": 1,
+    "kernel-size": 3,
+    "cnn-out-dim": 16
+}
+
+SAMPLE_NAMES = ["Cixin Liu", "werner heisenberg", "Jules Verne", "Naoyuki Oi", "Xu", "Chimamanda Ngozi Adichie"]
+
+
+def create_model(class_amount: int = 2) -> ConvLSTM:
+    return ConvLSTM(class_amount=class_amount, embedding_size=32, hidden_size=6, layers=1, kernel_size=3, cnn_out_dim=16).eval()
+
+
+@pytest.mark.it("should only load a model once when requesting it repeatedly from the model cache")
+def test_model_cache_hit():
+    cache = ModelCache(max_bytes=10 * 1024 ** 2, revalidate_seconds=0)
+    loaded = []
+
+    def load(etag):
+        loaded.append(create_model())
+        return loaded[-1]
+
+    first = cache.get("model-a", load_model=load, get_etag=lambda: "etag-1")
+    second = cache.get("model-a", load_model=load, get_etag=lambda: "etag-1")
+
+    assert first is second
+    assert len(loaded) == 1
+
+
+@pytest.mark.it("should reload a cached model when the ETag of its checkpoint changed")
+def test_model_cache_etag_revalidation():
+    cache = ModelCache(max_bytes=10 * 1024 ** 2, revalidate_seconds=0)
+
+    first = cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: "etag-1")
+    second = cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: "etag-2")
+
+    assert first is not second
+
+
+@pytest.mark.it("should not revalidate a cached model within the revalidation interval")
+def test_model_cache_revalidation_interval():
+    cache = ModelCache(max_bytes=10 * 1024 ** 2, revalidate_seconds=3600)
+
+    first = cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: "etag-1")
+    second = cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: pytest.fail("ETag was fetched"))
+
+    assert first is second
+
+
+@pytest.mark.it("should load a model only once when it is requested concurrently and let the other requests wait for that load")
+def test_model_cache_single_flight():
+    cache = ModelCache(max_bytes=10 * 1024 ** 2, revalidate_seconds=3600)
+    loaded = []
+
+    def load(etag):
+        time.sleep(0.2)
+        loaded.append(create_model())
+        return loaded[-1]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        models = list(executor.map(lambda _: cache.get("model-a", load_model=load, get_etag=lambda: "etag-1"), range(8)))
+
+    assert len(loaded) == 1
+    assert all(model is loaded[0] for model in models)
+
+
+@pytest.mark.it("should evict the least recently used model when exceeding the memory budget")
+def test_model_cache_lru_eviction():
+    model_size = get_model_size(create_model())
+    cache = ModelCache(max_bytes=2 * model_size, revalidate_seconds=3600)
+
+    cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: None)
+    cache.get("model-b", load_model=lambda etag: create_model(), get_etag=lambda: None)
+    cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: None)
+    cache.get("model-c", load_model=lambda etag: create_model(), get_etag=lambda: None)
+
+    assert "model-a" in cache
+    assert "model-b" not in cache
+    assert "model-c" in cache
+    assert len(cache) == 2
+
+
+@pytest.mark.it("should encode names exactly like the per-character encoding when preprocessing names")
+def test_encode_names():
+    names = ["Cixin Liu", "werner heisenberg", "Jules Verne", "Zoë O'Brien-Smith", "Þór 123 Ævarsson", "al"]
+
+    alphabet = list(string.ascii_lowercase) + [" ", "-"]
+    expected = pad_sequence(
+        [torch.tensor([alphabet.index(char.lower()) + 1 for char in replace_special_chars(name)]) for name in names],
+        batch_first=True
+    )
+
+    encoded_names, lengths = encode_names(normalize_names(names))
+    assert torch.equal(torch.from_numpy(encoded_names), expected)
+    assert lengths.tolist() == [len(replace_special_chars(name)) for name in names]
+
+    input_batch = preprocess_names(names, batch_size=4)
+    assert [batch.shape for batch, _, _ in input_batch] == [(4, expected.shape[1], 1), (2, expected.shape[1], 1)]
+    assert torch.equal(torch.cat([batch for batch, _, _ in input_batch]).squeeze(2).cpu(), expected)
+    assert torch.cat([lengths for _, lengths, _ in input_batch]).tolist() == lengths.tolist()
+    assert np.concatenate([indices for _, _, indices in input_batch]).tolist() == list(range(len(names)))
+
+
+@pytest.mark.it("should batch names of similar length and pad every batch only to its longest name when using bucketed batching")
+def test_bucketed_batching():
+    names = ["Jules Verne", "werner heisenberg", "Liu", "Oi", "Cixin Liu", "Ada Lovelace", "Emmy Noether", "Xu"]
+    encoded_names, lengths = encode_names(normalize_names(names))
+
+    input_batch = preprocess_names(names, batch_size=3, batching_strategy="bucketed")
+
+    positions = np.concatenate([indices for _, _, indices in input_batch])
+    assert sorted(positions.tolist()) == list(range(len(names)))
+    assert lengths[positions].tolist() == sorted(lengths.tolist())
+
+    for batch, _, indices in input_batch:
+        assert batch.shape == (len(indices), lengths[indices].max(), 1)
+        assert torch.equal(batch.squeeze(2).cpu(), torch.from_numpy(encoded_names[indices, :lengths[indices].max()]))
+
+
+@pytest.mark.it("should predict the same distribution for a name regardless of the other names in its batch when using length-aware inference")
+def test_length_aware_inference_batch_invariance():
+    torch.manual_seed(0)
+    model = create_model(class_amount=3)
+    classes = ["a", "b", "c"]
+
+    alone = classify_names(model, preprocess_names(["Cixin Liu"]), classes, get_distribution=True)
+    with_longer_names = classify_names(
+        model,
+        preprocess_names(["Cixin Liu", "werner heisenberg von der lippe", "Oi"], batching_strategy="bucketed", batch_size=2),
+        classes,
+        get_distribution=True
+    )
+
+    assert with_longer_names[0] == alone[0]
+
+
+@pytest.mark.it("should classify batches which only contain names shorter than the convolution kernel")
+def test_short_names_classification():
+    model = create_model(class_amount=3)
+    input_batch = preprocess_names(["Oi", "Xu", "Cixin Liu", "Li"], batching_strategy="bucketed", batch_size=2)
+
+    assert len(classify_names(model, input_batch, ["a", "b", "c"])) == 4
+
+
+@pytest.mark.it("should only keep the first occurrence of each normalized name when deduplicating names")
+def test_deduplicate_names():
+    names = normalize_names(["Cixin Liu", "cixin liu", "Zoë", "Cixin Liu!", "zoe", "Jules Verne"])
+    unique_names, inverse = deduplicate_names(names)
+
+    assert unique_names == ["cixin liu", "zoe", "jules verne"]
+    assert inverse.tolist() == [0, 0, 1, 0, 1, 2]
+    assert [unique_names[idx] for idx in inverse] == names
+
+
+@pytest.mark.it("should return cached predictions and evict the least recently used ones when using the prediction cache")
+def test_prediction_cache():
+    cache = PredictionCache(max_entries=2, ttl_seconds=3600)
+    predictions = np.array([[0.1, 0.9], [0.2, 0.8], [0.3, 0.7]], dtype=np.float32)
+
+    cache.put_many("model-a", ["cixin liu", "jules verne"], predictions[:2])
+    cached = cache.get_many("model-a", ["cixin liu", "jules verne", "ada lovelace"])
+    assert np.array_equal(cached[0], predictions[0])
+    assert np.array_equal(cached[1], predictions[1])
+    assert cached[2] is None
+    assert cache.get_many("model-b", ["cixin liu"]) == [None]
+
+    cache.get_many("model-a", ["cixin liu"])
+    cache.put_many("model-a", ["ada lovelace"], predictions[2:])
+    assert cache.get_many("model-a", ["jules verne"]) == [None]
+    assert len(cache) == 2
+
+
+@pytest.mark.it("should drop the cached predictions of a model when it gets loaded with a different checkpoint")
+def test_prediction_cache_invalidation():
+    prediction_cache = PredictionCache(max_entries=10, ttl_seconds=3600)
+    model_cache = ModelCache(max_bytes=10 * 1024 ** 2, revalidate_seconds=0, on_load=prediction_cache.set_etag)
+
+    model_cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: "etag-1")
+    prediction_cache.put_many("model-a", ["cixin liu"], np.zeros((1, 2), dtype=np.float32))
+    prediction_cache.put_many("model-b", ["cixin liu"], np.zeros((1, 2), dtype=np.float32))
+
+    model_cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: "etag-1")
+    assert prediction_cache.get_many("model-a", ["cixin liu"])[0] is not None
+
+    model_cache.get("model-a", load_model=lambda etag: create_model(), get_etag=lambda: "etag-2")
+    assert prediction_cache.get_many("model-a", ["cixin liu"]) == [None]
+    assert prediction_cache.get_many("model-b", ["cixin liu"])[0] is not None
+
+
+@pytest.mark.it("should drop cached predictions of a retrained model when revalidating its ETag without loading the model")
+def test_prediction_cache_revalidation():
+    cache = PredictionCache(max_entries=10, ttl_seconds=3600)
+    cache.revalidate("model-a", get_etag=lambda: "etag-1", revalidate_seconds=3600)
+    cache.put_many("model-a", ["cixin liu"], np.zeros((1, 2), dtype=np.float32))
+
+    cache.revalidate("model-a", get_etag=lambda: pytest.fail("ETag was fetched"), revalidate_seconds=3600)
+    assert cache.get_many("model-a", ["cixin liu"])[0] is not None
+
+    cache.revalidate("model-a", get_etag=lambda: "etag-2", revalidate_seconds=0)
+    assert cache.get_many("model-a", ["cixin liu"]) == [None]
+
+
+@pytest.mark.it("should expire cached predictions after their time to live")
+def test_prediction_cache_ttl():
+    cache = PredictionCache(max_entries=10, ttl_seconds=-1)
+    cache.put_many("model-a", ["cixin liu"], np.zeros((1, 2), dtype=np.float32))
+
+    assert cache.get_many("model-a", ["cixin liu"]) == [None]
+    assert len(cache) == 0
+
+
+@pytest.mark.it("should post-process predictions exactly like the per-name loop when collecting predictions and distributions")
+def test_ethnicity_results():
+    classes = ["chinese", "german", "french", "else"]
+    predictions = torch.log_softmax(torch.randn(2000, len(classes), generator=torch.Generator().manual_seed(0)) * 3, dim=1).numpy()
+
+    # include values which are close to a tie when rounding to three decimals
+    predictions[0] = np.log(np.array([0.125005, 0.37499, 0.0000049, 0.5], dtype=np.float32))
+
+    expected_predictions = []
+    expected_distributions = []
+    for prediction in predictions:
+        prediction_idx = list(prediction).index(max(prediction))
+        expected_predictions.append((classes[prediction_idx], round(100 * float(np.exp(max(prediction))), 3)))
+        expected_distributions.append({
+            ethnicity: round(100 * float(np.exp(prediction[idx])), 3) for idx, ethnicity in enumerate(classes)
+        })
+
+    assert get_ethnicity_predictions(predictions, classes) == expected_predictions
+    assert get_ethnicity_distributions(predictions, classes) == expected_distributions
+
+
+@pytest.mark.it("should only return the most likely ethnicities ordered by confidence when selecting the top-k or a minimum confidence")
+def test_ethnicity_distribution_selection():
+    classes = ["chinese", "german", "french", "else", "japanese"]
+    predictions = torch.log_softmax(torch.randn(500, len(classes), generator=torch.Generator().manual_seed(0)) * 3, dim=1).numpy()
+
+    full_distributions = get_ethnicity_distributions(predictions, classes)
+    sorted_distributions = [sorted(distribution.items(), key=lambda item: -item[1]) for distribution in full_distributions]
+
+    top_two = get_ethnicity_distributions(predictions, classes, top_k=2)
+    assert top_two == [dict(distribution[:2]) for distribution in sorted_distributions]
+    assert all(list(distribution.values()) == sorted(distribution.values(), reverse=True) for distribution in top_two)
+
+    above_threshold = get_ethnicity_distributions(predictions, classes, min_confidence=20)
+    assert above_threshold == [
+        {ethnicity: confidence for ethnicity, confidence in distribution if confidence >= 20} for distribution in sorted_distributions
+    ]
+
+    combined = get_ethnicity_distributions(predictions, classes, top_k=2, min_confidence=20)
+    assert combined == [
+        {ethnicity: confidence for ethnicity, confidence in distribution[:2] if confidence >= 20} for distribution in sorted_distributions
+    ]
+    assert get_ethnicity_distributions(predictions, classes, top_k=10) == [dict(distribution) for distribution in sorted_distributions]
+
+
+@pytest.mark.it("should return the same results as columns as when collecting them per name when using the columnar format")
+def test_columnar_results():
+    classes = ["chinese", "german", "french", "else"]
+    predictions = torch.log_softmax(torch.randn(300, len(classes), generator=torch.Generator().manual_seed(0)) * 3, dim=1).numpy()
+
+    top_one = get_columnar_results(predictions, classes)
+    assert top_one["classes"] == classes
+    assert list(zip([classes[idx] for idx in top_one["predictions"]], top_one["confidences"])) == get_ethnicity_predictions(predictions, classes)
+
+    distributions = get_columnar_results(predictions, classes, get_distribution=True)
+    assert [dict(zip(classes, confidences)) for confidences in distributions["confidences"]] == get_ethnicity_distributions(predictions, classes)
+
+    selected = get_columnar_results(predictions, classes, get_distribution=True, top_k=2, min_confidence=20)
+    assert [
+        dict(zip([classes[idx] for idx in indices], confidences)) for indices, confidences in zip(selected["classIndices"], selected["confidences"])
+    ] == get_ethnicity_distributions(predictions, classes, top_k=2, min_confidence=20)
+
+
+@pytest.mark.it("should serve a smaller int8-quantized copy of a model when it agrees with the fp32 model")
+def test_quantize_model():
+    torch.manual_seed(0)
+    model = create_model(class_amount=3)
+
+    quantized_model = quantize_model(model)
+
+    assert quantized_model is not model
+    assert get_model_size(quantized_model) < get_model_size(model)
+
+
+@pytest.mark.it("should refuse to serve a quantized model when its top-1 agreement is below the threshold")
+def test_quantize_model_refusal():
+    torch.manual_seed(0)
+    model = create_model(class_amount=3)
+
+    with patch.object(inference_config, "quantization_min_agreement", 1.01):
+        assert quantize_model(model) is model
+
+
+@pytest.mark.it("should predict the same as the eager model when using the compiled (TorchScript) model")
+def test_compiled_model_parity():
+    torch.manual_seed(0)
+    model = create_model(class_amount=3)
+    compiled_model = compile_model(model)
+    input_batch = preprocess_names(SAMPLE_NAMES, batch_size=4)
+
+    for length_aware in [True, False]:
+        expected = run_model(model, input_batch, length_aware=length_aware)
+        assert np.allclose(run_model(compiled_model, input_batch, length_aware=length_aware), expected, atol=1e-6)
+
+    quantized_model = quantize_model(model)
+    expected = run_model(quantized_model, input_batch)
+    assert np.allclose(run_model(compile_model(quantized_model), input_batch), expected, atol=1e-6)
+
+
+@pytest.mark.it("should load the compiled model from the local artifact cache instead of fetching the checkpoint again")
+def test_compiled_model_artifact_cache(tmp_path):
+    torch.manual_seed(0)
+    checkpoint = create_model(class_amount=3).state_dict()
+
+    with patch.object(inference_config, "torchscript_inference", True), \
+        patch.object(inference_config, "compiled_model_dir", str(tmp_path)), \
+        patch("inference.inference.get_model_etag", return_value="etag-1"), \
+        patch("inference.inference.get_model_checkpoint", return_value=checkpoint) as mock_checkpoint:
+
+        model_cache.clear()
+        compiled_model = get_model("model-a", MODEL_CONFIG)
+        model_cache.clear()
+        cached_model = get_model("model-a", MODEL_CONFIG)
+        model_cache.clear()
+
+    input_batch = preprocess_names(SAMPLE_NAMES)
+    assert isinstance(cached_model, torch.jit.ScriptModule)
+    assert mock_checkpoint.call_count == 1
+    assert len(list(tmp_path.iterdir())) == 1
+    assert np.array_equal(run_model(cached_model, input_batch), run_model(compiled_model, input_batch))
+
+
+@pytest.mark.it("should download a checkpoint only once into the local model store and map it into every model loaded from it")
+def test_model_store(tmp_path):
+    model = create_model(class_amount=3)
+    buffer = BytesIO()
+    torch.save(model.state_dict(), buffer)
+
+    with patch.object(inference_config, "mmap_models", True), \
+        patch.object(inference_config, "model_store_dir", str(tmp_path)), \
+        patch("inference.inference_utils.S3Handler.get_version", return_value=buffer.getvalue()) as mock_get:
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            checkpoints = list(executor.map(lambda _: get_model_checkpoint("model-a", "etag-1"), range(4)))
+        assert mock_get.call_count == 1
+
+        get_model_checkpoint("model-a", "etag-2")
+        assert mock_get.call_count == 2
+
+    input_batch = preprocess_names(SAMPLE_NAMES)
+    assert [path.suffix for path in (tmp_path / "model-a").iterdir() if not path.name.startswith(".")] == [".pt"]
+    for checkpoint in checkpoints:
+        assert np.array_equal(run_model(load_model(checkpoint, MODEL_CONFIG), input_batch), run_model(model, input_batch))
+
+
+@pytest.mark.it("should only store checkpoints of the requested ETag and remove the least recently used ones beyond the size budget")
+def test_model_store_bounds(tmp_path):
+    buffer = BytesIO()
+    torch.save(create_model(class_amount=3).state_dict(), buffer)
+    checkpoint_size = len(buffer.getvalue())
+
+    with patch.object(inference_config, "mmap_models", True), \
+        patch.object(inference_config, "model_store_dir", str(tmp_path)), \
+        patch.object(inference_config, "model_store_max_mb", 3.5 * checkpoint_size / 1024 ** 2), \
+        patch("inference.inference_utils.S3Handler.get_version", return_value=buffer.getvalue()) as mock_get:
+
+        for model_id in ["model-a", "model-b", "model-c"]:
+            get_model_checkpoint(model_id, "etag-1")
+        assert mock_get.call_args.args[2] == "etag-1"
+
+        # model-a is used again, so model-b is the least recently used one
+        get_model_checkpoint("model-a", "etag-1")
+        get_model_checkpoint("model-d", "etag-1")
+        assert sorted(path.parent.name for path in tmp_path.glob("*/*.pt")) == ["model-a", "model-c", "model-d"]
+
+        mock_get.return_value = None
+        with pytest.raises(GeneralError) as e:
+            get_model_checkpoint("model-a", "etag-2")
+        assert e.value.error_code == "MODEL_CHANGED"
+
+
+@pytest.mark.it("should split the available cores evenly across the workers unless the thread amount is configured")
+def test_configure_torch_threads():
+    threads = torch.get_num_threads()
+
+    with patch("inference.inference_utils.os.sched_getaffinity", return_value=set(range(8)), create=True), \
+        patch.object(inference_config, "intra_op_threads", 0):
+        configure_torch_threads(worker_amount=4)
+        assert torch.get_num_threads() == 2
+
+        configure_torch_threads(worker_amount=16)
+        assert torch.get_num_threads() == 1
+
+        with patch.object(inference_config, "web_workers", 2):
+            configure_torch_threads()
+            assert torch.get_num_threads() == 4
+
+        with patch.object(inference_config, "intra_op_threads", 3):
+            configure_torch_threads(worker_amount=4)
+            assert torch.get_num_threads() == 3
+
+    assert REGISTRY.get_sample_value("n2e_torch_intra_op_threads") == 3
+    assert REGISTRY.get_sample_value("n2e_torch_inter_op_threads") == torch.get_num_interop_threads()
+    torch.set_num_threads(threads)
+
+
+@pytest.mark.it("should merge concurrent requests for the same model into one forward pass and hand every request its slice")
+def test_micro_batcher():
+    batcher = MicroBatcher(window_seconds=0.2, max_names=100, timeout_seconds=5)
+    forward_passes = []
+
+    def run(names):
+        forward_passes.append(names)
+        return np.array([[len(name)] for name in names])
+
+    requests = [["a" * (idx + 1), "b" * (idx + 10)] for idx in range(5)]
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        results = list(executor.map(lambda names: batcher.submit("model-a", names, run), requests))
+
+    assert len(forward_passes) < len(requests)
+    for names, predictions in zip(requests, results):
+        assert predictions.ravel().tolist() == [len(name) for name in names]
+
+
+@pytest.mark.it("should never merge more than the maximum amount of names into one forward pass")
+def test_micro_batcher_max_names():
+    batcher = MicroBatcher(window_seconds=0.2, max_names=5, timeout_seconds=5)
+    forward_passes = []
+
+    def run(names):
+        forward_passes.append(names)
+        return np.array([[len(name)] for name in names])
+
+    requests = [["a" * (idx + 1), "b" * (idx + 10), "c" * (idx + 20)] for idx in range(6)]
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        results = list(executor.map(lambda names: batcher.submit("model-a", names, run), requests))
+
+    assert all(len(names) <= 5 for names in forward_passes)
+    assert sorted(name for names in forward_passes for name in names) == sorted(name for names in requests for name in names)
+    for names, predictions in zip(requests, results):
+        assert predictions.ravel().tolist() == [len(name) for name in names]
+
+
+@pytest.mark.it("should run requests with at least the maximum amount of names directly when micro-batching")
+def test_micro_batcher_large_request():
+    batcher = MicroBatcher(window_seconds=10, max_names=2, timeout_seconds=5)
+
+    predictions = batcher.submit("model-a", ["a", "bb"], lambda names: np.array([[len(name)] for name in names]))
+    assert predictions.ravel().tolist() == [1, 2]
+
+
+@pytest.fixture
+def mock_models():
+    """ Serves the models added to the yielded dict (by model ID) instead of loading their checkpoints from S3 """
+
+    models = {}
+
+    model_cache.clear()
+    prediction_cache.clear()
+    with patch("inference.inference.load_model_config", return_value=MODEL_CONFIG), \
+            patch("inference.inference.get_model_checkpoint", side_effect=lambda model_id, etag: models[model_id].state_dict()), \
+            patch("inference.inference.get_model_etag", return_value="etag-1"):
+        yield models
+
+    model_cache.clear()
+    prediction_cache.clear()
+
+
+@pytest.mark.it("should predict the same with every model when classifying with multiple models at once as when classifying with each model alone")
+def test_predict_multi(mock_models):
+    mock_models.update({"model-a": create_model(2), "model-b": create_model(3)})
+    classes = {"model-a": ["chinese", "else"], "model-b": ["french", "german", "else"]}
+    names = SAMPLE_NAMES + ["Cixin Liu", "werner heisenberg"]
+
+    multi_predictions = predict_multi([(model_id, classes[model_id]) for model_id in mock_models], names, batch_size=4, get_distribution=True)
+
+    model_cache.clear()
+    prediction_cache.clear()
+    single_predictions = [predict(model_id, names, classes[model_id], batch_size=4, get_distribution=True) for model_id in mock_models]
+
+    assert multi_predictions == single_predictions
+
+
+@pytest.mark.it("should skip models which fail to load when preloading and count them as errors")
+def test_preload_models_error(mock_models):
+    mock_models["model-a"] = create_model(3)
+    errors = REGISTRY.get_sample_value("n2e_model_preload_errors_total")
+
+    preloaded_amount = preload_models([("model-b", ["french", "german", "else"]), ("model-a", ["french", "german", "else"])])
+
+    assert preloaded_amount == 1
+    assert "model-a" in model_cache and "model-b" not in model_cache
+    assert REGISTRY.get_sample_value("n2e_model_preload_errors_total") == errors + 1
+
+
+@pytest.mark.it("should predict the same chunk by chunk as when predicting all names at once when streaming predictions")
+def test_predict_chunks(mock_models):
+    mock_models["model-a"] = create_model(3)
+    classes = ["french", "german", "else"]
+    names = SAMPLE_NAMES * 3
+
+    chunks = list(predict_chunks("model-a", [names[start:start + 4] for start in range(0, len(names), 4)], classes, batch_size=4, get_distribution=True))
+    expected_predictions = predict("model-a", names, classes, batch_size=4, get_distribution=True)
+
+    assert [len(chunk) for chunk in chunks] == [4, 4, 4, 4, 2]
+    assert [prediction for chunk in chunks for prediction in chunk] == expected_predictions
+
+
+@pytest.mark.it("should predict the same through the inference server as when running the model in the web worker")
+def test_inference_server(mock_models, tmp_path):
+    mock_models["model-a"] = create_model(3)
+    classes = ["french", "german", "else"]
+    socket_path = str(tmp_path / "inference.sock")
+    listener = Listener(socket_path, family="AF_UNIX", authkey=b"secret")
+
+    def serve():
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError:
+                return
+            with connection:
+                handle_connection(connection)
+
+    expected_predictions = predict("model-a", SAMPLE_NAMES, classes, batch_size=4, get_distribution=True)
+
+    model_cache.clear()
+    prediction_cache.clear()
+    threading.Thread(target=serve, daemon=True).start()
+    with patch.object(inference_config, "inference_server_socket", socket_path), \
+            patch("inference.inference.inference_client", InferenceClient(socket_path, "secret", timeout_seconds=10)):
+        predictions = predict("model-a", SAMPLE_NAMES, classes, batch_size=4, get_distribution=True)
+    listener.close()
+
+    assert predictions == expected_predictions
+
+
+@pytest.mark.it("should fail with a 503 error when the inference server is unreachable")
+def test_inference_server_unavailable(tmp_path):
+    client = InferenceClient(str(tmp_path / "missing.sock"), "secret", timeout_seconds=1)
+    encoded_names, lengths = encode_names(["Cixin Liu"])
+
+    with pytest.raises(GeneralError) as error:
+        client.predict("model-a", MODEL_CONFIG, encoded_names, lengths, batch_size=4)
+
+    assert error.value.error_code == "INFERENCE_UNAVAILABLE"
+    assert error.value.status_code == 503
+
+
+@pytest.mark.it("should fail with a 503 error within the timeout when all inference server processes are busy")
+def test_inference_server_saturated(tmp_path):
+    # a listener which never accepts, like a server whose processes are all busy
+    listener = Listener(str(tmp_path / "inference.sock"), family="AF_UNIX", authkey=b"secret")
+    client = InferenceClient(str(tmp_path / "inference.sock"), "secret", timeout_seconds=0.5)
+    encoded_names, lengths = encode_names(["Cixin Liu"])
+
+    start_time = time.monotonic()
+    with pytest.raises(GeneralError) as error:
+        client.predict("model-a", MODEL_CONFIG, encoded_names, lengths, batch_size=4)
+    listener.close()
+
+    assert error.value.error_code == "INFERENCE_TIMEOUT"
+    assert error.value.status_code == 503
+    assert time.monotonic() - start_time < 2
+
+
+@pytest.mark.it("should not wait for the request of a stalled client longer than the timeout in the inference server")
+def test_inference_server_stalled_client():
+    server_connection, client_connection = Pipe()
+
+    start_time = time.monotonic()
+    with pytest.raises(TimeoutError):
+        handle_connection(server_connection, timeout_seconds=0.2)
+
+    assert time.monotonic() - start_time < 1
+    client_connection.close()
+
+
+@pytest.mark.it("should restart inference server processes which died")
+def test_inference_server_restart():
+    def start_process(seconds: float=10) -> multiprocessing.Process:
+        process = multiprocessing.Process(target=time.sleep, args=(seconds,), daemon=True)
+        process.start()
+        return process
+
+    processes = [start_process(), start_process(seconds=0)]
+    processes[1].join()
+
+    assert restart_dead_processes(processes, start_process) == 1
+    assert all(process.is_alive() for process in processes)
+    for process in processes:
+        process.terminate()
+
+
+@pytest.mark.it("should require a dedicated authentication key for the inference server")
+def test_inference_server_authkey():
+    with pytest.raises(ValueError):
+        InferenceClient("/tmp/inference.sock", "", timeout_seconds=1)
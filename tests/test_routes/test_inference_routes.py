@@ -1,3 +1,4 @@
+import csv
 from datetime import timedelta
 from io import BytesIO
 from unittest.mock import patch
@@ -7,9 +8,13 @@ import pytest
 import json
 from sqlalchemy import text
 import torch
-from inference.inference_utils import load_model_config
+from inference.inference_utils import load_model_config, model_cache, prediction_cache
 from inference.model import ConvLSTM
-from schemas.inference_schema import InferenceDistributionResponseSchema, InferenceResponseSchema
+from schemas.inference_schema import (
+    ColumnarInferenceDistributionResponseSchema, ColumnarInferenceResponseSchema, InferenceDistributionResponseSchema,
+    InferenceResponseSchema, MultiInferenceResponseSchema
+)
+from services.inference_services import preload_public_models
 from utils import *
 from app import app
 from db.database import db
@@ -135,7 +140,7 @@ def mock_get_model_checkpoint():
     
     model_config = load_json("./tests/mock/model_config.json")
 
-    def mock_checkpoint(model_id):
+    def mock_checkpoint(model_id, etag=None):
         class_amount = 2
         if model_id == CUSTOM_MODEL["id"]:
             class_amount = len(CUSTOM_MODEL["nationalities"])
@@ -155,8 +160,11 @@ def mock_get_model_checkpoint():
         buffer.seek(0)
         return torch.load(buffer)
 
+    model_cache.clear()
+    prediction_cache.clear()
     with patch("inference.inference.get_model_checkpoint", side_effect=mock_checkpoint):
-        yield
+        with patch("inference.inference.get_model_etag", return_value="mock-etag"):
+            yield
 
 
 @pytest.mark.it("should respond with correct predictions when classfiying using a custom model")
@@ -205,6 +213,137 @@ def test_custom_model_distribution_classification(authenticated_client):
     assert User.query.filter_by(id=TEST_USER_ID).first().names_classified == 2
 
 
+@pytest.mark.it("should only respond with the top-k ethnicities above the minimum confidence when doing distribution classification")
+def test_distribution_classification_with_top_k(authenticated_client):
+    response = authenticated_client.post(
+        "/classify-distribution",
+        json={
+            "modelName": USER_TO_MODEL["name"],
+            "names": ["peter schmidt", "Naoyuki Oi"],
+            "topK": 1,
+            "minConfidence": 0.0
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+    classification_result = json.loads(response.data)
+
+    InferenceDistributionResponseSchema(**classification_result)
+    assert response.status_code == 200
+    assert all(len(distribution) == 1 for distribution in classification_result.values())
+
+
+@pytest.mark.it("should fail to classify names with 'topK' or 'minConfidence', which only apply to distribution classification")
+def test_classification_with_top_k(authenticated_client):
+    for parameters, headers in [({"topK": 1}, {}), ({"minConfidence": 10.0}, {"Accept": "application/x-ndjson"})]:
+        response = authenticated_client.post(
+            "/classify",
+            json={"modelName": USER_TO_MODEL["name"], "names": ["peter schmidt"], **parameters},
+            headers={"Authorization": f"Bearer {authenticated_client.token}", **headers}
+        )
+
+        assert response.status_code == 400
+        assert json.loads(response.data)["errorCode"] == "UNSUPPORTED_PARAMETERS"
+
+    assert User.query.filter_by(id=TEST_USER_ID).first().request_count == 0
+
+
+@pytest.mark.it("should respond with the classes once and the results of all names in input order when using the columnar format")
+def test_columnar_classification(authenticated_client):
+    names = ["peter schmidt", "Naoyuki Oi", "peter schmidt"]
+    response = authenticated_client.post(
+        "/classify",
+        json={
+            "modelName": USER_TO_MODEL["name"],
+            "names": names,
+            "format": "columnar"
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+    classification_result = json.loads(response.data)
+
+    ColumnarInferenceResponseSchema(**classification_result)
+    assert response.status_code == 200
+    assert classification_result["classes"] == CUSTOM_MODEL["nationalities"]
+    assert classification_result["names"] == names
+    assert len(classification_result["predictions"]) == len(classification_result["confidences"]) == len(names)
+
+
+@pytest.mark.it("should respond with a confidence matrix in input order when doing distribution classification in the columnar format")
+def test_columnar_distribution_classification(authenticated_client):
+    names = ["peter schmidt", "Naoyuki Oi", "peter schmidt"]
+    response = authenticated_client.post(
+        "/classify-distribution",
+        json={
+            "modelName": USER_TO_MODEL["name"],
+            "names": names,
+            "format": "columnar"
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+    classification_result = json.loads(response.data)
+
+    ColumnarInferenceDistributionResponseSchema(**classification_result)
+    assert response.status_code == 200
+    assert classification_result["names"] == names
+    assert all(len(confidences) == len(CUSTOM_MODEL["nationalities"]) for confidences in classification_result["confidences"])
+    assert classification_result["confidences"][0] == classification_result["confidences"][2]
+
+
+@pytest.mark.it("should stream one line per name and charge the quota after the stream when requesting NDJSON")
+def test_ndjson_classification(authenticated_client):
+    names = ["peter schmidt", "Naoyuki Oi", "peter schmidt"]
+    response = authenticated_client.post(
+        "/classify",
+        json={
+            "modelName": USER_TO_MODEL["name"],
+            "names": names
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}", "Accept": "application/x-ndjson"}
+    )
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert [list(line.keys())[0] for line in lines] == names
+    for line in lines:
+        InferenceResponseSchema(**line)
+    assert UserQuota.query.filter_by(user_id=TEST_USER_ID).first().name_count == len(names)
+    assert User.query.filter_by(id=TEST_USER_ID).first().request_count == 1
+
+
+@pytest.mark.it("should respond with the uploaded CSV and appended prediction columns when classifying a CSV file")
+def test_csv_classification(authenticated_client):
+    csv_file = BytesIO(b'id,name\n1,peter schmidt\n2,"Oi, Naoyuki"\n3,cixin liu\n')
+    response = authenticated_client.post(
+        "/classify-csv",
+        data={"file": (csv_file, "names.csv"), "modelName": USER_TO_MODEL["name"], "column": "name"},
+        headers={"Authorization": f"Bearer {authenticated_client.token}"},
+        content_type="multipart/form-data"
+    )
+    rows = list(csv.reader(response.data.decode().splitlines()))
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert rows[0] == ["id", "name", "ethnicity", "confidence"]
+    assert [row[:2] for row in rows[1:]] == [["1", "peter schmidt"], ["2", "Oi, Naoyuki"], ["3", "cixin liu"]]
+    assert all(row[2] in CUSTOM_MODEL["nationalities"] for row in rows[1:])
+    assert UserQuota.query.filter_by(user_id=TEST_USER_ID).first().name_count == 3
+    assert User.query.filter_by(id=TEST_USER_ID).first().names_classified == 3
+
+
+@pytest.mark.it("should fail to classify a CSV file when the name column does not exist")
+def test_csv_classification_with_missing_column(authenticated_client):
+    response = authenticated_client.post(
+        "/classify-csv",
+        data={"file": (BytesIO(b"id,name\n1,peter schmidt\n"), "names.csv"), "modelName": USER_TO_MODEL["name"], "column": "full_name"},
+        headers={"Authorization": f"Bearer {authenticated_client.token}"},
+        content_type="multipart/form-data"
+    )
+
+    assert response.status_code == 422
+    assert json.loads(response.data)["errorCode"] == "COLUMN_NOT_FOUND"
+
+
 @pytest.mark.it("should respond with correct predictions when classfiying using a custom model which points to a default model with same classes")
 def test_custom_same_as_default_model_classification(authenticated_client):
     response = authenticated_client.post(
@@ -410,3 +549,81 @@ def test_classification_after_quota_resets(mock_daily_quota, authenticated_clien
     assert response.status_code == 200
     assert current_user_quota.name_count == second_request_name_amount
 
+
+@pytest.mark.it("should respond with predictions of every model and charge each name once per model when classifying with multiple models")
+def test_multi_model_classification(authenticated_client):
+    response = authenticated_client.post(
+        "/classify-multi",
+        json={
+            "modelNames": [USER_TO_MODEL["name"], DEFAULT_MODEL["public_name"]],
+            "names": ["peter schmidt", "Naoyuki Oi", "cixin liu"]
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+    classification_result = json.loads(response.data)
+
+    MultiInferenceResponseSchema(**classification_result)
+    assert response.status_code == 200
+    assert list(classification_result.keys()) == [USER_TO_MODEL["name"], DEFAULT_MODEL["public_name"]]
+    assert set(classification_result[USER_TO_MODEL["name"]].keys()) == {"peter schmidt", "Naoyuki Oi", "cixin liu"}
+    assert Model.query.filter_by(id=CUSTOM_MODEL["id"]).first().request_count == 1
+    assert Model.query.filter_by(id=DEFAULT_MODEL["id"]).first().request_count == 1
+    assert UserToModel.query.filter_by(user_id=TEST_USER_ID, name=USER_TO_MODEL["name"]).first().request_count == 1
+    assert User.query.filter_by(id=TEST_USER_ID).first().request_count == 1
+    assert User.query.filter_by(id=TEST_USER_ID).first().names_classified == 6
+    assert UserQuota.query.filter_by(user_id=TEST_USER_ID).first().name_count == 6
+
+
+@pytest.mark.it("should fail to do multi-model classification when the names of all models exceed the quota")
+def test_multi_model_classification_with_exceeded_quota(mock_daily_quota, authenticated_client):
+    response = authenticated_client.post(
+        "/classify-multi",
+        json={
+            "modelNames": [USER_TO_MODEL["name"], DEFAULT_MODEL["public_name"]],
+            "names": ["peter schmidt" for _ in range(mock_daily_quota // 2 + 1)]
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+
+    assert response.status_code == 405
+    assert json.loads(response.data)["errorCode"] == "QUOTA_EXCEEDED"
+
+
+@pytest.mark.it("should fail to do multi-model classification when the names of all models exceed the maximum amount of names")
+def test_multi_model_classification_with_too_many_names(mock_max_names, authenticated_client):
+    response = authenticated_client.post(
+        "/classify-multi",
+        json={
+            "modelNames": [USER_TO_MODEL["name"], DEFAULT_MODEL["public_name"]],
+            "names": ["peter schmidt" for _ in range(mock_max_names // 2 + 1)]
+        },
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+
+    assert response.status_code == 405
+    assert json.loads(response.data)["errorCode"] == "TOO_MANY_NAMES"
+
+
+@pytest.mark.it("should fail to do multi-model classification without any model")
+def test_multi_model_classification_without_models(authenticated_client):
+    response = authenticated_client.post(
+        "/classify-multi",
+        json={"modelNames": [], "names": ["peter schmidt"]},
+        headers={"Authorization": f"Bearer {authenticated_client.token}"}
+    )
+
+    assert response.status_code == 400
+    assert json.loads(response.data)["errorCode"] == "VALIDATION_ERROR"
+    assert User.query.filter_by(id=TEST_USER_ID).first().request_count == 0
+
+
+@pytest.mark.it("should load all public and trained models into the model cache when preloading models")
+def test_preload_public_models(app_context):
+    # the preparation for forking the workers must not affect the rest of the test session
+    with patch("services.inference_services.gc.freeze"), \
+            patch("services.inference_services.db.engine.dispose"), \
+            patch("services.inference_services.S3Handler.reset"):
+        preload_public_models()
+
+    assert DEFAULT_MODEL["id"] in model_cache
+    assert CUSTOM_MODEL["id"] not in model_cache
@@ -0,0 +1,273 @@
+import datetime
+from io import BytesIO
+from unittest.mock import patch
+from flask import current_app
+from flask_jwt_extended import create_access_token
+import pytest
+import json
+from sqlalchemy import text, update
+import torch
+from inference.inference_utils import model_cache, prediction_cache
+from inference.model import ConvLSTM
+from schemas.job_schema import JobResponseSchema
+from s3 import S3Handler, bucket_config
+from services.job_services import claim_job, delete_expired_jobs, get_chunk_key, process_job
+from utils import *
+from app import app
+from db.database import db
+from db.tables import AccessLevel, ClassificationJob, JobStatus, User, Model, UserQuota
+
+
+# Ensure this model configuration exist inside "models" bucket
+DEFAULT_MODEL = {
+    "public_name": "default-model",
+    "nationalities": sorted(set(["chinese", "else"])),
+    "accuracy": 98.5,
+    "scores": [98.0, 99.0],
+    "is_trained": True,
+    "is_grouped": False,
+    "is_public": True,
+    "id": "cf58c0536d2ab4fbd6a6",
+}
+
+TEST_USER = {
+    "name": "user",
+    "email": "user@test.com",
+    "role": "else",
+    "password": "StrongPassword123",
+    "consented": True,
+    "usage_description": "Lorem Ipsum" * 20,
+    "access": AccessLevel.FULL.value,
+    "verified": True
+}
+TEST_USER_ID = 1
+
+JOB_NAMES = ["peter schmidt", "Naoyuki Oi", "cixin liu", "Jules Verne", "peter schmidt"]
+JOB_CHUNK_SIZE = 2
+
+
+@pytest.fixture(scope="function")
+def app_context():
+    with app.app_context():
+        db.drop_all()
+        with open("./dev-infrastructure/db-seed/init.sql", "r") as file:
+            init_sql_script = file.read()
+            db.session.execute(text(init_sql_script))
+
+        db.session.add(Model(**DEFAULT_MODEL))
+        db.session.add(User(**TEST_USER))
+        db.session.commit()
+
+        with patch.dict(current_app.config, {"JOB_CHUNK_SIZE": JOB_CHUNK_SIZE}, clear=False):
+            yield app
+
+
+@pytest.fixture(scope="function")
+def authenticated_client(app_context):
+    client = app.test_client()
+    with app.test_request_context():
+        client.token = create_access_token(identity=TEST_USER_ID)
+    return client
+
+
+@pytest.fixture
+def mock_daily_quota(app_context):
+    daily_quota = 3
+    with patch.dict(current_app.config, {"DAILY_QUOTA": daily_quota}, clear=False):
+        yield daily_quota
+
+
+@pytest.fixture(scope="function", autouse=True)
+def mock_base_model_config():
+    with patch("inference.inference.load_model_config") as mock_config:
+        mock_config.return_value = load_json("./tests/mock/model_config.json")
+        yield mock_config
+
+
+@pytest.fixture(autouse=True)
+def mock_get_model_checkpoint():
+    model_config = load_json("./tests/mock/model_config.json")
+
+    def mock_checkpoint(model_id, etag=None):
+        dummy_model = ConvLSTM(
+            class_amount=len(DEFAULT_MODEL["nationalities"]),
+            embedding_size=model_config["embedding-size"],
+            hidden_size=model_config["hidden-size"],
+            layers=model_config["rnn-layers"],
+            kernel_size=model_config["kernel-size"],
+            cnn_out_dim=model_config["cnn-out-dim"]
+        )
+        buffer = BytesIO()
+        torch.save(dummy_model.state_dict(), buffer)
+        buffer.seek(0)
+        return torch.load(buffer)
+
+    model_cache.clear()
+    prediction_cache.clear()
+    with patch("inference.inference.get_model_checkpoint", side_effect=mock_checkpoint):
+        with patch("inference.inference.get_model_etag", return_value="mock-etag"):
+            yield
+
+
+def submit_job(client, names: list[str] = JOB_NAMES) -> dict:
+    response = client.post(
+        "/jobs",
+        json={"modelName": DEFAULT_MODEL["public_name"], "names": names},
+        headers={"Authorization": f"Bearer {client.token}"}
+    )
+    assert response.status_code == 202
+    return json.loads(response.data)
+
+
+@pytest.mark.it("should queue a job with one chunk per 'JOB_CHUNK_SIZE' names when submitting a job")
+def test_submit_job(authenticated_client):
+    job_data = submit_job(authenticated_client)
+
+    JobResponseSchema(**job_data)
+    assert job_data["status"] == JobStatus.QUEUED.value
+    assert job_data["nameAmount"] == len(JOB_NAMES)
+    assert job_data["chunkAmount"] == 3
+    assert job_data["progress"] == 0.0
+
+
+@pytest.mark.it("should queue a job with the names of the given column when submitting a job as CSV file")
+def test_submit_job_file(authenticated_client):
+    csv_file = "id;name\n" + "".join(f"{idx};{name}\n" for idx, name in enumerate(JOB_NAMES))
+    response = authenticated_client.post(
+        "/jobs",
+        data={"file": (BytesIO(csv_file.encode()), "names.csv"), "modelName": DEFAULT_MODEL["public_name"], "column": "name", "delimiter": ";"},
+        headers={"Authorization": f"Bearer {authenticated_client.token}"},
+        content_type="multipart/form-data"
+    )
+    job_data = json.loads(response.data)
+
+    assert response.status_code == 202
+    assert job_data["nameAmount"] == len(JOB_NAMES)
+    assert job_data["chunkAmount"] == 3
+    assert S3Handler.get(bucket_config.job_bucket, get_chunk_key(job_data["jobId"], "input", 2)) == JOB_NAMES[4:]
+
+
+@pytest.mark.it("should fail to submit a job with too many names or a too large request without storing any chunk")
+def test_submit_too_large_job(authenticated_client):
+    with patch.dict(current_app.config, {"MAX_JOB_NAMES": len(JOB_NAMES) - 1}, clear=False):
+        response = authenticated_client.post(
+            "/jobs",
+            json={"modelName": DEFAULT_MODEL["public_name"], "names": JOB_NAMES},
+            headers={"Authorization": f"Bearer {authenticated_client.token}"}
+        )
+    assert response.status_code == 405
+    assert json.loads(response.data)["errorCode"] == "TOO_MANY_NAMES"
+
+    with patch.dict(current_app.config, {"MAX_CONTENT_LENGTH": 64}, clear=False):
+        response = authenticated_client.post(
+            "/jobs",
+            json={"modelName": DEFAULT_MODEL["public_name"], "names": JOB_NAMES},
+            headers={"Authorization": f"Bearer {authenticated_client.token}"}
+        )
+    assert response.status_code == 413
+    assert json.loads(response.data)["errorCode"] == "REQUEST_TOO_LARGE"
+
+    assert ClassificationJob.query.count() == 0
+
+
+@pytest.mark.it("should complete a job, charge every name once and stream the results in input order when processing a job")
+def test_process_job(authenticated_client):
+    job_id = submit_job(authenticated_client)["jobId"]
+
+    assert claim_job() == job_id
+    process_job(job_id)
+
+    response = authenticated_client.get(f"/jobs/{job_id}", headers={"Authorization": f"Bearer {authenticated_client.token}"})
+    job_data = json.loads(response.data)
+    assert response.status_code == 200
+    assert job_data["status"] == JobStatus.COMPLETED.value
+    assert job_data["progress"] == 100.0
+
+    response = authenticated_client.get(f"/jobs/{job_id}/results", headers={"Authorization": f"Bearer {authenticated_client.token}"})
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert response.status_code == 200
+    assert [list(line.keys())[0] for line in lines] == JOB_NAMES
+
+    assert UserQuota.query.filter_by(user_id=TEST_USER_ID).first().name_count == len(JOB_NAMES)
+    assert User.query.filter_by(id=TEST_USER_ID).first().names_classified == len(JOB_NAMES)
+    assert User.query.filter_by(id=TEST_USER_ID).first().request_count == 1
+    assert claim_job() is None
+
+    assert not S3Handler.check_file_existence(bucket_config.job_bucket, get_chunk_key(job_id, "input", 0))
+
+
+@pytest.mark.it("should delete a failed job's chunks and delete finished jobs after their retention period")
+def test_delete_job_chunks(authenticated_client):
+    job_id = submit_job(authenticated_client)["jobId"]
+    assert claim_job() == job_id
+
+    with patch("services.job_services.inference.predict", side_effect=RuntimeError("Inference failed.")):
+        process_job(job_id)
+
+    assert ClassificationJob.query.get(job_id).status == JobStatus.FAILED.value
+    assert not S3Handler.check_file_existence(bucket_config.job_bucket, get_chunk_key(job_id, "input", 0))
+
+    assert delete_expired_jobs() == 0
+    db.session.execute(update(ClassificationJob).values(updated_time=datetime.datetime.utcnow() - datetime.timedelta(days=30)))
+    db.session.commit()
+    assert delete_expired_jobs() == 1
+    assert ClassificationJob.query.get(job_id) is None
+
+
+@pytest.mark.it("should complete a job whose chunks are larger than the maximum amount of names per request")
+def test_process_job_with_chunks_above_max_names(authenticated_client):
+    with patch.dict(current_app.config, {"MAX_NAMES": JOB_CHUNK_SIZE - 1}, clear=False):
+        job_id = submit_job(authenticated_client)["jobId"]
+
+        assert claim_job() == job_id
+        process_job(job_id)
+
+    assert ClassificationJob.query.get(job_id).status == JobStatus.COMPLETED.value
+
+
+@pytest.mark.it("should pause a job after the last chunk which fits into the daily quota and only charge the completed chunks")
+def test_process_job_with_exceeded_quota(mock_daily_quota, authenticated_client):
+    job_id = submit_job(authenticated_client)["jobId"]
+
+    assert claim_job() == job_id
+    process_job(job_id)
+
+    job = ClassificationJob.query.get(job_id)
+    assert job.status == JobStatus.PAUSED.value
+    assert job.completed_chunks == 1
+    assert UserQuota.query.filter_by(user_id=TEST_USER_ID).first().name_count == JOB_CHUNK_SIZE
+
+    # paused jobs are only resumed once the quota was reset on the next day
+    assert claim_job() is None
+
+    response = authenticated_client.get(f"/jobs/{job_id}/results", headers={"Authorization": f"Bearer {authenticated_client.token}"})
+    assert response.status_code == 409
+    assert json.loads(response.data)["errorCode"] == "JOB_NOT_COMPLETED"
+
+
+@pytest.mark.it("should neither complete nor charge a chunk when another worker reclaimed the job meanwhile")
+def test_process_job_with_lost_lease(authenticated_client):
+    job_id = submit_job(authenticated_client)["jobId"]
+    assert claim_job() == job_id
+
+    def reclaim_and_predict(names, **kwargs):
+        # eg. the lease expired while the chunk was classified and another worker claimed the job
+        db.session.execute(update(ClassificationJob).where(ClassificationJob.id == job_id).values(lease_token="other-worker"))
+        db.session.commit()
+        return ["else"] * len(names)
+
+    with patch("services.job_services.inference.predict", side_effect=reclaim_and_predict):
+        process_job(job_id)
+
+    job = ClassificationJob.query.get(job_id)
+    assert job.status == JobStatus.RUNNING.value
+    assert job.completed_chunks == 0
+    assert UserQuota.query.filter_by(user_id=TEST_USER_ID).first().name_count == 0
+
+
+@pytest.mark.it("should fail to get the status of a job which does not exist")
+def test_get_non_existing_job(authenticated_client):
+    response = authenticated_client.get("/jobs/does-not-exist", headers={"Authorization": f"Bearer {authenticated_client.token}"})
+
+    assert response.status_code == 404
+    assert json.loads(response.data)["errorCode"] == "JOB_DOES_NOT_EXIST"
@@ -0,0 +1,171 @@
+from io import BytesIO
+import json
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+import pytest
+from inference.inference_utils import load_model_config
+from s3 import S3Handler, S3ObjectCache, bucket_config
+
+
+class FakeS3Client:
+    def __init__(self, objects: dict[str, bytes]):
+        self.objects = objects
+        self.requests = []
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: str = None):
+        self.requests.append((Key, IfNoneMatch))
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+        etag = f'"{hash(self.objects[Key])}"'
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}}, "GetObject")
+        return {"Body": BytesIO(self.objects[Key]), "ETag": etag}
+
+    def put_object(self, Body: str, Bucket: str, Key: str):
+        self.objects[Key] = Body.encode()
+
+    def get_paginator(self, operation_name: str):
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket: str, Prefix: str):
+                return [{"Contents": [{"Key": key} for key in sorted(objects) if key.startswith(Prefix)]}]
+        return Paginator()
+
+    def delete_objects(self, Bucket: str, Delete: dict):
+        for obj in Delete["Objects"]:
+            self.objects.pop(obj["Key"], None)
+
+
+@pytest.fixture
+def s3_client(tmp_path):
+    client = FakeS3Client({"model-configs/base.json": json.dumps({"hidden-size": 6}).encode()})
+    handler = type("Handler", (), {"_client": client})
+
+    with patch.object(S3Handler, "instance", return_value=handler), \
+        patch("s3.s3_cache", S3ObjectCache(max_entries=8, disk_dir=str(tmp_path), disk_max_bytes=1024 ** 2)), \
+        patch.object(bucket_config, "base_data_bucket", "base-data"), \
+        patch.object(bucket_config, "base_data_cache_ttl_seconds", 60):
+        yield client
+
+
+@pytest.mark.it("should only fetch an object once and serve it from memory within the TTL of its bucket")
+def test_s3_cache_memory_hit(s3_client):
+    first = S3Handler.get("base-data", "model-configs/base.json")
+    second = S3Handler.get("base-data", "model-configs/base.json")
+
+    assert first == second == {"hidden-size": 6}
+    assert s3_client.requests == [("model-configs/base.json", None)]
+
+
+@pytest.mark.it("should serve objects from the disk tier when they are not cached in memory")
+def test_s3_cache_disk_hit(s3_client, tmp_path):
+    S3Handler.get("base-data", "model-configs/base.json")
+
+    # eg. another worker process of the same host
+    with patch("s3.s3_cache", S3ObjectCache(max_entries=8, disk_dir=str(tmp_path), disk_max_bytes=1024 ** 2)):
+        assert S3Handler.get("base-data", "model-configs/base.json") == {"hidden-size": 6}
+
+    assert len(s3_client.requests) == 1
+
+
+@pytest.mark.it("should revalidate expired objects with a conditional GET and only transfer them again when they changed")
+def test_s3_cache_revalidation(s3_client):
+    with patch.object(bucket_config, "base_data_cache_ttl_seconds", 1e-9):
+        first = S3Handler.get("base-data", "model-configs/base.json")
+        second = S3Handler.get("base-data", "model-configs/base.json")
+        s3_client.objects["model-configs/base.json"] = json.dumps({"hidden-size": 8}).encode()
+        third = S3Handler.get("base-data", "model-configs/base.json")
+
+    assert first == second == {"hidden-size": 6}
+    assert third == {"hidden-size": 8}
+    assert [if_none_match is not None for _, if_none_match in s3_client.requests] == [False, True, True]
+
+
+@pytest.mark.it("should not serve stale objects after uploading them and not cache buckets without a TTL")
+def test_s3_cache_invalidation(s3_client):
+    S3Handler.get("base-data", "model-configs/base.json")
+    S3Handler.upload("base-data", json.dumps({"hidden-size": 8}), "model-configs/base.json")
+    assert S3Handler.get("base-data", "model-configs/base.json") == {"hidden-size": 8}
+
+    s3_client.objects["chunk.json"] = b"[]"
+    S3Handler.get("jobs", "chunk.json")
+    S3Handler.get("jobs", "chunk.json")
+    assert s3_client.requests[-2:] == [("chunk.json", None), ("chunk.json", None)]
+
+
+@pytest.mark.it("should fetch several objects concurrently and return them in the requested order")
+def test_s3_get_many(s3_client):
+    s3_client.objects.update({f"chunk-{idx}.json": json.dumps([idx]).encode() for idx in range(20)})
+
+    chunks = S3Handler.get_many("jobs", [f"chunk-{idx}.json" for idx in range(20)] + ["missing.json"])
+
+    assert chunks == [[idx] for idx in range(20)] + [None]
+
+
+@pytest.mark.it("should upload objects concurrently while consuming them lazily and delete them by prefix")
+def test_s3_upload_many_and_delete_prefix(s3_client):
+    consumed = []
+
+    def objects():
+        for idx in range(50):
+            consumed.append(idx)
+            yield f"job/input/{idx}.json", json.dumps([idx])
+
+    assert S3Handler.upload_many("jobs", objects()) == 50
+    assert consumed == list(range(50))
+    assert S3Handler.get_many("jobs", [f"job/input/{idx}.json" for idx in range(50)]) == [[idx] for idx in range(50)]
+
+    S3Handler.delete_prefix("jobs", "job/")
+    assert list(s3_client.objects) == ["model-configs/base.json"]
+
+
+@pytest.mark.it("should create the client with the configured connection pool, timeouts and retries")
+def test_s3_client_config():
+    with patch.object(bucket_config, "max_pool_connections", 64), patch.object(bucket_config, "retry_mode", "adaptive"):
+        client = object.__new__(S3Handler)
+        client._init_client()
+
+    assert client._client.meta.config.max_pool_connections == 64
+    assert client._client.meta.config.connect_timeout == bucket_config.connect_timeout_seconds
+    assert client._client.meta.config.retries["mode"] == "adaptive"
+
+
+@pytest.mark.it("should still serve objects when the disk tier fails")
+def test_s3_cache_disk_failure(s3_client, tmp_path):
+    with patch("s3.os.replace", side_effect=OSError("No space left on device")):
+        assert S3Handler.get("base-data", "model-configs/base.json") == {"hidden-size": 6}
+
+    with patch("s3.s3_cache", S3ObjectCache(max_entries=8, disk_dir=str(tmp_path), disk_max_bytes=1024 ** 2)), \
+            patch("builtins.open", side_effect=PermissionError("Permission denied")):
+        assert S3Handler.get("base-data", "model-configs/base.json") == {"hidden-size": 6}
+
+    assert len(s3_client.requests) == 2
+
+
+@pytest.mark.it("should skip the disk tier when its directory is not private to the current user")
+def test_s3_cache_disk_not_private(s3_client, tmp_path):
+    disk_dir = tmp_path / "shared"
+    disk_dir.mkdir(mode=0o777)
+    disk_dir.chmod(0o777)
+
+    with patch("s3.s3_cache", S3ObjectCache(max_entries=8, disk_dir=str(disk_dir), disk_max_bytes=1024 ** 2)):
+        assert S3Handler.get("base-data", "model-configs/base.json") == {"hidden-size": 6}
+    assert list(disk_dir.iterdir()) == []
+
+    private_dir = tmp_path / "private"
+    with patch("s3.s3_cache", S3ObjectCache(max_entries=8, disk_dir=str(private_dir), disk_max_bytes=1024 ** 2)):
+        S3Handler.get("base-data", "model-configs/base.json")
+    assert private_dir.stat().st_mode & 0o777 == 0o700
+
+
+@pytest.mark.it("should keep the base model configuration in memory and revalidate it after the TTL of the base data bucket")
+def test_load_model_config(s3_client):
+    with patch.object(bucket_config, "base_model", "base"):
+        with patch.object(bucket_config, "base_data_cache_ttl_seconds", 1e-9):
+            assert load_model_config() == load_model_config() == {"hidden-size": 6}
+        assert [if_none_match is not None for _, if_none_match in s3_client.requests] == [False, True]
+
+        assert load_model_config() == load_model_config() == {"hidden-size": 6}
+        assert len(s3_client.requests) == 2
@@ -1,5 +1,7 @@
+from unittest.mock import patch
 import pytest
 import json
+from pydantic import BaseModel, ValidationError
 from utils import *
 from app import app
 
@@ -56,6 +58,90 @@ def test_success_response(app_context):
         assert str(e), "Provide a success message and/or a response body."
 
 
+@pytest.mark.it("should keep the key order of the data when returning a JSON response")
+def test_json_response(app_context):
+    response = json_response({"werner heisenberg": ["german", 91.2], "Cixin Liu": ["chinese", 87.0]})
+
+    assert response.mimetype == "application/json"
+    assert response.status_code == 200
+    assert list(json.loads(response.data).keys()) == ["werner heisenberg", "Cixin Liu"]
+
+
+@pytest.mark.it("should only validate server-generated response data in testing mode or when enabled")
+def test_validate_response(app_context):
+    class ResponseSchema(BaseModel):
+        value: int
+
+    with pytest.raises(ValidationError):
+        validate_response(ResponseSchema, {"value": "not a number"})
+
+    with patch.dict(app.config, {"TESTING": False, "VALIDATE_RESPONSES": False}):
+        validate_response(ResponseSchema, {"value": "not a number"})
+
+
+@pytest.mark.it("should stream one JSON line per item and end with an error line when the stream fails when returning an NDJSON response")
+def test_ndjson_response(app_context):
+    def chunks():
+        yield [{"a": 1}, {"b": 2}]
+        yield [{"c": 3}]
+        raise RuntimeError("Stream failed.")
+
+    with app.test_request_context():
+        response = ndjson_response(chunks())
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.mimetype == "application/x-ndjson"
+    assert lines == [{"a": 1}, {"b": 2}, {"c": 3}, {"errorCode": "UNEXPECTED_ERROR", "message": "An unexpected error occurred."}]
+
+
+@pytest.mark.it("should stream all rows as CSV attachment when returning a CSV response")
+def test_csv_response(app_context):
+    chunks = [[["name", "ethnicity"], ["Cixin Liu", "chinese"]], [["Verne, Jules", "french"]]]
+
+    with app.test_request_context():
+        response = csv_response(iter(chunks), filename="names-classified.csv")
+        data = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/csv"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="names-classified.csv"'
+    assert data.splitlines() == ["name,ethnicity", "Cixin Liu,chinese", '"Verne, Jules",french']
+
+
+@pytest.mark.it("should end the stream with an error row when streaming a CSV response fails")
+def test_csv_response_error(app_context):
+    def chunks():
+        yield [["name", "ethnicity"], ["Cixin Liu", "chinese"]]
+        raise RuntimeError("Stream failed.")
+
+    with app.test_request_context():
+        response = csv_response(chunks(), filename="names-classified.csv")
+        data = response.get_data(as_text=True)
+
+    assert data.splitlines() == ["name,ethnicity", "Cixin Liu,chinese", "#ERROR,UNEXPECTED_ERROR,An unexpected error occurred."]
+
+
+@pytest.mark.it("should split an iterable lazily into chunks of equal size when chunking")
+def test_iter_chunks():
+    assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_chunks([], 2)) == []
+
+
+@pytest.mark.it("should only replace the file once it is completely written when writing atomically")
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / "artifact.pt")
+    with atomic_write(path) as file:
+        file.write(b"first")
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as file:
+            file.write(b"second")
+            raise RuntimeError("Write failed.")
+
+    with open(path, "rb") as file:
+        assert file.read() == b"first"
+    assert [path.name for path in tmp_path.iterdir()] == ["artifact.pt"]
+
+
 @pytest.mark.it("should convert a string to snake-case when calling appropiate function")
 def test_to_snake_case():
     camel_case_str = "aTestString"